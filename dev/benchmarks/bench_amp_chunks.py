@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+"""Throughput of large AMP method calls over a UNIX socket.
+
+Sends C{send_message} calls carrying a message of about 600KB, like the
+package reporter does on hosts with many packages, from a client to a
+server connected through a UNIX socket. The arguments of such calls are
+split in many L{MethodCallChunk}s. The current sender, which sends views
+of the arguments as chunks without waiting for each chunk to be
+acknowledged, is compared with the one it replaced, which copied each
+chunk and sent it only after the previous one was acknowledged. The
+receivers differ too: the current one copies chunks into a buffer
+allocated upfront, the one it replaced joined them at the end.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_amp_chunks.py
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks
+from twisted.internet.protocol import ClientCreator
+from twisted.protocols.amp import AMP
+from twisted.python.compat import xrange
+
+from landscape.lib import bpickle
+from landscape.lib.amp import (
+    MethodCall, MethodCallChunk, MethodCallClientProtocol,
+    MethodCallReceiver, MethodCallSender, MethodCallServerFactory)
+
+
+CALLS = 20
+PACKAGES = 2000
+
+
+class Broker(object):
+
+    def send_message(self, message, session_id, urgent=False):
+        return len(message["packages"])
+
+
+class JoinedChunks(list):
+    """The chunks of the arguments of a call, joined when complete."""
+
+    def getvalue(self):
+        return b"".join(self)
+
+
+class LegacyMethodCallReceiver(MethodCallReceiver):
+    """The receiver used before, joining the chunks at the end."""
+
+    @MethodCallChunk.responder
+    def receive_method_call_chunk(self, sequence, chunk, size=None):
+        self._pending_chunks.setdefault(sequence, JoinedChunks()).append(chunk)
+        return {"result": sequence}
+
+
+class LegacyMethodCallServerProtocol(AMP):
+
+    def __init__(self, obj, methods):
+        AMP.__init__(self, locator=LegacyMethodCallReceiver(obj, methods))
+
+
+class LegacyMethodCallServerFactory(MethodCallServerFactory):
+
+    protocol = LegacyMethodCallServerProtocol
+
+
+class LegacyMethodCallSender(MethodCallSender):
+    """The sender used before, copying chunks and sending them in turn."""
+
+    def send_method_call(self, method, args=[], kwargs={}):
+        arguments = bpickle.dumps((args, kwargs))
+        sequence = 0
+        method = method.encode("utf-8")
+        chunks = [arguments[i:i + self._chunk_size]
+                  for i in xrange(0, len(arguments), self._chunk_size)]
+        result = Deferred()
+        for chunk in chunks[:-1]:
+
+            def create_send_chunk(sequence, chunk):
+                return (lambda x: self._protocol.callRemote(
+                    MethodCallChunk, sequence=sequence, chunk=chunk))
+
+            result.addCallback(create_send_chunk(sequence, chunk))
+
+        def send_last_chunk(ignored):
+            return self._call_remote_with_timeout(
+                MethodCall, sequence=sequence, method=method,
+                arguments=chunks[-1])
+
+        result.addCallback(send_last_chunk)
+        result.addCallback(lambda response: response["result"])
+        result.callback(None)
+        return result
+
+
+@inlineCallbacks
+def bench(label, path, sender_class, message, repeat=3):
+    protocol = yield ClientCreator(
+        reactor, MethodCallClientProtocol).connectUNIX(path)
+    sender = sender_class(protocol, reactor)
+    size = len(bpickle.dumps(message))
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for j in range(CALLS):
+            result = yield sender.send_method_call(
+                "send_message", args=[message, None])
+            assert result == PACKAGES
+        seconds = time.time() - start
+        best = seconds if best is None else min(best, seconds)
+    protocol.transport.loseConnection()
+    print("%-40s %8.2f MB/s" % (label, CALLS * size / best / 1e6))
+    return best
+
+
+@inlineCallbacks
+def run(directory):
+    description = u"A package description, as long as they usually are. " * 4
+    message = {"type": "add-packages", "packages": [
+        {"name": u"package-%d" % i, "version": u"1.0-%d" % i,
+         "summary": u"A package", "description": description}
+        for i in range(PACKAGES)]}
+    legacy_path = os.path.join(directory, "legacy.sock")
+    current_path = os.path.join(directory, "current.sock")
+    ports = [
+        reactor.listenUNIX(legacy_path, LegacyMethodCallServerFactory(
+            Broker(), ["send_message"])),
+        reactor.listenUNIX(current_path, MethodCallServerFactory(
+            Broker(), ["send_message"]))]
+    try:
+        print("%d calls of %d bytes:" % (
+            CALLS, len(bpickle.dumps(message))))
+        old = yield bench("  copied chunks, one at a time", legacy_path,
+                          LegacyMethodCallSender, message)
+        new = yield bench("  views, pipelined", current_path,
+                          MethodCallSender, message)
+        print("  %-38s %8.2fx" % ("speedup", old / new))
+    finally:
+        for port in ports:
+            yield port.stopListening()
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    deferred = run(directory)
+    deferred.addErrback(lambda failure: failure.printTraceback())
+    deferred.addBoth(lambda ignored: reactor.stop())
+    reactor.run()
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
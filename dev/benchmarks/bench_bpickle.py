@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+"""Round-trip benchmark of the bpickle codec.
+
+Compares L{bpickle.dumps} and L{bpickle.loads} with the per-type functions
+of C{dumps_table} and C{loads_table}, on a payload shaped like a large
+exchange of package and process messages.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_bpickle.py
+"""
+import io
+import timeit
+
+from landscape.lib import bpickle
+
+
+def make_payload(messages=100, items=1000):
+    process = {"pid": 1234, "name": u"python3", "state": b"R",
+               "start-time": 1570000000, "percent-cpu": 0.5,
+               "vm-size": 123456, "uid": 0, "gid": 0}
+    message_list = []
+    for i in range(messages):
+        if i % 2:
+            message_list.append({
+                "type": "packages", "api": b"3.3", "timestamp": i,
+                "available": [(j, j + 10) for j in range(items)],
+                "installed": list(range(items))})
+        else:
+            message_list.append({
+                "type": "active-process-info", "api": b"3.3",
+                "timestamp": i, "kill-all-processes": True,
+                "add-processes": [dict(process, pid=j)
+                                  for j in range(items // 10)]})
+    return {"server-api": b"3.3", "client-api": b"3.3", "sequence": 42,
+            "accepted-types": b"\x00" * 16, "messages": message_list,
+            "total-messages": messages, "next-expected-sequence": 7}
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=10)) / number
+    print("%-32s %8.2f ms" % (label, seconds * 1000))
+    return seconds
+
+
+def main():
+    payload = make_payload()
+    data = bpickle.dumps(payload)
+    assert data == bpickle._table_dumps(payload)
+    print("Payload size: %d bytes" % len(data))
+
+    old = bench("dumps (per-type functions)",
+                lambda: bpickle._table_dumps(payload), 2)
+    new = bench("dumps", lambda: bpickle.dumps(payload), 2)
+    print("%-32s %8.2fx" % ("dumps speedup", old / new))
+
+    old = bench("loads (per-type functions)",
+                lambda: bpickle._table_loads(data, as_is=True), 2)
+    new = bench("loads", lambda: bpickle.loads(data, as_is=True), 2)
+    print("%-32s %8.2fx" % ("loads speedup", old / new))
+
+    bench("loads (memoryview)",
+          lambda: bpickle.loads(memoryview(data), as_is=True), 2)
+    bench("load (file, 64KiB chunks)",
+          lambda: bpickle.load(io.BytesIO(data), as_is=True), 2)
+
+
+if __name__ == "__main__":
+    main()
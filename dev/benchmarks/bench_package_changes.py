@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+"""Resolution of a 500-package change-packages request on a synthetic cache.
+
+The cache has 5000 installed packages with an upgrade available for each,
+plus 5000 packages which aren't installed, in a facade rooted in a
+temporary directory like the one the facade tests use. The request
+installs 250 of the packages and upgrades 250 others, and is resolved the
+way the package changer does it, but without committing anything. The
+facade's name and installed indexes are compared with the linear scans
+over all the versions it used before.
+
+This needs python-apt. Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_package_changes.py
+"""
+import os
+import shutil
+import tempfile
+import timeit
+import types
+
+from landscape.lib.apt.package.testing import AptFacadeHelper
+
+
+INSTALLED = 5000
+AVAILABLE = 5000
+REQUEST = 500
+
+
+class Setup(object):
+    """Just enough of a test case for L{AptFacadeHelper}."""
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def makeDir(self):
+        return tempfile.mkdtemp(dir=self._directory)
+
+
+def legacy_get_packages_by_name(self, name):
+    return [
+        version for version in self.get_packages()
+        if version.package.name == name]
+
+
+def legacy_get_locked_packages(self):
+    return [
+        version for version in self.get_packages()
+        if (self.is_package_installed(version) and
+            self._is_package_held(version.package))]
+
+
+def legacy_get_broken_packages(self):
+    return set(
+        version.package for version in self.get_packages()
+        if self._is_package_broken(version.package))
+
+
+def use_linear_scans(facade):
+    facade.get_packages_by_name = types.MethodType(
+        legacy_get_packages_by_name, facade)
+    facade.get_locked_packages = types.MethodType(
+        legacy_get_locked_packages, facade)
+    facade._get_broken_packages = types.MethodType(
+        legacy_get_broken_packages, facade)
+
+
+def stanza(name, version, status=None):
+    lines = ["Package: %s" % name]
+    if status is not None:
+        lines.append("Status: %s" % status)
+    lines.extend(["Priority: optional",
+                  "Section: misc",
+                  "Installed-Size: 1234",
+                  "Maintainer: Someone",
+                  "Architecture: all",
+                  "Version: %s" % version,
+                  "Description: short description",
+                  " description"])
+    return "\n".join(lines) + "\n\n"
+
+
+def make_facade(directory):
+    setup = Setup(directory)
+    helper = AptFacadeHelper()
+    helper.set_up(setup)
+    # The helper's _add_* methods rewrite the whole index on each call,
+    # which takes too long for this many packages.
+    with open(helper.dpkg_status, "w") as status:
+        for i in range(INSTALLED):
+            status.write(stanza("installed%d" % i, "1.0",
+                                status="install ok installed"))
+    deb_dir = setup.makeDir()
+    with open(os.path.join(deb_dir, "Packages"), "w") as packages:
+        for i in range(INSTALLED):
+            packages.write(stanza("installed%d" % i, "2.0"))
+        for i in range(AVAILABLE):
+            packages.write(stanza("available%d" % i, "1.0"))
+    setup.facade.add_channel_apt_deb(
+        "file://%s" % deb_dir, "./", trusted=True)
+    setup.facade.reload_channels()
+    return setup.facade
+
+
+def change_packages(facade):
+    """Resolve the request, as L{PackageChanger.handle_change_packages}."""
+    facade.reset_marks()
+    for i in range(REQUEST // 2):
+        [version] = facade.get_packages_by_name("available%d" % i)
+        facade.mark_install(version)
+        old, new = sorted(facade.get_packages_by_name("installed%d" % i))
+        facade.mark_install(new)
+        facade.mark_remove(old)
+    facade.get_package_holds()
+    version_changes = facade._preprocess_package_changes()
+    facade._check_changes(version_changes)
+
+
+def bench(label, func, number=1, repeat=3):
+    seconds = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("%-40s %8.2f ms" % (label, seconds * 1000))
+    return seconds
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        facade = make_facade(directory)
+        print("%d versions, %d changes:"
+              % (len(list(facade.get_packages())), REQUEST))
+        new = bench("  indexes", lambda: change_packages(facade))
+        use_linear_scans(facade)
+        old = bench("  linear scans", lambda: change_packages(facade))
+        print("  %-38s %8.2fx" % ("speedup", old / new))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""Hash to id resolution for a synthetic cache of 100k package versions.
+
+Compares resolving every package hash with L{PackageStore.get_hash_id}, as
+the reporter used to do, with the batched L{PackageStore.get_hash_id_map},
+both with and without a lookaside hash=>id database attached.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_package_ids.py
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import timeit
+
+from landscape.lib.apt.package.store import HashIdStore, PackageStore
+
+
+PACKAGES = 100000
+
+
+def make_hashes(count):
+    return [hashlib.sha1(("package-%d" % i).encode("ascii")).digest()
+            for i in range(count)]
+
+
+def bench(label, func, number=1, repeat=3):
+    seconds = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("%-40s %8.2f ms" % (label, seconds * 1000))
+    return seconds
+
+
+def compare(store, hashes):
+    def per_row():
+        return {hash: store.get_hash_id(hash) for hash in hashes}
+
+    expected = {hash: id for hash, id in per_row().items() if id is not None}
+    assert expected == store.get_hash_id_map(hashes)
+    old = bench("  get_hash_id per package", per_row)
+    new = bench("  get_hash_id_map", lambda: store.get_hash_id_map(hashes))
+    print("  %-38s %8.2fx" % ("speedup", old / new))
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        hashes = make_hashes(PACKAGES)
+        # A few hashes the server doesn't know about yet.
+        known = {hash: i + 1 for i, hash in enumerate(hashes[:-100])}
+
+        store = PackageStore(os.path.join(directory, "package.database"))
+        store.set_hash_ids(known)
+        print("%d packages, main database only:" % PACKAGES)
+        compare(store, hashes)
+
+        lookaside = HashIdStore(os.path.join(directory, "hash-id.database"))
+        lookaside.set_hash_ids(
+            {hash: id for hash, id in known.items() if id % 10})
+        store = PackageStore(os.path.join(directory, "package.database"))
+        store.add_hash_id_db(os.path.join(directory, "hash-id.database"))
+        print("%d packages, with a lookaside database:" % PACKAGES)
+        compare(store, hashes)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
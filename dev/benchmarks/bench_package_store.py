@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+"""Bulk writes to the L{PackageStore} tables, seeding 200k package ids.
+
+Compares the store's bulk helpers (C{executemany} on a write-ahead logged
+database) with the statement-per-id inserts and the single C{IN (...)}
+delete the store used before, run on a database with the default journal.
+The last case shows the cost of commits, with many small transactions.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_package_store.py
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from landscape.lib.apt.package.store import (
+    PackageStore, ensure_hash_id_schema, ensure_package_schema)
+
+
+IDS = 200000
+
+
+def legacy_store(filename):
+    db = sqlite3.connect(filename)
+    ensure_hash_id_schema(db)
+    ensure_package_schema(db)
+    return db
+
+
+def legacy_set_hash_ids(db, hash_ids):
+    cursor = db.cursor()
+    for hash, id in hash_ids.items():
+        cursor.execute("REPLACE INTO hash VALUES (?, ?)",
+                       (id, sqlite3.Binary(hash)))
+    cursor.close()
+    db.commit()
+
+
+def legacy_add_available(db, ids):
+    cursor = db.cursor()
+    for id in ids:
+        cursor.execute("REPLACE INTO available VALUES (?)", (id,))
+    cursor.close()
+    db.commit()
+
+
+def legacy_remove_available(db, ids):
+    cursor = db.cursor()
+    id_list = ",".join(str(int(id)) for id in ids)
+    cursor.execute("DELETE FROM available WHERE id IN (%s)" % id_list)
+    cursor.close()
+    db.commit()
+
+
+def legacy_add_available_one_by_one(db, ids):
+    for id in ids:
+        legacy_add_available(db, [id])
+
+
+def add_available_one_by_one(store, ids):
+    for id in ids:
+        store.add_available([id])
+
+
+def bench(label, legacy, new, argument, directory, repeat=3):
+    """Time a legacy and a new operation, each on a fresh database."""
+    old_times = []
+    new_times = []
+    for i in range(repeat):
+        db = legacy_store(os.path.join(directory, "legacy-%s-%d" % (label, i)))
+        db.execute("DELETE FROM available")
+        db.commit()
+        started = time.time()
+        legacy(db, argument)
+        old_times.append(time.time() - started)
+
+        store = PackageStore(os.path.join(directory, "new-%s-%d" % (label, i)))
+        store.clear_available()
+        started = time.time()
+        new(store, argument)
+        new_times.append(time.time() - started)
+    old = min(old_times)
+    new = min(new_times)
+    print("  %-24s %8.2f ms -> %8.2f ms  (%.2fx)"
+          % (label, old * 1000, new * 1000, old / new))
+
+
+def main():
+    ids = list(range(1, IDS + 1))
+    hash_ids = {hashlib.sha1(str(id).encode("ascii")).digest(): id
+                for id in ids}
+
+    directory = tempfile.mkdtemp()
+    try:
+        print("%d ids:" % IDS)
+        bench("set_hash_ids", legacy_set_hash_ids,
+              PackageStore.set_hash_ids, hash_ids, directory)
+        bench("add_available", legacy_add_available,
+              PackageStore.add_available, ids, directory)
+        bench("add + remove_available",
+              lambda db, ids: (legacy_add_available(db, ids),
+                               legacy_remove_available(db, ids[::2])),
+              lambda store, ids: (store.add_available(ids),
+                                  store.remove_available(ids[::2])),
+              ids, directory)
+        print("1000 ids, one transaction each:")
+        bench("add_available", legacy_add_available_one_by_one,
+              add_available_one_by_one, ids[:1000], directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
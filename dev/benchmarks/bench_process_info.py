@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+"""A sweep of L{ProcessInformation} over a synthetic tree of 20000 processes.
+
+The tree mimics /proc, with the cmdline, status and stat files of each
+process laid out like the kernel writes them. The current scanner is
+compared with the one it replaced, which parsed status line by line, read
+files through text wrappers and read /proc/uptime again for each process.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_process_info.py
+"""
+import os
+import shutil
+import tempfile
+import timeit
+from datetime import timedelta
+
+from landscape.lib import sysstats
+from landscape.lib.process import ProcessInformation, calculate_pcpu
+from landscape.lib.timestamp import to_timestamp
+
+
+PROCESSES = 20000
+
+STATUS = """\
+Name:\t%(name)s
+Umask:\t0022
+State:\tS (sleeping)
+Tgid:\t%(pid)d
+Ngid:\t0
+Pid:\t%(pid)d
+PPid:\t1
+TracerPid:\t0
+Uid:\t1000\t1000\t1000\t1000
+Gid:\t1000\t1000\t1000\t1000
+FDSize:\t64
+Groups:\t4 24 27 30 46 120 131 1000
+NStgid:\t%(pid)d
+NSpid:\t%(pid)d
+NSpgid:\t%(pid)d
+NSsid:\t%(pid)d
+VmPeak:\t  240108 kB
+VmSize:\t  240108 kB
+VmLck:\t       0 kB
+VmPin:\t       0 kB
+VmHWM:\t    9064 kB
+VmRSS:\t    9064 kB
+RssAnon:\t    1456 kB
+RssFile:\t    7608 kB
+RssShmem:\t       0 kB
+VmData:\t    1968 kB
+VmStk:\t     132 kB
+VmExe:\t     884 kB
+VmLib:\t    6068 kB
+VmPTE:\t     100 kB
+VmSwap:\t       0 kB
+HugetlbPages:\t       0 kB
+CoreDumping:\t0
+THP_enabled:\t1
+Threads:\t3
+SigQ:\t0/62805
+SigPnd:\t0000000000000000
+ShdPnd:\t0000000000000000
+SigBlk:\t0000000000000000
+SigIgn:\t0000000000001000
+SigCgt:\t0000000180004a03
+CapInh:\t0000000000000000
+CapPrm:\t0000000000000000
+CapEff:\t0000000000000000
+CapBnd:\t000001ffffffffff
+CapAmb:\t0000000000000000
+NoNewPrivs:\t0
+Seccomp:\t0
+Seccomp_filters:\t0
+Speculation_Store_Bypass:\tthread vulnerable
+Cpus_allowed:\tf
+Cpus_allowed_list:\t0-3
+Mems_allowed:\t00000000,00000001
+Mems_allowed_list:\t0
+voluntary_ctxt_switches:\t1234
+nonvoluntary_ctxt_switches:\t56
+"""
+
+STAT = (
+    "%(pid)d (%(name)s) S 1 %(pid)d %(pid)d 0 -1 4194560 1581 0 0 0 "
+    "%(utime)d %(stime)d 0 0 20 0 3 0 %(start)d 245870592 2266 "
+    "18446744073709551615 1 1 0 0 0 0 0 4096 2563 0 0 0 17 2 0 0 0 0 0 "
+    "0 0 0 0 0 0 0 0\n")
+
+
+def make_proc_tree(directory):
+    for pid in range(1, PROCESSES + 1):
+        name = "process-%d" % (pid % 100)
+        process_dir = os.path.join(directory, str(pid))
+        os.mkdir(process_dir)
+        with open(os.path.join(process_dir, "cmdline"), "w") as f:
+            f.write("/usr/bin/%s\0--option\0value\0" % name)
+        with open(os.path.join(process_dir, "status"), "w") as f:
+            f.write(STATUS % {"pid": pid, "name": name})
+        with open(os.path.join(process_dir, "stat"), "w") as f:
+            f.write(STAT % {"pid": pid, "name": name, "utime": pid % 500,
+                            "stime": pid % 70, "start": 1000 + pid})
+    for name in ["uptime", "meminfo", "self", "sys"]:
+        os.mkdir(os.path.join(directory, name))
+
+
+class LegacyProcessInformation(ProcessInformation):
+    """The scanner L{ProcessInformation} used before."""
+
+    def get_all_process_info(self):
+        for filename in os.listdir(self._proc_dir):
+            try:
+                process_id = int(filename)
+            except ValueError:
+                continue
+            process_info = self.get_process_info(process_id)
+            if process_info:
+                yield process_info
+
+    def get_process_info(self, process_id):
+        cmd_line_name = ""
+        process_dir = os.path.join(self._proc_dir, str(process_id))
+        process_info = {"pid": process_id}
+
+        try:
+            with open(os.path.join(process_dir, "cmdline"), "r") as file:
+                cmd_line = file.readline()
+                cmd_line_name = os.path.basename(cmd_line.split("\0")[0])
+
+            with open(os.path.join(process_dir, "status"), "r") as file:
+                for line in file:
+                    parts = line.split(":", 1)
+                    if parts[0] == "Name":
+                        process_info["name"] = (cmd_line_name.strip() or
+                                                parts[1].strip())
+                    elif parts[0] == "State":
+                        state = parts[1].strip()
+                        if state == "T (tracing stop)":
+                            state = state.lower()
+                        process_info["state"] = state[0].encode("ascii")
+                    elif parts[0] == "Uid":
+                        value_parts = parts[1].split()
+                        process_info["uid"] = int(value_parts[0])
+                    elif parts[0] == "Gid":
+                        value_parts = parts[1].split()
+                        process_info["gid"] = int(value_parts[0])
+                    elif parts[0] == "VmSize":
+                        value_parts = parts[1].split()
+                        process_info["vm-size"] = int(value_parts[0])
+                        break
+
+            with open(os.path.join(process_dir, "stat"), "r") as file:
+                parts = file.read().split()
+                start_time = int(parts[21])
+                utime = int(parts[13])
+                stime = int(parts[14])
+                uptime = self._uptime or sysstats.get_uptime()
+                pcpu = calculate_pcpu(utime, stime, uptime,
+                                      start_time, self._jiffies_per_sec)
+                process_info["percent-cpu"] = pcpu
+                delta = timedelta(0, start_time // self._jiffies_per_sec)
+                process_info["start-time"] = to_timestamp(
+                    self._boot_time + delta)
+        except IOError:
+            return None
+        return process_info
+
+
+def bench(label, func, number=1, repeat=3):
+    seconds = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("%-40s %8.2f ms" % (label, seconds * 1000))
+    return seconds
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        make_proc_tree(directory)
+        # The real /proc/uptime, since the legacy scanner reads it again for
+        # each process.
+        legacy = LegacyProcessInformation(directory, jiffies=100,
+                                          boot_time=0)
+        current = ProcessInformation(directory, jiffies=100, boot_time=0)
+        expected = sorted(legacy.get_all_process_info(),
+                          key=lambda info: info["pid"])
+        result = sorted(current.get_all_process_info(),
+                        key=lambda info: info["pid"])
+        assert [dict(info, **{"percent-cpu": 0}) for info in expected] == [
+            dict(info, **{"percent-cpu": 0}) for info in result]
+
+        print("%d processes:" % PROCESSES)
+        old = bench("  line parser, uptime per process",
+                    lambda: list(legacy.get_all_process_info()))
+        new = bench("  single pass",
+                    lambda: list(current.get_all_process_info()))
+        print("  %-38s %8.2fx" % ("speedup", old / new))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+"""Event firing and handler registration on the reactor's event mixin.
+
+Fires an event with 10 handlers, the way the broker fires C{message} and
+C{exchange} events, with debug logging disabled as it is by default. The
+current dispatch, which iterates the sorted handler list without copying
+it and only formats handlers when debug logging is enabled, is compared
+with the one it replaced. Registering many handlers for one event type,
+which used to sort the whole list each time, is compared too.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_reactor_events.py
+"""
+import logging
+import timeit
+
+from landscape.lib.format import format_object
+from landscape.lib.reactor import EventHandlingReactorMixin, EventID
+
+
+HANDLERS = 10
+FIRES = 10000
+REGISTRATIONS = 2000
+
+
+class Reactor(EventHandlingReactorMixin):
+    """The event handling of L{EventHandlingReactorMixin} on its own."""
+
+
+class LegacyReactor(EventHandlingReactorMixin):
+    """The event handling the mixin did before."""
+
+    def call_on(self, event_type, handler, priority=0):
+        pair = (handler, priority)
+        handlers = self._event_handlers.setdefault(event_type, [])
+        handlers.append(pair)
+        handlers.sort(key=lambda pair: pair[1])
+        return EventID(event_type, pair)
+
+    def fire(self, event_type, *args, **kwargs):
+        logging.debug("Started firing %s.", event_type)
+        results = []
+        handlers = list(self._event_handlers.get(event_type, ()))
+        for handler, priority in handlers:
+            try:
+                logging.debug("Calling %s for %s with priority %d.",
+                              format_object(handler), event_type, priority)
+                results.append(handler(*args, **kwargs))
+            except Exception:
+                logging.exception("Error running event handler %s for "
+                                  "event type %r with args %r %r.",
+                                  format_object(handler), event_type,
+                                  args, kwargs)
+        logging.debug("Finished firing %s.", event_type)
+        return results
+
+
+def handler(message):
+    return message
+
+
+def fire(reactor):
+    for i in range(FIRES):
+        reactor.fire("message", i)
+
+
+def register(reactor_class):
+    reactor = reactor_class()
+    for i in range(REGISTRATIONS):
+        reactor.call_on("message", handler, priority=i % 7)
+
+
+def bench(label, func, number=1, repeat=3):
+    seconds = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("%-40s %8.2f ms" % (label, seconds * 1000))
+    return seconds
+
+
+def main():
+    logging.getLogger().setLevel(logging.INFO)
+    legacy = LegacyReactor()
+    current = Reactor()
+    for reactor in (legacy, current):
+        for i in range(HANDLERS):
+            reactor.call_on("message", handler, priority=i % 3)
+    assert legacy.fire("message", 1) == current.fire("message", 1)
+
+    print("%d fires, %d handlers:" % (FIRES, HANDLERS))
+    old = bench("  copy and format", lambda: fire(legacy))
+    new = bench("  no copy, lazy debug", lambda: fire(current))
+    print("  %-38s %8.2fx" % ("speedup", old / new))
+
+    print("%d registrations:" % REGISTRATIONS)
+    old = bench("  sort each time", lambda: register(LegacyReactor))
+    new = bench("  insert in order", lambda: register(Reactor))
+    print("  %-38s %8.2fx" % ("speedup", old / new))
+
+
+if __name__ == "__main__":
+    main()
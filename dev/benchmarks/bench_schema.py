@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""Coercion of large messages with their L{Message} schemas.
+
+Builds an C{active-process-info} message listing 20000 processes and a
+C{packages} message with 100000 package ids and ranges, like the ones the
+monitor and the package reporter send on big hosts. Message schemas are
+compiled when they're created, which is compared with walking the schema
+tree for each value, the way L{KeyDict.coerce} and the other C{coerce}
+methods still do.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_schema.py
+"""
+import timeit
+
+from landscape.lib.schema import KeyDict
+from landscape.message_schemas.server_bound import (
+    ACTIVE_PROCESS_INFO, PACKAGES)
+
+
+PROCESSES = 20000
+PACKAGE_IDS = 100000
+
+
+def make_active_process_info():
+    processes = [{"pid": pid, "name": u"process-%d" % (pid % 100),
+                  "state": b"S", "uid": 1000, "gid": 1000,
+                  "vm-size": 240108, "start-time": 1000 + pid,
+                  "percent-cpu": 0.5}
+                 for pid in range(PROCESSES)]
+    return {"type": "active-process-info", "kill-all-processes": True,
+            "add-processes": processes}
+
+
+def make_packages():
+    # Mostly single ids, with a range here and there.
+    ids = [(i, i + 5) if i % 10 == 0 else i for i in range(PACKAGE_IDS)]
+    return {"type": "packages", "installed": ids, "available": ids}
+
+
+def legacy_coerce(schema, message):
+    """Coerce C{message} walking the schema tree, like before."""
+    return KeyDict.coerce(schema, message)
+
+
+def bench(label, func, number=1, repeat=3):
+    seconds = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("%-40s %8.2f ms" % (label, seconds * 1000))
+    return seconds
+
+
+def main():
+    for label, schema, message in [
+            ("%d processes:" % PROCESSES, ACTIVE_PROCESS_INFO,
+             make_active_process_info()),
+            ("%d package ids, twice:" % PACKAGE_IDS, PACKAGES,
+             make_packages())]:
+        assert legacy_coerce(schema, message) == schema.coerce(message)
+        print(label)
+        old = bench("  schema tree walk",
+                    lambda: legacy_coerce(schema, message))
+        new = bench("  compiled", lambda: schema.coerce(message))
+        print("  %-38s %8.2fx" % ("speedup", old / new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""Per-exchange latency of L{HTTPTransport} against a local HTTPS server.
+
+Compares exchanges going through a L{CurlPool} which keeps the connection
+to the server open, with exchanges doing a new TCP and TLS handshake every
+time (a pool which never keeps handles around).
+
+The stand-in server uses a throwaway self-signed certificate, created with
+the C{openssl} command line tool.
+
+Run from the top of the tree with::
+
+    PYTHONPATH=. python3 dev/benchmarks/bench_transport.py
+"""
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import timeit
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from landscape.client.broker.transport import HTTPTransport
+from landscape.lib import bpickle
+from landscape.lib.fetch import CurlPool
+
+
+RESPONSE = bpickle.dumps({"next-expected-sequence": 1, "messages": []})
+
+
+class ExchangeHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_certificate(directory):
+    key = os.path.join(directory, "key.pem")
+    cert = os.path.join(directory, "cert.pem")
+    subprocess.check_call(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+         "-days", "1", "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost",
+         "-keyout", key, "-out", cert],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return key, cert
+
+
+def start_server(key, cert):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ExchangeHandler)
+    server.daemon_threads = True
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=10)) / number
+    print("%-32s %8.2f ms" % (label, seconds * 1000))
+    return seconds
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        key, cert = make_certificate(directory)
+        server = start_server(key, cert)
+        url = "https://localhost:%d/" % server.server_address[1]
+        payload = {"messages": [{"type": "test", "data": b"x" * 1000}]}
+
+        fresh = HTTPTransport(None, url, cert, pool=CurlPool(max_idle=-1))
+        pooled = HTTPTransport(None, url, cert)
+        old = bench("exchange (new connection)",
+                    lambda: fresh.exchange(payload), 20)
+        new = bench("exchange (pooled connection)",
+                    lambda: pooled.exchange(payload), 20)
+        print("%-32s %8.2fx" % ("speedup", old / new))
+        server.shutdown()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
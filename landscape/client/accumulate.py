@@ -87,6 +87,95 @@ class Accumulator(object):
         return step_data
 
 
+class BatchAccumulator(object):
+    """Accumulate the values of many keys at once, for the same timestamp.
+
+    The timestamps and accumulated values of all the keys are kept in a
+    single persist entry, as columns in tuples, which the persist neither
+    traverses nor copies. The step data is the same as what L{Accumulator}
+    would return for each key, and the state an L{Accumulator} persisted
+    for a key is picked up the first time the key is seen.
+
+    Keys which haven't been seen for more than a step are dropped, since
+    their accumulated values wouldn't be used anymore.
+
+    @param persist: The persist to keep the state in.
+    @param step_size: The step size, as for L{Accumulator}.
+    @param key: The persist key of the state of all the keys.
+    """
+
+    def __init__(self, persist, step_size, key):
+        self._persist = persist
+        self._step_size = step_size
+        self._key = key
+        self._keys = None
+        self._index = None
+
+    def _get_index(self, keys):
+        """Return a C{dict} mapping the C{keys} column to positions."""
+        if keys != self._keys:
+            self._index = dict((key, i) for i, key in enumerate(keys))
+            self._keys = keys
+        return self._index
+
+    def __call__(self, new_timestamp, items):
+        """Accumulate values for a sequence of keys.
+
+        @param new_timestamp: The timestamp of all the values.
+        @param items: A sequence of C{(key, value)} tuples.
+        @return: A C{list} with the step data of each item, in order.
+        """
+        keys, timestamps, values = self._persist.get(self._key, ((), (), ()))
+        index = self._get_index(keys)
+        keys = list(keys)
+        timestamps = list(timestamps)
+        values = list(values)
+        step_size = self._step_size
+        result = []
+        for key, new_value in items:
+            i = index.get(key)
+            if i is None:
+                previous_timestamp, accumulated_value = self._persist.get(
+                    key, (0, 0))
+                if self._persist.has(key):
+                    self._persist.remove(key)
+                # The index won't match the saved columns until they're
+                # saved, below.
+                self._keys = None
+                i = index[key] = len(keys)
+                keys.append(key)
+                timestamps.append(0)
+                values.append(0)
+            else:
+                previous_timestamp = timestamps[i]
+                accumulated_value = values[i]
+            accumulated_value, step_data = accumulate(
+                previous_timestamp, accumulated_value, new_timestamp,
+                new_value, step_size)
+            timestamps[i] = new_timestamp
+            values[i] = accumulated_value
+            result.append(step_data)
+
+        # accumulate() ignores the accumulated value of a key last seen
+        # two steps or more before, so there's no need to keep it.
+        oldest_step = new_timestamp // step_size - 1
+        if any(timestamp // step_size < oldest_step
+               for timestamp in timestamps):
+            kept = [i for i, timestamp in enumerate(timestamps)
+                    if timestamp // step_size >= oldest_step]
+            keys = [keys[i] for i in kept]
+            timestamps = [timestamps[i] for i in kept]
+            values = [values[i] for i in kept]
+            self._keys = None
+
+        keys = tuple(keys)
+        self._persist.set(self._key, (keys, tuple(timestamps), tuple(values)))
+        if self._keys is None and len(index) == len(keys):
+            # Only keys were added, the index matches the new columns.
+            self._keys = keys
+        return result
+
+
 def accumulate(previous_timestamp, accumulated_value,
                new_timestamp, new_value,
                step_size):
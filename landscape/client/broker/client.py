@@ -106,6 +106,10 @@ class BrokerClientPlugin(object):
             if self.run_immediately:
                 self._run_with_error_log()
             if self.run_interval is not None:
+                if self.client.reactor.scheduler.enabled:
+                    # The scheduler already spreads the runs of the hosts.
+                    self._start_loop()
+                    return
                 delay = (random.random() * self.run_interval *
                          self.client.config.stagger_launch)
                 debug("delaying start of %s for %d seconds",
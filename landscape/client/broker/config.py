@@ -32,6 +32,8 @@ class BrokerConfiguration(Configuration):
               - C{urgent_exchange_interval} (C{1*60})
               - C{http_proxy}
               - C{https_proxy}
+              - C{message_store_backend} (C{"files"})
+              - C{max_payload_size} (C{10*1024*1024})
         """
         parser = super(BrokerConfiguration, self).make_parser()
 
@@ -62,6 +64,15 @@ class BrokerConfiguration(Configuration):
         parser.add_option("--tags",
                           help="Comma separated list of tag names to be sent "
                                "to the server.")
+        parser.add_option("--message-store-backend", default="files",
+                          type="choice", choices=["files", "segments"],
+                          help="How to store queued messages: one file per "
+                               "message ('files') or append-only segment "
+                               "files ('segments').")
+        parser.add_option("--max-payload-size", default=10 * 1024 * 1024,
+                          type="int", metavar="BYTES",
+                          help="The maximum size in bytes of the messages "
+                               "sent in a single exchange.")
 
         return parser
 
@@ -376,7 +376,8 @@ class MessageExchange(object):
     _api = SERVER_API
 
     def __init__(self, reactor, store, transport, registration_info,
-                 exchange_store, config, max_messages=100):
+                 exchange_store, config, max_messages=100,
+                 max_payload_size=10 * 1024 * 1024):
         """
         @param reactor: The L{LandscapeReactor} used to fire events in response
             to messages received by the server.
@@ -388,6 +389,11 @@ class MessageExchange(object):
             the time interval between subsequent exchanges of non-urgent
             messages, and the time interval between subsequent exchanges
             of urgent messages.
+        @param max_messages: The maximum number of messages to include in a
+            single exchange.
+        @param max_payload_size: The maximum size in bytes of the serialized
+            messages included in a single exchange. A message bigger than
+            that is still sent, alone.
         """
         self._reactor = reactor
         self._message_store = store
@@ -397,6 +403,7 @@ class MessageExchange(object):
         self._exchange_interval = config.exchange_interval
         self._urgent_exchange_interval = config.urgent_exchange_interval
         self._max_messages = max_messages
+        self._max_payload_size = max_payload_size
         self._notification_id = None
         self._exchange_id = None
         self._exchanging = False
@@ -679,12 +686,13 @@ class MessageExchange(object):
         """Return a dict representing the complete exchange payload.
 
         The payload will contain all pending messages eligible for
-        delivery, up to a maximum of C{max_messages} as passed to
-        the L{__init__} method.
+        delivery, up to a maximum of C{max_messages} and C{max_payload_size}
+        as passed to the L{__init__} method.
         """
         store = self._message_store
         accepted_types_digest = self._hash_types(store.get_accepted_types())
-        messages = store.get_pending_messages(self._max_messages)
+        messages = store.get_pending_messages(
+            self._max_messages, max_bytes=self._max_payload_size)
         total_messages = store.count_pending_messages()
         if messages:
             # Each message is tagged with the API that the client was
@@ -794,8 +802,11 @@ class MessageExchange(object):
 
         message_store.commit()
 
+        # Handled messages are only logged one by one, and committed all
+        # together once the whole batch has been handled.
         sequence = message_store.get_server_sequence()
-        for message in result.get("messages", ()):
+        messages = result.get("messages", ())
+        for message in messages:
             # The wire format of the 'type' field is bytes, but our handlers
             # actually expect it to be a string. Some unit tests set it to
             # a regular string (since there is no difference between strings
@@ -804,7 +815,8 @@ class MessageExchange(object):
                 message["type"] = message["type"].decode("ascii")
             self.handle_message(message)
             sequence += 1
-            message_store.set_server_sequence(sequence)
+            message_store.log_server_sequence(sequence)
+        if messages:
             message_store.commit()
 
         if message_store.get_pending_messages(1):
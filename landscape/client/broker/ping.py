@@ -44,16 +44,20 @@ from twisted.python.failure import Failure
 from twisted.internet import defer
 
 from landscape.lib import bpickle
-from landscape.lib.fetch import fetch
+from landscape.lib.fetch import CurlPool
 from landscape.lib.log import log_failure
 
 
 class PingClient(object):
-    """An HTTP client which knows how to talk to the ping server."""
+    """An HTTP client which knows how to talk to the ping server.
+
+    By default pings are sent through a L{CurlPool}, so the connection to the
+    ping server is kept open between pings.
+    """
 
     def __init__(self, reactor, get_page=None):
         if get_page is None:
-            get_page = fetch
+            get_page = CurlPool().fetch
         self._reactor = reactor
         self.get_page = get_page
 
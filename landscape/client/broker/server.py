@@ -102,6 +102,7 @@ class BrokerServer(object):
                         self.message_type_acceptance_changed)
         reactor.call_on("server-uuid-changed", self.server_uuid_changed)
         reactor.call_on("package-data-changed", self.package_data_changed)
+        reactor.call_on("package-reporter-run", self.package_reporter_run)
         reactor.call_on("resynchronize-clients", self.resynchronize)
 
     @remote
@@ -340,6 +341,10 @@ class BrokerServer(object):
     def package_data_changed(self):
         """Fire a package-data-changed event in the reactor of each client."""
 
+    @event
+    def package_reporter_run(self):
+        """Fire a package-reporter-run event in the reactor of each client."""
+
     def broadcast_message(self, message):
         """Call the C{message} method of all the registered plugins.
 
@@ -51,12 +51,13 @@ class BrokerService(LandscapeService):
         self.transport = self.transport_factory(
             self.reactor, config.url, config.ssl_public_key)
         self.message_store = get_default_message_store(
-            self.persist, config.message_store_path)
+            self.persist, config.message_store_path,
+            backend=config.message_store_backend)
         self.identity = Identity(self.config, self.persist)
         exchange_store = ExchangeStore(self.config.exchange_store_path)
         self.exchanger = MessageExchange(
             self.reactor, self.message_store, self.transport, self.identity,
-            exchange_store, config)
+            exchange_store, config, max_payload_size=config.max_payload_size)
         self.pinger = self.pinger_factory(
             self.reactor, self.identity, self.exchanger, config)
         self.registration = RegistrationHandler(
@@ -96,12 +96,18 @@ import itertools
 import logging
 import os
 import uuid
+import zlib
+
+from collections import OrderedDict
 
 from twisted.python.compat import iteritems
 
 from landscape import DEFAULT_SERVER_API
 from landscape.lib import bpickle
-from landscape.lib.fs import create_binary_file, read_binary_file
+from landscape.lib.fs import (
+    append_text_file, create_binary_file, create_text_file, read_binary_file,
+    read_text_file)
+from landscape.lib.schema import InvalidError
 from landscape.lib.versioning import sort_versions, is_version_higher
 
 
@@ -109,6 +115,42 @@ HELD = "h"
 BROKEN = "b"
 
 
+class _MessageEntry(object):
+    """Identifier, path and flags of a message in the in-memory index.
+
+    The C{info} of an entry is the C{(type, api, length, crc)} of the
+    message, see L{_get_info}, or C{None} if the message wasn't decoded yet.
+    """
+
+    __slots__ = ("id", "path", "flags", "info")
+
+    def __init__(self, id, path, flags="", info=None):
+        self.id = id
+        self.path = path
+        self.flags = flags
+        self.info = info
+
+
+def _get_info(message, data):
+    """Return the C{(type, api, length, crc)} of a message.
+
+    @param message: The message, as a C{dict}.
+    @param data: The serialized message.
+    """
+    return (message["type"], message["api"], len(data),
+            zlib.crc32(data) & 0xffffffff)
+
+
+def _is_intact(data, info):
+    """Tell whether serialized message C{data} is the one C{info} is about.
+
+    The checksum catches truncated or overwritten messages without having
+    to decode them.
+    """
+    return (len(data) == info[2] and
+            zlib.crc32(data) & 0xffffffff == info[3])
+
+
 class MessageStore(object):
     """A message store which stores its messages in a file system hierarchy.
 
@@ -125,6 +167,23 @@ class MessageStore(object):
     @param persist: a L{Persist} used to save state parameters like the
         accepted message types, sequence, server uuid etc.
     @param directory: base of the file system hierarchy
+
+    Since saving the persist rewrites it entirely, the server sequence can
+    also be recorded with L{log_server_sequence}, which only appends it to a
+    small log next to the persist file. The log is replayed when the store
+    is created and cleared by L{commit}, so a whole batch of messages from
+    the server can be handled with a single save, without forgetting which
+    of them were handled if the client dies half-way through.
+
+    The message files are walked only once, to build an in-memory index of
+    the stored messages which is then kept up to date as messages get added,
+    flagged and deleted. The index also remembers the type and API of the
+    messages, so that they don't need to be decoded to be sent.
+
+    @ivar directory_scans: The number of full walks of the message
+        directories performed so far.
+    @ivar directory_scans_avoided: The number of full walks that were
+        avoided by looking up the in-memory index instead.
     """
 
     # The initial message API version that we use to communicate with the
@@ -138,15 +197,30 @@ class MessageStore(object):
         self._directory = directory
         self._directory_size = directory_size
         self._schemas = {}
+        self._resolved_schemas = {}
         self._original_persist = persist
         self._persist = persist.root_at("message-store")
+        self._server_sequence_log = None
+        if persist.filename is not None:
+            self._server_sequence_log = persist.filename + ".server-sequence"
+        self._index = None
+        self._index_by_path = {}
+        self._index_by_id = {}
+        self._unidentified = 0
+        self._sendable = 0
+        self.directory_scans = 0
+        self.directory_scans_avoided = 0
         message_dir = self._message_dir()
         if not os.path.isdir(message_dir):
             os.makedirs(message_dir)
+        self._replay_server_sequence_log()
 
     def commit(self):
         """Persist metadata to disk."""
         self._original_persist.save()
+        if (self._server_sequence_log is not None and
+                os.path.exists(self._server_sequence_log)):
+            os.unlink(self._server_sequence_log)
 
     def set_accepted_types(self, types):
         """Specify the types of messages that the server will expect from us.
@@ -199,6 +273,17 @@ class MessageStore(object):
         """
         self._persist.set("server_sequence", number)
 
+    def log_server_sequence(self, number):
+        """Set the current server sequence and durably record it.
+
+        This is meant to be called after each message received from the
+        server is handled, and is much cheaper than a L{commit}, which is
+        then only needed once the whole batch has been handled.
+        """
+        self.set_server_sequence(number)
+        if self._server_sequence_log is not None:
+            append_text_file(self._server_sequence_log, "%d\n" % number)
+
     def get_server_uuid(self):
         """Return the currently set server UUID."""
         uuid = self._persist.get("server_uuid")
@@ -228,6 +313,7 @@ class MessageStore(object):
         tagged with the given server API version.
         """
         self._persist.set("server_api", server_api)
+        self._resolved_schemas.clear()
 
     def get_exchange_token(self):
         """Get the authentication token to use for the next exchange."""
@@ -255,24 +341,39 @@ class MessageStore(object):
 
     def count_pending_messages(self):
         """Return the number of pending messages."""
-        return sum(1 for x in self._walk_pending_messages())
-
-    def get_pending_messages(self, max=None):
-        """Get any pending messages that aren't being held, up to max."""
+        return max(0, self._count_sendable() - self.get_pending_offset())
+
+    def get_pending_messages(self, max=None, max_bytes=None):
+        """Get any pending messages that aren't being held, up to max.
+
+        @param max_bytes: Optionally, stop before the total size of the
+            serialized messages exceeds this many bytes. At least one
+            message is always returned, if there's any.
+        @return: A list of messages, as L{bpickle.LazyEncodedDict}s or
+            L{bpickle.EncodedDict}s carrying their serialized form, so they
+            don't need to be serialized again when sent. Messages whose type
+            and API are in the index aren't decoded at all.
+        """
         accepted_types = self.get_accepted_types()
         server_api = self.get_server_api()
         messages = []
+        total_bytes = 0
         for filename in self._walk_pending_messages():
             if max is not None and len(messages) >= max:
                 break
-            data = read_binary_file(self._message_dir(filename))
-            try:
+            data = self._read_message(filename)
+            info = self._get_message_info(filename)
+            if info is not None and _is_intact(data, info):
                 # don't reinterpret messages that are meant to be sent out
-                message = bpickle.loads(data, as_is=True)
-            except ValueError as e:
-                logging.exception(e)
-                self._add_flags(filename, BROKEN)
+                message = bpickle.LazyEncodedDict(
+                    data, as_is=True, type=info[0], api=info[1])
             else:
+                try:
+                    message = bpickle.loads(data, as_is=True)
+                except ValueError as e:
+                    logging.exception(e)
+                    self._add_flags(filename, BROKEN)
+                    continue
                 if u"type" not in message:
                     # Special case to decode keys for messages which were
                     # serialized by py27 prior to py3 upgrade, and having
@@ -283,29 +384,52 @@ class MessageStore(object):
                         (k if isinstance(k, str) else k.decode("ascii")): v
                         for k, v in message.items()}
                     message[u"type"] = message[u"type"].decode("ascii")
-
-                unknown_type = message["type"] not in accepted_types
-                unknown_api = not is_version_higher(server_api, message["api"])
-                if unknown_type or unknown_api:
-                    self._add_flags(filename, HELD)
                 else:
-                    messages.append(message)
+                    message = bpickle.EncodedDict(message, data)
+                    self._set_message_info(filename, _get_info(message, data))
+
+            unknown_type = message["type"] not in accepted_types
+            unknown_api = not is_version_higher(server_api, message["api"])
+            if unknown_type or unknown_api:
+                self._add_flags(filename, HELD)
+            elif (max_bytes is not None and messages and
+                  total_bytes + len(data) > max_bytes):
+                break
+            else:
+                messages.append(message)
+                total_bytes += len(data)
         return messages
 
     def delete_old_messages(self):
         """Delete messages which are unlikely to be needed in the future."""
+        deleted = set()
+        containing_dirs = []
         for fn in itertools.islice(self._walk_messages(exclude=HELD + BROKEN),
                                    self.get_pending_offset()):
             os.unlink(fn)
+            deleted.add(fn)
             containing_dir = os.path.split(fn)[0]
+            if containing_dir not in containing_dirs:
+                containing_dirs.append(containing_dir)
+        for containing_dir in containing_dirs:
             if not os.listdir(containing_dir):
                 os.rmdir(containing_dir)
+        if deleted:
+            for fn in deleted:
+                self._unregister_entry(self._index_by_path[fn])
+            self._index = [entry for entry in self._index
+                           if entry.path not in deleted]
 
     def delete_all_messages(self):
         """Remove ALL stored messages."""
         self.set_pending_offset(0)
         for filename in self._walk_messages():
             os.unlink(filename)
+        self._index = []
+        self._index_by_path = {}
+        self._index_by_id = {}
+        self._unidentified = 0
+        self._sendable = 0
 
     def add_schema(self, schema):
         """Add a schema to be applied to messages of the given type.
@@ -316,23 +440,47 @@ class MessageStore(object):
         api = schema.api if schema.api else self._api
         schemas = self._schemas.setdefault(schema.type, {})
         schemas[api] = schema
+        self._resolved_schemas.clear()
+
+    def _get_schema(self, message_type, server_api):
+        """Return the schema to apply to messages of the given type.
+
+        We apply the schema with the highest API version that is lower or
+        equal to the server API. The choice is cached until the server API
+        changes or a schema is added.
+
+        @raise InvalidError: If all the schemas of the message type are for
+            API versions higher than the server API.
+        """
+        key = (message_type, server_api)
+        if key in self._resolved_schemas:
+            return self._resolved_schemas[key]
+        schemas = self._schemas[message_type]
+        for api in sort_versions(schemas.keys()):
+            if is_version_higher(server_api, api):
+                schema = self._resolved_schemas[key] = schemas[api]
+                return schema
+        raise InvalidError("No schema for %r messages at server API %s." % (
+            message_type, server_api.decode("ascii")))
 
     def is_pending(self, message_id):
         """Return bool indicating if C{message_id} still hasn't been delivered.
 
         @param message_id: Identifier returned by the L{add()} method.
         """
-        i = 0
-        pending_offset = self.get_pending_offset()
-        for filename in self._walk_messages(exclude=BROKEN):
-            flags = self._get_flags(filename)
-            if ((HELD in flags or i >= pending_offset) and
-                os.stat(filename).st_ino == message_id
-                ):
-                return True
-            if BROKEN not in flags and HELD not in flags:
-                i += 1
-        return False
+        message = self._find_message(message_id)
+        if message is None:
+            return False
+        flags = self._get_flags(message)
+        if BROKEN in flags:
+            return False
+        if HELD in flags:
+            return True
+        # Only the messages before the pending offset were delivered.
+        delivered = itertools.islice(
+            self._walk_messages(exclude=HELD + BROKEN),
+            self.get_pending_offset())
+        return message not in delivered
 
     def record_success(self, timestamp):
         """Record a successful exchange."""
@@ -378,36 +526,170 @@ class MessageStore(object):
         if "api" not in message:
             message["api"] = server_api
 
-        # We apply the schema with the highest API version that is greater
-        # or equal to the API version the message is tagged with.
-        schemas = self._schemas[message["type"]]
-        for api in sort_versions(schemas.keys()):
-            if is_version_higher(server_api, api):
-                schema = schemas[api]
-                break
+        schema = self._get_schema(message["type"], server_api)
         message = schema.coerce(message)
 
         message_data = bpickle.dumps(message)
 
+        filename = self._write_message(
+            message_data, _get_info(message, message_data))
+
+        if not self.accepts(message["type"]):
+            filename = self._set_flags(filename, HELD)
+
+        return self._get_message_id(filename)
+
+    def _write_message(self, data, info=None):
+        """Atomically write a new message at the end of the queue.
+
+        @param info: The C{(type, api, length, crc)} of the message, if
+            known.
+        @return: The path of the newly written message file.
+        """
         filename = self._get_next_message_filename()
         temp_path = filename + ".tmp"
-        create_binary_file(temp_path, message_data)
+        create_binary_file(temp_path, data)
         os.rename(temp_path, filename)
+        self._append_entry(_MessageEntry(None, filename, info=info))
+        return filename
 
-        if not self.accepts(message["type"]):
-            filename = self._set_flags(filename, HELD)
+    def _read_message(self, path):
+        """Return the raw bpickled data of the message at C{path}."""
+        return read_binary_file(self._message_dir(path))
 
-        # For now we use the inode as the message id, as it will work
-        # correctly even faced with holding/unholding.  It will break
-        # if the store is copied over for some reason, but this shouldn't
-        # present an issue given the current uses.  In the future we
-        # should have a nice transactional storage (e.g. sqlite) which
-        # will offer a more strong primary key.
-        message_id = os.stat(filename).st_ino
+    def _get_message_id(self, path):
+        """Return the identifier of the message at C{path}.
 
-        return message_id
+        The identifier is cached in the index, so that the file doesn't
+        need to be stat'ed again by L{is_pending}.
+
+        For now we use the inode as the message id, as it will work
+        correctly even faced with holding/unholding.  It will break
+        if the store is copied over for some reason, but this shouldn't
+        present an issue given the current uses.  In the future we
+        should have a nice transactional storage (e.g. sqlite) which
+        will offer a more strong primary key.
+        """
+        entry = self._get_entry(path)
+        if entry.id is None:
+            entry.id = os.stat(path).st_ino
+            self._index_by_id[entry.id] = entry
+            self._unidentified -= 1
+        return entry.id
+
+    def _find_message(self, message_id):
+        """Return the path of the message with the given identifier.
+
+        The messages whose identifier isn't known yet are stat'ed the first
+        time a message isn't found among the known ones.
+
+        @return: The path of the message, or C{None} if there's none.
+        """
+        self._get_index()
+        if message_id not in self._index_by_id and self._unidentified:
+            for entry in self._index:
+                if entry.id is None:
+                    self._get_message_id(entry.path)
+        entry = self._index_by_id.get(message_id)
+        if entry is None:
+            return None
+        return entry.path
+
+    def _get_message_info(self, path):
+        """Return the C{(type, api, length, crc)} of a message, if known."""
+        return self._get_entry(path).info
+
+    def _set_message_info(self, path, info):
+        """Remember the C{(type, api, length, crc)} of a message."""
+        self._get_entry(path).info = info
+
+    def _get_message_type(self, path):
+        """Return the type of a message, decoding it only if needed."""
+        data = self._read_message(path)
+        info = self._get_message_info(path)
+        if info is not None and _is_intact(data, info):
+            return info[0]
+        return bpickle.loads(data)["type"]
+
+    def _requeue_message(self, path):
+        """Move the message at C{path} to the end of the queue.
+
+        @return: The new path of the message.
+        """
+        new_path = self._get_next_message_filename()
+        os.rename(path, new_path)
+        entry = self._get_entry(path)
+        self._index.remove(entry)
+        self._unregister_entry(entry)
+        entry.path = new_path
+        self._append_entry(entry)
+        return new_path
+
+    def _get_index(self):
+        """Return the in-memory index of the stored messages.
+
+        The index is a list of L{_MessageEntry}s, sorted in the same order as
+        the message files. It's built by walking the message directories the
+        first time it's needed.
+        """
+        if self._index is None:
+            self._index = []
+            for path in self._scan_messages():
+                self._append_entry(
+                    _MessageEntry(None, path, self._get_flags(path)))
+            self.directory_scans += 1
+        return self._index
+
+    def _get_entry(self, path):
+        self._get_index()
+        return self._index_by_path[path]
+
+    def _append_entry(self, entry):
+        if self._index is None:
+            # The new message will be found by the initial walk.
+            return
+        self._index.append(entry)
+        self._register_entry(entry)
+
+    def _register_entry(self, entry):
+        self._index_by_path[entry.path] = entry
+        if entry.id is None:
+            self._unidentified += 1
+        else:
+            self._index_by_id[entry.id] = entry
+        if not (HELD in entry.flags or BROKEN in entry.flags):
+            self._sendable += 1
+
+    def _unregister_entry(self, entry):
+        del self._index_by_path[entry.path]
+        if entry.id is None:
+            self._unidentified -= 1
+        else:
+            del self._index_by_id[entry.id]
+        if not (HELD in entry.flags or BROKEN in entry.flags):
+            self._sendable -= 1
+
+    def _count_sendable(self):
+        """Return the number of messages which are neither held nor broken."""
+        if self._index is not None:
+            self.directory_scans_avoided += 1
+        self._get_index()
+        return self._sendable
 
     def _get_next_message_filename(self):
+        index = self._get_index()
+        if index:
+            # The index is sorted like the message files, so its last entry
+            # tells where the next message should go.
+            newest_dir, basename = os.path.split(index[-1].path)
+            number = int(basename.split("_")[0]) + 1
+            if number < self._directory_size:
+                return os.path.join(newest_dir, str(number))
+            newest_dir = self._message_dir(
+                str(int(os.path.basename(newest_dir)) + 1))
+            os.makedirs(newest_dir)
+            return os.path.join(newest_dir, "0")
+
         message_dirs = self._get_sorted_filenames()
         if message_dirs:
             newest_dir = message_dirs[-1]
@@ -428,6 +710,22 @@ class MessageStore(object):
 
         return filename
 
+    def _replay_server_sequence_log(self):
+        """Restore the server sequence logged after the last L{commit}."""
+        if (self._server_sequence_log is None or
+                not os.path.exists(self._server_sequence_log)):
+            return
+        # The last line is only complete if it's followed by a newline,
+        # otherwise the client died while writing it.
+        lines = read_text_file(self._server_sequence_log).split("\n")[:-1]
+        for line in reversed(lines):
+            try:
+                number = int(line)
+            except ValueError:
+                continue
+            self.set_server_sequence(number)
+            break
+
     def _walk_pending_messages(self):
         """Walk the files which are definitely pending."""
         pending_offset = self.get_pending_offset()
@@ -439,12 +737,18 @@ class MessageStore(object):
     def _walk_messages(self, exclude=None):
         if exclude:
             exclude = set(exclude)
+        if self._index is not None:
+            self.directory_scans_avoided += 1
+        for entry in self._get_index():
+            if (not exclude or not exclude & set(entry.flags)):
+                yield entry.path
+
+    def _scan_messages(self):
+        """Walk the message directories, yielding all message files."""
         message_dirs = self._get_sorted_filenames()
         for message_dir in message_dirs:
             for filename in self._get_sorted_filenames(message_dir):
-                flags = set(self._get_flags(filename))
-                if (not exclude or not exclude & flags):
-                    yield self._message_dir(message_dir, filename)
+                yield self._message_dir(message_dir, filename)
 
     def _get_sorted_filenames(self, dir=""):
         message_files = [x for x in os.listdir(self._message_dir(dir))
@@ -463,20 +767,20 @@ class MessageStore(object):
         offset = 0
         pending_offset = self.get_pending_offset()
         accepted_types = self.get_accepted_types()
-        for old_filename in self._walk_messages():
+        # Walk a copy, since held messages get moved around while walking.
+        for old_filename in list(self._walk_messages()):
             flags = self._get_flags(old_filename)
             try:
-                message = bpickle.loads(read_binary_file(old_filename))
+                message_type = self._get_message_type(old_filename)
             except ValueError as e:
                 logging.exception(e)
                 if HELD not in flags:
                     offset += 1
             else:
-                accepted = message["type"] in accepted_types
+                accepted = message_type in accepted_types
                 if HELD in flags:
                     if accepted:
-                        new_filename = self._get_next_message_filename()
-                        os.rename(old_filename, new_filename)
+                        new_filename = self._requeue_message(old_filename)
                         self._set_flags(new_filename, set(flags) - set(HELD))
                 else:
                     if not accepted and offset >= pending_offset:
@@ -495,6 +799,11 @@ class MessageStore(object):
         if flags:
             new_path += "_" + "".join(sorted(set(flags)))
         os.rename(path, new_path)
+        entry = self._get_entry(path)
+        self._unregister_entry(entry)
+        entry.path = new_path
+        entry.flags = self._get_flags(new_path)
+        self._register_entry(entry)
         return new_path
 
     def _add_flags(self, path, flags):
@@ -544,12 +853,276 @@ class MessageStore(object):
         self._persist.set("session-ids", new_session_ids)
 
 
+class _SegmentRecord(object):
+    """Location, flags and C{(type, api, length)} of a segment message."""
+
+    __slots__ = ("id", "segment", "offset", "length", "flags", "info")
+
+    def __init__(self, id, segment, offset, length, flags="", info=None):
+        self.id = id
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.flags = flags
+        self.info = info
+
+
+class SegmentMessageStore(MessageStore):
+    """A message store which appends its messages to segment files.
+
+    Rather than writing one file per message, messages are appended to
+    numbered segment files, and an in-memory index maps every message to
+    its segment, offset and length. The index is kept on disk as an
+    append-only journal (the C{index} file), which is replayed on startup
+    and compacted once it grows too much bigger than the live index.
+
+    This makes L{add} a constant-time operation, turns reading pending
+    messages into a sequential read of the segments, and allows
+    L{delete_old_messages} to remove whole segments at once. Message ids
+    are increasing integers, and the C{HELD} and C{BROKEN} flags only
+    live in the index.
+
+    @param segment_size: the size in bytes after which a new segment file
+        is started.
+    """
+
+    _read_ahead = 256 * 1024
+
+    def __init__(self, persist, directory, segment_size=1024 * 1024):
+        super(SegmentMessageStore, self).__init__(persist, directory)
+        self._segment_size = segment_size
+        self._records = OrderedDict()
+        self._segments = {}
+        self._next_id = 0
+        self._tail = 0
+        self._tail_size = 0
+        self._journal_size = 0
+        self._buffer = (None, 0, b"")
+        self._load_index()
+
+    def delete_old_messages(self):
+        """Delete messages which are unlikely to be needed in the future.
+
+        Segments left without any message are removed altogether.
+        """
+        records = list(itertools.islice(
+            self._walk_messages(exclude=HELD + BROKEN),
+            self.get_pending_offset()))
+        if not records:
+            return
+        for record in records:
+            del self._records[record.id]
+            self._segments[record.segment] -= 1
+        self._sendable -= len(records)
+        self._append_journal(["d %d" % record.id for record in records])
+        self._drop_empty_segments()
+        if self._journal_size > max(1000, 2 * len(self._records)):
+            self._compact_journal()
+
+    def delete_all_messages(self):
+        """Remove ALL stored messages."""
+        self.set_pending_offset(0)
+        self._records.clear()
+        self._sendable = 0
+        for segment in self._segments:
+            self._segments[segment] = 0
+        self._drop_empty_segments()
+        self._compact_journal()
+
+    def _write_message(self, data, info=None):
+        size = self._tail_size + len(data)
+        if self._tail_size and size > self._segment_size:
+            self._tail += 1
+            self._tail_size = 0
+        with open(self._segment_path(self._tail), "ab") as fd:
+            # Don't trust our own idea of the segment size: a previous
+            # write might have failed half-way through.
+            fd.seek(0, os.SEEK_END)
+            offset = fd.tell()
+            fd.write(data)
+        self._tail_size = offset + len(data)
+        record = _SegmentRecord(self._next_id, self._tail, offset, len(data),
+                                info=info)
+        self._next_id += 1
+        self._index_record(record)
+        self._append_journal([self._format_record(record)])
+        return record
+
+    def _read_message(self, record):
+        segment, start, data = self._buffer
+        begin = record.offset - start
+        if (segment != record.segment or begin < 0 or
+                begin + record.length > len(data)):
+            # Read ahead, so that walking consecutive messages of the same
+            # segment only hits the disk once.
+            with open(self._segment_path(record.segment), "rb") as fd:
+                fd.seek(record.offset)
+                data = fd.read(max(record.length, self._read_ahead))
+            self._buffer = (record.segment, record.offset, data)
+            begin = 0
+        return data[begin:begin + record.length]
+
+    def _get_message_id(self, record):
+        return record.id
+
+    def _find_message(self, message_id):
+        return self._records.get(message_id)
+
+    def _get_message_info(self, record):
+        return record.info
+
+    def _set_message_info(self, record, info):
+        record.info = info
+
+    def _count_sendable(self):
+        return self._sendable
+
+    def _requeue_message(self, record):
+        del self._records[record.id]
+        self._records[record.id] = record
+        self._append_journal(["m %d" % record.id])
+        return record
+
+    def _walk_messages(self, exclude=None):
+        exclude = set(exclude or ())
+        for record in self._records.values():
+            if not exclude & set(record.flags):
+                yield record
+
+    def _get_flags(self, record):
+        return record.flags
+
+    def _set_flags(self, record, flags):
+        if not (HELD in record.flags or BROKEN in record.flags):
+            self._sendable -= 1
+        record.flags = "".join(sorted(set(flags)))
+        if not (HELD in record.flags or BROKEN in record.flags):
+            self._sendable += 1
+        self._append_journal(["f %d %s" % (record.id, record.flags)])
+        return record
+
+    def _segment_path(self, segment):
+        return self._message_dir("%d.seg" % segment)
+
+    def _index_record(self, record):
+        self._records[record.id] = record
+        self._segments[record.segment] = (
+            self._segments.get(record.segment, 0) + 1)
+        self._sendable += 1
+
+    def _drop_empty_segments(self):
+        for segment, count in list(self._segments.items()):
+            if count:
+                continue
+            del self._segments[segment]
+            path = self._segment_path(segment)
+            if os.path.exists(path):
+                os.unlink(path)
+            if segment == self._tail:
+                self._tail += 1
+                self._tail_size = 0
+        if self._buffer[0] not in self._segments:
+            self._buffer = (None, 0, b"")
+
+    def _format_record(self, record):
+        """Return the journal line adding C{record} to the index."""
+        line = "a %d %d %d %d" % (
+            record.id, record.segment, record.offset, record.length)
+        if record.info is not None:
+            message_type, api, length, crc = record.info
+            line += " %s %s %d" % (message_type, api.decode("ascii"), crc)
+        return line
+
+    def _append_journal(self, lines):
+        append_text_file(self._message_dir("index"),
+                         "".join(line + "\n" for line in lines))
+        self._journal_size += len(lines)
+
+    def _compact_journal(self):
+        """Atomically rewrite the journal with just the live index."""
+        lines = ["n %d %d" % (self._next_id, self._tail)]
+        for record in self._records.values():
+            lines.append(self._format_record(record))
+            if record.flags:
+                lines.append("f %d %s" % (record.id, record.flags))
+        path = self._message_dir("index")
+        create_text_file(path + ".tmp", "".join(
+            line + "\n" for line in lines))
+        os.rename(path + ".tmp", path)
+        self._journal_size = len(lines)
+
+    def _load_index(self):
+        """Replay the journal to rebuild the in-memory index."""
+        path = self._message_dir("index")
+        lines = []
+        if os.path.exists(path):
+            lines = read_text_file(path).split("\n")
+        for i, line in enumerate(lines):
+            fields = line.split(" ")
+            try:
+                if fields[0] == "n":
+                    self._next_id = int(fields[1])
+                    self._tail = int(fields[2])
+                elif fields[0] == "a":
+                    id, segment, offset, length = [
+                        int(x) for x in fields[1:5]]
+                    record = _SegmentRecord(id, segment, offset, length)
+                    # Journals written before the type, API and checksum of
+                    # the messages were recorded don't have them, and they
+                    # can't be trusted on a last line cut short by a crash.
+                    if len(fields) == 8 and i < len(lines) - 1:
+                        record.info = (
+                            fields[5], fields[6].encode("ascii"), length,
+                            int(fields[7]))
+                    self._index_record(record)
+                    self._next_id = max(self._next_id, record.id + 1)
+                    self._tail = max(self._tail, record.segment)
+                elif fields[0] == "f":
+                    self._records[int(fields[1])].flags = fields[2]
+                elif fields[0] == "m":
+                    record = self._records.pop(int(fields[1]))
+                    self._records[record.id] = record
+                elif fields[0] == "d":
+                    record = self._records.pop(int(fields[1]))
+                    self._segments[record.segment] -= 1
+            except (IndexError, KeyError, ValueError):
+                # Most likely a record only partially written before a
+                # crash, which we can safely ignore.
+                if line:
+                    logging.warning("Ignoring bad message index record %r.",
+                                    line)
+        self._journal_size = len(lines)
+        self._sendable = sum(
+            1 for record in self._records.values()
+            if not (HELD in record.flags or BROKEN in record.flags))
+        # Clean up segments whose removal got interrupted.
+        for filename in os.listdir(self._message_dir()):
+            if filename.endswith(".seg"):
+                segment = int(filename[:-len(".seg")])
+                self._tail = max(self._tail, segment)
+                self._segments.setdefault(segment, 0)
+        tail_path = self._segment_path(self._tail)
+        if os.path.exists(tail_path):
+            self._tail_size = os.path.getsize(tail_path)
+        self._drop_empty_segments()
+
+
+MESSAGE_STORE_BACKENDS = {
+    "files": MessageStore,
+    "segments": SegmentMessageStore,
+}
+
+
 def get_default_message_store(*args, **kwargs):
     """
     Get a L{MessageStore} object with all Landscape message schemas added.
+
+    @param backend: The name of the storage backend to use, one of the keys
+        of L{MESSAGE_STORE_BACKENDS}, C{"files"} by default.
     """
     from landscape.message_schemas.server_bound import message_schemas
-    store = MessageStore(*args, **kwargs)
+    backend = kwargs.pop("backend", "files")
+    store = MESSAGE_STORE_BACKENDS[backend](*args, **kwargs)
     for schema in message_schemas:
         store.add_schema(schema)
     return store
@@ -86,6 +86,18 @@ class ConfigurationTests(LandscapeTest):
         self.assertEqual(configuration.exchange_interval, 34)
         self.assertEqual(configuration.ping_interval, 6)
 
+    def test_max_payload_size(self):
+        """
+        The 'max_payload_size' value defaults to 10MiB, and the value
+        specified in the configuration file is converted to an integer.
+        """
+        configuration = BrokerConfiguration()
+        self.assertEqual(10 * 1024 * 1024, configuration.max_payload_size)
+        filename = self.makeFile("[client]\n"
+                                 "max_payload_size = 1024\n")
+        configuration.load(["--config", filename, "--url", "whatever"])
+        self.assertEqual(1024, configuration.max_payload_size)
+
     def test_tag_handling(self):
         """
         The 'tags' value specified in the configuration file is not converted
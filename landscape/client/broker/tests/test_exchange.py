@@ -4,7 +4,7 @@ from landscape import CLIENT_API
 from landscape.lib.persist import Persist
 from landscape.lib.fetch import HTTPCodeError, PyCurlError
 from landscape.lib.hashlib import md5
-from landscape.lib.schema import Int
+from landscape.lib.schema import Bytes, Int
 from landscape.message_schemas.message import Message
 from landscape.client.broker.config import BrokerConfiguration
 from landscape.client.broker.exchange import (
@@ -240,16 +240,16 @@ class MessageExchangeTest(LandscapeTest):
 
     def test_messages_from_server_commit(self):
         """
-        The Exchange should commit the message store after processing each
-        message.
+        The Exchange should durably record the server sequence after
+        processing each message.
         """
         self.transport.responses.append([{"type": "inbound"}] * 3)
         handled = []
         self.message_counter = 0
 
         def handler(message):
-            Persist(filename=self.persist_filename)
-            store = MessageStore(self.persist, self.config.message_store_path)
+            persist = Persist(filename=self.persist_filename)
+            store = MessageStore(persist, self.config.message_store_path)
             self.assertEqual(store.get_server_sequence(),
                              self.message_counter)
             self.message_counter += 1
@@ -259,6 +259,20 @@ class MessageExchangeTest(LandscapeTest):
         self.exchanger.exchange()
         self.assertEqual(handled, [True] * 3, self.logfile.getvalue())
 
+    def test_messages_from_server_group_commit(self):
+        """
+        The message store is saved only once for all the messages of an
+        exchange, besides the save done before they're handled.
+        """
+        self.transport.responses.append([{"type": "inbound"}] * 10)
+        self.exchanger.register_message("inbound", lambda message: None)
+        with mock.patch.object(self.persist, "save") as save:
+            self.exchanger.exchange()
+        # One save when getting the exchange token, one before handling the
+        # messages, and one after.
+        self.assertEqual(3, save.call_count)
+        self.assertEqual(10, self.mstore.get_server_sequence())
+
     def test_messages_from_server_causing_urgent_exchanges(self):
         """
         If a message from the server causes an urgent message to be
@@ -615,6 +629,23 @@ class MessageExchangeTest(LandscapeTest):
         exchanger.exchange()
         self.assertEqual(self.transport.payloads[0]["total-messages"], 2)
 
+    def test_max_payload_size(self):
+        """
+        Messages are left in the store for later exchanges if including them
+        would make the payload bigger than C{max_payload_size}.
+        """
+        exchanger = MessageExchange(self.reactor, self.mstore, self.transport,
+                                    self.identity, self.exchange_store,
+                                    self.config, max_payload_size=100)
+        self.mstore.add_schema(Message("blob", {"data": Bytes()}))
+        self.mstore.set_accepted_types(["blob"])
+        self.mstore.add({"type": "blob", "data": b"x" * 60})
+        self.mstore.add({"type": "blob", "data": b"y" * 60})
+        exchanger.exchange()
+        messages = self.transport.payloads[0]["messages"]
+        self.assertEqual([b"x" * 60], [msg["data"] for msg in messages])
+        self.assertEqual(self.transport.payloads[0]["total-messages"], 2)
+
     def test_impending_exchange(self):
         """
         A reactor event is emitted shortly (10 seconds) before an exchange
@@ -3,7 +3,7 @@ from landscape.client.tests.helpers import LandscapeTest
 from twisted.internet.defer import fail
 
 from landscape.lib import bpickle
-from landscape.lib.fetch import fetch
+from landscape.lib.fetch import CurlPool
 from landscape.lib.testing import FakeReactor
 from landscape.client.broker.ping import PingClient, Pinger
 from landscape.client.broker.tests.helpers import ExchangeHelper
@@ -47,10 +47,11 @@ class PingClientTest(LandscapeTest):
     def test_default_get_page(self):
         """
         The C{get_page} argument to L{PingClient} should be optional, and
-        default to L{twisted.web.client.getPage}.
+        default to L{CurlPool.fetch}, so connections are reused across pings.
         """
         client = PingClient(self.reactor)
-        self.assertEqual(client.get_page, fetch)
+        self.assertIsInstance(client.get_page.__self__, CurlPool)
+        self.assertEqual(client.get_page.__func__, CurlPool.fetch)
 
     def test_ping(self):
         """
@@ -495,6 +495,17 @@ class EventTest(LandscapeTest):
         return self.assertSuccess(
             self.broker.package_data_changed(), [[return_value]])
 
+    def test_package_reporter_run(self):
+        """
+        The L{BrokerServer.package_reporter_run} method broadcasts a
+        C{package-reporter-run} event to all connected clients.
+        """
+        return_value = random.randint(1, 100)
+        callback = Mock(return_value=return_value)
+        self.client_reactor.call_on("package-reporter-run", callback)
+        return self.assertSuccess(
+            self.broker.package_reporter_run(), [[return_value]])
+
 
 class HandlersTest(LandscapeTest):
 
@@ -584,6 +595,15 @@ class HandlersTest(LandscapeTest):
         self.reactor.fire("package-data-changed")
         self.client.fire_event.assert_called_once_with("package-data-changed")
 
+    def test_package_reporter_run(self):
+        """
+        When a C{package-reporter-run} event is fired by the reactor, for
+        instance by the changer, the broker broadcasts it to its clients.
+        """
+        self.client.fire_event = Mock(return_value=succeed(None))
+        self.reactor.fire("package-reporter-run")
+        self.client.fire_event.assert_called_once_with("package-reporter-run")
+
     def test_resynchronize_clients(self):
         """
         When a C{resynchronize} event is fired by the reactor, the
@@ -60,6 +60,18 @@ class BrokerServiceTest(LandscapeTest):
         service = BrokerService(self.config)
         self.assertEqual(20, service.pinger.get_interval())
 
+    def test_exchanger(self):
+        """
+        A L{BrokerService} instance has a proper C{exchanger} attribute. Its
+        maximum payload size is configured with the C{max_payload_size}
+        value.
+        """
+        self.assertEqual(10 * 1024 * 1024,
+                         self.service.exchanger._max_payload_size)
+        self.config.max_payload_size = 1024
+        service = BrokerService(self.config)
+        self.assertEqual(1024, service.exchanger._max_payload_size)
+
     def test_registration(self):
         """
         A L{BrokerService} instance has a proper C{registration} attribute.
@@ -4,11 +4,12 @@ import mock
 
 from twisted.python.compat import intToBytes
 
-from landscape.lib.bpickle import dumps
+from landscape.lib.bpickle import dumps, loads
 from landscape.lib.persist import Persist
 from landscape.lib.schema import InvalidError, Int, Bytes, Unicode
 from landscape.message_schemas.message import Message
-from landscape.client.broker.store import MessageStore
+from landscape.client.broker.store import (
+    HELD, MessageStore, SegmentMessageStore, get_default_message_store)
 
 from landscape.client.tests.helpers import LandscapeTest
 
@@ -32,6 +33,22 @@ class MessageStoreTest(LandscapeTest):
         store.add_schema(Message("resynchronize", {}))
         return store
 
+    def break_first_message(self):
+        """Corrupt the first message written to the store."""
+        filename = os.path.join(self.temp_dir, "0", "0")
+        self.assertTrue(os.path.isfile(filename))
+
+        with open(filename, "w") as fh:
+            fh.write("bpickle will break reading this")
+
+    def rewrite_first_message(self, old, new):
+        """Replace bytes of the first message written to the store."""
+        filename = os.path.join(self.temp_dir, "0", "0")
+        with open(filename, "rb") as fh:
+            data = fh.read()
+        with open(filename, "wb") as fh:
+            fh.write(data.replace(old, new))
+
     def test_get_set_sequence(self):
         self.assertEqual(self.store.get_sequence(), 0)
         self.store.set_sequence(3)
@@ -151,6 +168,31 @@ class MessageStoreTest(LandscapeTest):
         il = [m["data"] for m in self.store.get_pending_messages(5)]
         self.assertEqual(il, [intToBytes(i) for i in[0, 1, 2, 3, 4]])
 
+    def test_max_pending_bytes(self):
+        """
+        The size of the pending messages returned can be capped, but at
+        least one message is always returned.
+        """
+        for i in range(10):
+            self.store.add(dict(type="data", data=b"x" * (i + 1) * 10))
+        # The length of the data takes one more digit than the empty one.
+        size = len(dumps({"type": "data", "api": b"3.2", "data": b""})) + 1
+        messages = self.store.get_pending_messages(max_bytes=3 * size + 60)
+        self.assertEqual([b"x" * 10, b"x" * 20, b"x" * 30],
+                         [m["data"] for m in messages])
+        messages = self.store.get_pending_messages(max_bytes=1)
+        self.assertEqual([b"x" * 10], [m["data"] for m in messages])
+
+    def test_pending_messages_carry_encoded_form(self):
+        """
+        Pending messages carry their serialized form, which is used when
+        they're serialized again.
+        """
+        self.store.add(dict(type="data", data=b"A thing"))
+        [message] = self.store.get_pending_messages()
+        self.assertEqual(dumps(dict(message)), message.encoded)
+        self.assertEqual(b"l" + message.encoded + b";", dumps([message]))
+
     def test_offset(self):
         self.store.set_pending_offset(5)
         for i in range(15):
@@ -241,11 +283,7 @@ class MessageStoreTest(LandscapeTest):
         self.store.add({"type": "empty"})
         self.store.add({"type": "empty2"})
 
-        filename = os.path.join(self.temp_dir, "0", "0")
-        self.assertTrue(os.path.isfile(filename))
-
-        with open(filename, "w") as fh:
-            fh.write("bpickle will break reading this")
+        self.break_first_message()
 
         self.assertEqual(self.store.get_pending_messages(), [])
 
@@ -273,11 +311,7 @@ class MessageStoreTest(LandscapeTest):
         self.store.add({"type": "data", "data": b"1"})
         self.store.add({"type": "data", "data": b"2"})
 
-        filename = os.path.join(self.temp_dir, "0", "0")
-        self.assertTrue(os.path.isfile(filename))
-
-        with open(filename, "w") as fh:
-            fh.write("bpickle will break reading this")
+        self.break_first_message()
 
         messages = self.store.get_pending_messages()
 
@@ -313,6 +347,42 @@ class MessageStoreTest(LandscapeTest):
         self.assertEqual(self.store.get_pending_messages(),
                          [{"type": "data", "data": 1, "api": b"3.2"}])
 
+    def test_index_is_built_once(self):
+        """
+        The message directories are walked only once, afterwards the
+        in-memory index is kept up to date by the store itself.
+        """
+        for i in range(30):
+            self.store.add(dict(type=["data", "unaccepted"][i % 3 == 0],
+                                data=intToBytes(i)))
+        self.store.set_pending_offset(5)
+        self.store.delete_old_messages()
+        self.store.set_pending_offset(2)
+        self.store.set_accepted_types(["data", "unaccepted"])
+        self.assertEqual(1, self.store.directory_scans)
+        self.assertTrue(self.store.directory_scans_avoided > 0)
+        messages = self.store.get_pending_messages()
+        count = self.store.count_pending_messages()
+
+        store = self.create_store()
+        store.set_pending_offset(2)
+        store.set_accepted_types(["data", "unaccepted"])
+        self.assertEqual(messages, store.get_pending_messages())
+        self.assertEqual(len(messages), count)
+        self.assertEqual(count, store.count_pending_messages())
+
+    def test_directory_scans_avoided_per_walk(self):
+        """
+        Each walk of the in-memory index avoids one directory scan, however
+        many messages are looked up in it.
+        """
+        for i in range(3):
+            self.store.add({"type": "data", "data": intToBytes(i)})
+        self.store.count_pending_messages()
+        avoided = self.store.directory_scans_avoided
+        self.assertEqual(3, len(self.store.get_pending_messages()))
+        self.assertEqual(avoided + 1, self.store.directory_scans_avoided)
+
     def test_get_server_api_default(self):
         """
         By default the initial server API version is 3.2.
@@ -410,6 +480,52 @@ class MessageStoreTest(LandscapeTest):
             self.store.get_pending_messages(),
             [{"type": "data", "api": b"3.2", "data": b"foo"}])
 
+    def test_schema_choice_is_cached(self):
+        """
+        The schema to apply to a message type is only looked up for the
+        first message of that type.
+        """
+        self.store.add({"type": "data", "data": b"foo"})
+        with mock.patch("landscape.client.broker.store.sort_versions") as sort:
+            self.store.add({"type": "data", "data": b"bar"})
+            self.assertFalse(sort.called)
+
+    def test_schema_choice_cache_invalidation(self):
+        """
+        The schema to apply is looked up again when a schema is added or
+        the server API changes.
+        """
+        self.store.set_server_api(b"3.2")
+        self.store.add({"type": "data", "data": b"foo"})
+        self.store.add_schema(Message("data", {"data": Int()}, api=b"3.3"))
+        self.store.set_server_api(b"3.3")
+        self.store.add({"type": "data", "data": 123})
+        self.store.set_server_api(b"3.2")
+        self.store.add({"type": "data", "data": b"bar"})
+        self.store.set_server_api(b"3.3")
+        self.assertEqual(
+            [{"type": "data", "api": b"3.2", "data": b"foo"},
+             {"type": "data", "api": b"3.3", "data": 123},
+             {"type": "data", "api": b"3.2", "data": b"bar"}],
+            self.store.get_pending_messages())
+
+    def test_no_compatible_schema(self):
+        """
+        Adding a message fails with an L{InvalidError} if all the schemas of
+        its type are for newer APIs than the server's, and keeps failing
+        until a compatible schema is added.
+        """
+        self.store.add_schema(Message("new", {}, api=b"3.3"))
+        self.store.set_server_api(b"3.2")
+        for i in range(2):
+            error = self.assertRaises(
+                InvalidError, self.store.add, {"type": "new"})
+            self.assertEqual(
+                "No schema for 'new' messages at server API 3.2.",
+                str(error))
+        self.store.add_schema(Message("new", {}, api=b"3.2"))
+        self.store.add({"type": "new"})
+
     def test_count_pending_messages(self):
         """It is possible to get the total number of pending messages."""
         self.assertEqual(self.store.count_pending_messages(), 0)
@@ -435,6 +551,80 @@ class MessageStoreTest(LandscapeTest):
         self.assertEqual(set(store.get_accepted_types()),
                          set(["foo", "bar"]))
 
+    def test_log_server_sequence(self):
+        """
+        A server sequence recorded with C{log_server_sequence} is restored
+        by a new store, even if the store wasn't committed.
+        """
+        self.store.commit()
+        self.store.log_server_sequence(1)
+        self.store.log_server_sequence(2)
+        self.assertEqual(2, self.store.get_server_sequence())
+        store = self.create_store()
+        self.assertEqual(2, store.get_server_sequence())
+
+    def test_commit_clears_server_sequence_log(self):
+        """
+        Committing the store saves the server sequence in the persist, so
+        the log isn't needed anymore.
+        """
+        self.store.log_server_sequence(3)
+        self.store.commit()
+        self.assertFalse(
+            os.path.exists(self.persist_filename + ".server-sequence"))
+        self.assertEqual(3, self.create_store().get_server_sequence())
+
+    def test_server_sequence_log_partial_line(self):
+        """
+        A server sequence whose record didn't get completely written isn't
+        restored.
+        """
+        self.store.log_server_sequence(4)
+        with open(self.persist_filename + ".server-sequence", "a") as fd:
+            fd.write("5")
+        self.assertEqual(4, self.create_store().get_server_sequence())
+
+    def test_get_pending_messages_without_decoding(self):
+        """
+        Messages whose type and API are known from the index are returned
+        without being decoded, and still carry their serialized form.
+        """
+        self.store.add({"type": "data", "data": b"A thing"})
+        with mock.patch("landscape.lib.bpickle.loads") as loads:
+            [message] = self.store.get_pending_messages()
+            self.assertEqual("data", message["type"])
+            self.assertEqual(b"3.2", message["api"])
+            self.assertFalse(loads.called)
+        self.assertEqual(dumps(message), message.encoded)
+        self.assertEqual(b"A thing", message["data"])
+
+    def test_get_pending_messages_decodes_once(self):
+        """
+        Messages found on disk by a new store are decoded only the first
+        time they're returned.
+        """
+        self.store.add({"type": "data", "data": b"A thing"})
+        store = self.create_store()
+        store.get_pending_messages()
+        with mock.patch("landscape.lib.bpickle.loads") as loads:
+            [message] = store.get_pending_messages()
+            self.assertEqual("data", message["type"])
+            self.assertFalse(loads.called)
+
+    def test_get_pending_messages_with_overwritten_message(self):
+        """
+        A message overwritten without changing its length is decoded
+        again, rather than sent as it is.
+        """
+        self.store.add({"type": "data", "data": b"A thing"})
+        self.rewrite_first_message(b"A thing", b"A th;ng")
+        for store in (self.store, self.create_store()):
+            with mock.patch("landscape.lib.bpickle.loads",
+                            wraps=loads) as loads_mock:
+                [message] = store.get_pending_messages()
+                self.assertTrue(loads_mock.called)
+            self.assertEqual(b"A th;ng", message["data"])
+
     def test_is_pending_pre_and_post_message_delivery(self):
         self.log_helper.ignore_errors(ValueError)
 
@@ -446,11 +636,7 @@ class MessageStoreTest(LandscapeTest):
         # For the same reason we break the first message.
         self.store.add({"type": "empty"})
 
-        filename = os.path.join(self.temp_dir, "0", "0")
-        self.assertTrue(os.path.isfile(filename))
-
-        with open(filename, "w") as fh:
-            fh.write("bpickle will break reading this")
+        self.break_first_message()
 
         # And hold the second one.
         self.store.add({"type": "data", "data": b"A thing"})
@@ -470,6 +656,19 @@ class MessageStoreTest(LandscapeTest):
         self.store.add_pending_offset(1)
         self.assertFalse(self.store.is_pending(id))
 
+    def test_is_pending_after_restart(self):
+        """
+        Messages can be looked up by their identifier in a store whose index
+        was just loaded.
+        """
+        ids = [self.store.add({"type": "empty"}) for i in range(3)]
+        store = self.create_store()
+        store.set_pending_offset(1)
+        self.assertFalse(store.is_pending(ids[0]))
+        self.assertTrue(store.is_pending(ids[1]))
+        self.assertTrue(store.is_pending(ids[2]))
+        self.assertFalse(store.is_pending(-1))
+
     def test_is_pending_with_held_message(self):
         self.store.set_accepted_types(["empty"])
         id = self.store.add({"type": "data", "data": b"A thing"})
@@ -488,11 +687,7 @@ class MessageStoreTest(LandscapeTest):
 
         id = self.store.add({"type": "empty"})
 
-        filename = os.path.join(self.temp_dir, "0", "0")
-        self.assertTrue(os.path.isfile(filename))
-
-        with open(filename, "w") as fh:
-            fh.write("bpickle will break reading this")
+        self.break_first_message()
 
         self.assertEqual(self.store.get_pending_messages(), [])
 
@@ -647,6 +842,9 @@ class MessageStoreTest(LandscapeTest):
             fh.write(dumps({b"type": b"data",
                             b"data": b"A thing",
                             b"api": b"3.2"}))
+        # The file was written behind the back of the store, so its index
+        # needs to be rebuilt.
+        self.store._index = None
         [message] = self.store.get_pending_messages()
         # message keys are decoded
         self.assertIn(u"type", message)
@@ -654,3 +852,218 @@ class MessageStoreTest(LandscapeTest):
         self.assertIsInstance(message[u"api"], bytes)  # api is bytes
         self.assertEqual(u"data", message[u"type"])  # message type is decoded
         self.assertEqual(b"A thing", message[u"data"])  # other are kept as-is
+
+
+class SegmentMessageStoreTest(MessageStoreTest):
+    """Run the L{MessageStore} tests against the L{SegmentMessageStore}."""
+
+    def create_store(self):
+        persist = Persist(filename=self.persist_filename)
+        store = SegmentMessageStore(persist, self.temp_dir, 100)
+        store.set_accepted_types(["empty", "data", "resynchronize"])
+        store.add_schema(Message("empty", {}))
+        store.add_schema(Message("empty2", {}))
+        store.add_schema(Message("data", {"data": Bytes()}))
+        store.add_schema(Message("unaccepted", {"data": Bytes()}))
+        store.add_schema(Message("resynchronize", {}))
+        return store
+
+    def break_first_message(self):
+        """Overwrite the bytes of the first message in its segment."""
+        [record] = [r for r in self.store._records.values() if r.id == 0]
+        garbage = b"bpickle will break reading this".ljust(record.length)
+        with open(self.store._segment_path(record.segment), "r+b") as fh:
+            fh.seek(record.offset)
+            fh.write(garbage[:record.length])
+
+    def rewrite_first_message(self, old, new):
+        """Replace bytes of the first message in its segment."""
+        [record] = [r for r in self.store._records.values() if r.id == 0]
+        with open(self.store._segment_path(record.segment), "r+b") as fh:
+            fh.seek(record.offset)
+            data = fh.read(record.length)
+            fh.seek(record.offset)
+            fh.write(data.replace(old, new))
+
+    def test_wb_clean_up_empty_directories(self):
+        """
+        Segments are removed once all their messages have been deleted.
+        """
+        for i in range(60):
+            self.store.add(dict(type="data", data=intToBytes(i)))
+        il = [m["data"] for m in self.store.get_pending_messages(60)]
+        self.assertEqual(il, [intToBytes(i) for i in range(60)])
+        segments = [name for name in os.listdir(self.temp_dir)
+                    if name.endswith(".seg")]
+        self.assertTrue(len(segments) > 1)
+
+        self.store.set_pending_offset(60)
+        self.store.delete_old_messages()
+        self.assertEqual(os.listdir(self.temp_dir), ["index"])
+
+    def test_delete_old_messages_drops_whole_segments(self):
+        """
+        Only segments whose messages have all been deleted are removed.
+        """
+        for i in range(30):
+            self.store.add(dict(type="data", data=intToBytes(i)))
+        segments = sorted(self.store._segments)
+        first_segment_size = self.store._segments[segments[0]]
+        self.store.set_pending_offset(first_segment_size + 1)
+        self.store.delete_old_messages()
+        self.assertFalse(
+            os.path.exists(self.store._segment_path(segments[0])))
+        self.assertTrue(
+            os.path.exists(self.store._segment_path(segments[1])))
+        self.store.set_pending_offset(0)
+        il = [m["data"] for m in self.store.get_pending_messages(50)]
+        self.assertEqual(
+            il, [intToBytes(i) for i in range(first_segment_size + 1, 30)])
+
+    def test_atomic_message_writing(self):
+        """
+        If the server gets unplugged halfway through appending a message,
+        the partially written data is ignored.
+        """
+        self.store.add_schema(Message("data", {"data": Int()}))
+        self.store.add({"type": "data", "data": 1})
+        with open(self.store._segment_path(self.store._tail), "ab") as fh:
+            fh.write(b"d4:data")
+        store = self.create_store()
+        store.add_schema(Message("data", {"data": Int()}))
+        store.add({"type": "data", "data": 2})
+        self.assertEqual(store.get_pending_messages(),
+                         [{"type": "data", "data": 1, "api": b"3.2"},
+                          {"type": "data", "data": 2, "api": b"3.2"}])
+
+    def test_wb_get_pending_legacy_messages(self):
+        """Pending messages queued by legacy py27 are converted."""
+        self.store._write_message(dumps({b"type": b"data",
+                                         b"data": b"A thing",
+                                         b"api": b"3.2"}))
+        [message] = self.store.get_pending_messages()
+        self.assertIn(u"type", message)
+        self.assertIn(u"api", message)
+        self.assertIsInstance(message[u"api"], bytes)
+        self.assertEqual(u"data", message[u"type"])
+        self.assertEqual(b"A thing", message[u"data"])
+
+    def test_message_info_is_reloaded(self):
+        """
+        The type and API of the messages are kept in the index journal, so
+        they're known without decoding the messages after a restart.
+        """
+        self.store.add({"type": "data", "data": b"A thing"})
+        store = self.create_store()
+        with mock.patch("landscape.lib.bpickle.loads") as loads:
+            [message] = store.get_pending_messages()
+            self.assertEqual("data", message["type"])
+            self.assertFalse(loads.called)
+
+    def test_index_is_reloaded(self):
+        """
+        The index journal is replayed on startup, restoring the order,
+        flags and ids of the stored messages.
+        """
+        for i in range(5):
+            self.store.add(dict(type=["data", "unaccepted"][i % 2],
+                                data=intToBytes(i)))
+        held_id = self.store.add({"type": "unaccepted", "data": b"held"})
+        self.store.set_pending_offset(1)
+        self.store.delete_old_messages()
+        self.store.set_pending_offset(0)
+        store = self.create_store()
+        il = [m["data"] for m in store.get_pending_messages()]
+        self.assertEqual(il, [intToBytes(i) for i in [2, 4]])
+        self.assertTrue(store.is_pending(held_id))
+        self.assertIn(HELD, [r.flags for r in store._records.values()
+                             if r.id == held_id][0])
+        store.set_accepted_types(["data", "unaccepted"])
+        store = self.create_store()
+        store.set_accepted_types(["data", "unaccepted"])
+        il = [m["data"] for m in store.get_pending_messages()]
+        self.assertEqual(il, [intToBytes(i) for i in [2, 4, 1, 3]] + [b"held"])
+        self.assertNotEqual(held_id, store.add({"type": "empty"}))
+
+    def test_index_is_built_once(self):
+        """
+        The L{SegmentMessageStore} never walks the message directory, since
+        it loads its index from the journal.
+        """
+        for i in range(30):
+            self.store.add(dict(type=["data", "unaccepted"][i % 3 == 0],
+                                data=intToBytes(i)))
+        self.store.set_pending_offset(5)
+        self.store.delete_old_messages()
+        self.store.set_accepted_types(["data", "unaccepted"])
+        self.assertEqual(20, self.store.count_pending_messages())
+        self.assertEqual(0, self.store.directory_scans)
+
+    def test_directory_scans_avoided_per_walk(self):
+        """
+        The L{SegmentMessageStore} never avoids directory scans either,
+        since it never needs one.
+        """
+        for i in range(3):
+            self.store.add({"type": "data", "data": intToBytes(i)})
+        self.assertEqual(3, len(self.store.get_pending_messages()))
+        self.assertEqual(0, self.store.directory_scans_avoided)
+
+    def test_count_pending_messages_without_walking(self):
+        """
+        The L{SegmentMessageStore} keeps count of the messages which are
+        neither held nor broken, instead of counting them on each call.
+        """
+        for i in range(6):
+            self.store.add(dict(type=["data", "unaccepted"][i % 3 == 0],
+                                data=intToBytes(i)))
+        self.store.set_pending_offset(1)
+        self.store.delete_old_messages()
+        self.store.set_pending_offset(1)
+        with mock.patch.object(self.store, "_walk_messages") as walk_mock:
+            self.assertEqual(2, self.store.count_pending_messages())
+            self.assertFalse(walk_mock.called)
+        self.store.set_accepted_types(["data", "unaccepted"])
+        self.assertEqual(4, self.store.count_pending_messages())
+        store = self.create_store()
+        store.set_pending_offset(1)
+        self.assertEqual(2, store.count_pending_messages())
+
+    def test_truncated_index_record_is_ignored(self):
+        """
+        An index record only partially written before a crash is ignored.
+        """
+        self.store.add({"type": "data", "data": b"1"})
+        with open(os.path.join(self.temp_dir, "index"), "a") as fh:
+            fh.write("a 1 0")
+        store = self.create_store()
+        self.assertEqual([m["data"] for m in store.get_pending_messages()],
+                         [b"1"])
+        self.assertIn("Ignoring bad message index record",
+                      self.logfile.getvalue())
+
+    def test_index_is_compacted(self):
+        """
+        Once the journal grows too big the index is rewritten with just the
+        live messages.
+        """
+        for i in range(600):
+            self.store.add({"type": "data", "data": intToBytes(i)})
+        self.store.set_pending_offset(550)
+        self.store.delete_old_messages()
+        with open(os.path.join(self.temp_dir, "index")) as fh:
+            self.assertEqual(51, len(fh.readlines()))
+        self.store.set_pending_offset(0)
+        store = self.create_store()
+        self.assertEqual(
+            [m["data"] for m in store.get_pending_messages()],
+            [intToBytes(i) for i in range(550, 600)])
+
+    def test_get_default_message_store_with_backend(self):
+        """
+        L{get_default_message_store} can create a L{SegmentMessageStore}.
+        """
+        persist = Persist(filename=self.persist_filename)
+        store = get_default_message_store(persist, self.makeDir(),
+                                          backend="segments")
+        self.assertIsInstance(store, SegmentMessageStore)
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 import os
+import zlib
 
 from landscape import VERSION
-from landscape.client.broker.transport import HTTPTransport
+from landscape.client.broker.transport import (
+    HTTPTransport, gzip_chunks, parse_accept_encoding)
 from landscape.lib import bpickle
 from landscape.lib.fetch import PyCurlError
 from landscape.lib.testing import LogKeeperHelper
@@ -38,6 +40,33 @@ class DataCollectingResource(resource.Resource):
         return bpickle.dumps("Great.")
 
 
+class EncodingResource(DataCollectingResource):
+    """Resource advertising the request encodings it accepts.
+
+    @ivar refuse: Whether to reply with a 415 to encoded requests.
+    """
+
+    accept_encoding = "gzip"
+    refuse = False
+
+    def __init__(self):
+        DataCollectingResource.__init__(self)
+        self.requests = []
+
+    def render(self, request):
+        encoding = request.getHeader("content-encoding")
+        content = request.content.read()
+        self.requests.append((encoding, content))
+        request.setHeader("accept-encoding", self.accept_encoding)
+        if encoding and self.refuse:
+            request.setResponseCode(415)
+            return b""
+        if encoding == "gzip":
+            content = zlib.decompress(content, zlib.MAX_WBITS | 16)
+        self.content = content
+        return bpickle.dumps("Great.")
+
+
 class HTTPTransportTest(LandscapeTest):
 
     helpers = [LogKeeperHelper]
@@ -163,3 +192,118 @@ class HTTPTransportTest(LandscapeTest):
                             in self.logfile.getvalue())
         result.addErrback(got_result)
         return result
+
+    def exchange_many(self, resource, payloads, **kwargs):
+        """Exchange each of C{payloads} in turn with C{resource}."""
+        port = reactor.listenTCP(
+            0, server.Site(resource), interface="127.0.0.1")
+        self.ports.append(port)
+        transport = HTTPTransport(
+            None, "http://localhost:%d/" % (port.getHost().port,), **kwargs)
+
+        def exchange_all():
+            return [transport.exchange(payload, message_api="X.Y")
+                    for payload in payloads]
+        return deferToThread(exchange_all)
+
+    def test_compression_negotiated(self):
+        """
+        Once the server advertised that it accepts gzip-encoded requests,
+        the following payloads are compressed.
+        """
+        resource = EncodingResource()
+        payload = {"data": b"x" * 4096}
+        result = self.exchange_many(resource, [payload, payload])
+
+        def got_result(responses):
+            self.assertEqual(["Great.", "Great."], responses)
+            [(first_encoding, first), (second_encoding, second)] = (
+                resource.requests)
+            self.assertIs(None, first_encoding)
+            self.assertEqual("gzip", second_encoding)
+            self.assertTrue(len(second) < len(first))
+            self.assertEqual(payload, bpickle.loads(resource.content))
+            self.assertIn("before gzip compression", self.logfile.getvalue())
+        return result.addCallback(got_result)
+
+    def test_compression_not_advertised(self):
+        """
+        Payloads aren't compressed if the server doesn't accept any of the
+        encodings we support.
+        """
+        resource = EncodingResource()
+        resource.accept_encoding = "br, gzip;q=0"
+        payload = {"data": b"x" * 4096}
+        result = self.exchange_many(resource, [payload, payload])
+
+        def got_result(responses):
+            self.assertEqual([None, None],
+                             [encoding for encoding, _ in resource.requests])
+        return result.addCallback(got_result)
+
+    def test_compression_disabled(self):
+        """
+        Payloads aren't compressed if the transport is told not to.
+        """
+        resource = EncodingResource()
+        payload = {"data": b"x" * 4096}
+        result = self.exchange_many(resource, [payload, payload],
+                                    compress=False)
+
+        def got_result(responses):
+            self.assertEqual([None, None],
+                             [encoding for encoding, _ in resource.requests])
+        return result.addCallback(got_result)
+
+    def test_compression_small_payload(self):
+        """
+        Small payloads are sent uncompressed even if the server accepts
+        compressed ones.
+        """
+        resource = EncodingResource()
+        result = self.exchange_many(resource, ["HI", "HI"])
+
+        def got_result(responses):
+            self.assertEqual([None, None],
+                             [encoding for encoding, _ in resource.requests])
+        return result.addCallback(got_result)
+
+    def test_compression_refused(self):
+        """
+        If the server refuses a compressed payload with a 415, the payload is
+        sent again uncompressed.
+        """
+        resource = EncodingResource()
+        resource.refuse = True
+        payload = {"data": b"x" * 4096}
+        result = self.exchange_many(resource, [payload, payload])
+
+        def got_result(responses):
+            self.assertEqual(["Great.", "Great."], responses)
+            self.assertEqual([None, "gzip", None],
+                             [encoding for encoding, _ in resource.requests])
+            self.assertEqual(payload, bpickle.loads(resource.content))
+            self.assertIn("Server refused gzip-encoded payload",
+                          self.logfile.getvalue())
+        return result.addCallback(got_result)
+
+
+class EncodingTest(LandscapeTest):
+
+    def test_gzip_chunks(self):
+        """
+        L{gzip_chunks} compresses a list of chunks into a gzip stream.
+        """
+        chunks = gzip_chunks([b"foo", b"bar" * 100, b""])
+        self.assertEqual(b"foo" + b"bar" * 100,
+                         zlib.decompress(b"".join(chunks),
+                                         zlib.MAX_WBITS | 16))
+
+    def test_parse_accept_encoding(self):
+        """
+        L{parse_accept_encoding} returns the codings of an C{Accept-Encoding}
+        header, leaving out the ones refused with C{q=0}.
+        """
+        self.assertEqual(
+            {"gzip", "zstd"},
+            parse_accept_encoding("GZIP;q=0.5, zstd, br;q=0, , x;q=bad"))
@@ -3,28 +3,109 @@ import time
 import logging
 import pprint
 import uuid
-
-import pycurl
+import zlib
 
 from twisted.python.compat import unicode, _PY3
 
 from landscape.lib import bpickle
-from landscape.lib.fetch import fetch
+from landscape.lib.fetch import CurlPool, HTTPCodeError
 from landscape.lib.format import format_delta
 from landscape import SERVER_API, VERSION
 
+try:
+    import zstandard
+    has_zstd = True
+except ImportError:
+    has_zstd = False
+
+
+# Payloads smaller than this are sent as they are, since compressing them
+# wouldn't save enough to be worth it.
+COMPRESSION_THRESHOLD = 1024
+
+
+def gzip_chunks(chunks):
+    """Compress a list of C{bytes} chunks, returning gzip-encoded chunks."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    compressed = []
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            compressed.append(data)
+    compressed.append(compressor.flush())
+    return compressed
+
+
+def zstd_chunks(chunks):
+    """Compress a list of C{bytes} chunks, returning zstd-encoded chunks."""
+    compressor = zstandard.ZstdCompressor().compressobj()
+    compressed = []
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            compressed.append(data)
+    compressed.append(compressor.flush())
+    return compressed
+
+
+def get_content_encoders():
+    """Return the supported request encodings, most preferred first."""
+    encoders = []
+    if has_zstd:
+        encoders.append(("zstd", zstd_chunks))
+    encoders.append(("gzip", gzip_chunks))
+    return encoders
+
+
+def parse_accept_encoding(value):
+    """Parse the value of an C{Accept-Encoding} header.
+
+    @return: The C{set} of lower-cased codings which aren't explicitly
+        refused with a C{q=0} parameter.
+    """
+    codings = set()
+    for item in value.split(","):
+        params = item.strip().lower().split(";")
+        coding = params[0].strip()
+        if not coding:
+            continue
+        refused = False
+        for param in params[1:]:
+            name, _, quality = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    refused = float(quality) == 0
+                except ValueError:
+                    refused = True
+        if not refused:
+            codings.add(coding)
+    return codings
+
 
 class HTTPTransport(object):
     """Transport makes a request to exchange message data over HTTP.
 
+    Request bodies are only compressed once the server advertised the
+    encodings it accepts, with an C{Accept-Encoding} header in one of its
+    responses (see RFC 7694). Compressed responses are decoded by curl.
+
     @param url: URL of the remote Landscape server message system.
     @param pubkey: SSH public key used for secure communication.
+    @param compress: Whether to compress request bodies, if the server
+        supports it.
+    @param pool: The L{CurlPool} keeping connections to the server open
+        between exchanges, a private one is created by default.
     """
 
-    def __init__(self, reactor, url, pubkey=None):
+    def __init__(self, reactor, url, pubkey=None, compress=True, pool=None):
         self._reactor = reactor
         self._url = url
         self._pubkey = pubkey
+        self._compress = compress
+        self._content_encoding = None
+        if pool is None:
+            pool = CurlPool()
+        self._pool = pool
 
     def get_url(self):
         """Get the URL of the remote message system."""
@@ -34,7 +115,23 @@ class HTTPTransport(object):
         """Set the URL of the remote message system."""
         self._url = url
 
-    def _curl(self, payload, computer_id, exchange_token, message_api):
+    def _negotiate_encoding(self, accept_encoding):
+        """Pick the request encoding to use from the server's advertisement.
+
+        @param accept_encoding: The value of the C{Accept-Encoding} header
+            in the last response, or C{None} if it had none.
+        """
+        self._content_encoding = None
+        if not self._compress or accept_encoding is None:
+            return
+        accepted = parse_accept_encoding(accept_encoding)
+        for name, encoder in get_content_encoders():
+            if name in accepted:
+                self._content_encoding = name
+                break
+
+    def _curl(self, payload, computer_id, exchange_token, message_api,
+              content_encoding=None):
         # There are a few "if _PY3" checks below, because for Python 3 we
         # want to convert a number of values from bytes to string, before
         # assigning them to the headers.
@@ -51,15 +148,35 @@ class HTTPTransport(object):
             if _PY3 and isinstance(exchange_token, bytes):
                 exchange_token = exchange_token.decode("ascii")
             headers["X-Exchange-Token"] = str(exchange_token)
-        curl = pycurl.Curl()
-        return (curl, fetch(self._url, post=True, data=payload,
-                            headers=headers, cainfo=self._pubkey, curl=curl))
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+        response_headers = {}
+
+        def header_function(line):
+            if not isinstance(line, str):
+                line = line.decode("iso-8859-1")
+            if line.startswith("HTTP/"):
+                # A new response (after a redirect, or a "100 Continue").
+                response_headers.clear()
+            name, colon, value = line.partition(":")
+            if colon:
+                response_headers[name.strip().lower()] = value.strip()
+
+        data = self._pool.fetch(self._url, post=True, data=payload,
+                                headers=headers, cainfo=self._pubkey,
+                                header_function=header_function)
+        self._negotiate_encoding(response_headers.get("accept-encoding"))
+        return data
 
     def exchange(self, payload, computer_id=None, exchange_token=None,
                  message_api=SERVER_API):
         """Exchange message data with the server.
 
         @param payload: The object to send, it must be L{bpickle}-compatible.
+            It's serialized as a list of chunks which are streamed to the
+            server as they are, so messages carrying their serialized form
+            (see L{bpickle.EncodedDict}) are not copied again. Chunks are
+            compressed if the server told us which encodings it accepts.
         @param computer_id: The computer ID to send the message as (see
             also L{Identity}).
         @param exchange_token: The token that the server has given us at the
@@ -73,20 +190,48 @@ class HTTPTransport(object):
         @note: This code is thread safe (HOPEFULLY).
 
         """
-        spayload = bpickle.dumps(payload)
+        spayload = bpickle.chunked_dumps(payload)
+        payload_size = sum(len(chunk) for chunk in spayload)
         start_time = time.time()
         if logging.getLogger().getEffectiveLevel() <= logging.DEBUG:
             logging.debug("Sending payload:\n%s", pprint.pformat(payload))
+        content_encoding = self._content_encoding
+        if payload_size < COMPRESSION_THRESHOLD:
+            content_encoding = None
         try:
-            curly, data = self._curl(spayload, computer_id, exchange_token,
-                                     message_api)
+            try:
+                body = spayload
+                if content_encoding:
+                    body = dict(get_content_encoders())[content_encoding](
+                        spayload)
+                data = self._curl(body, computer_id, exchange_token,
+                                  message_api, content_encoding)
+            except HTTPCodeError as error:
+                if not content_encoding or error.http_code != 415:
+                    raise
+                # The server doesn't accept the encoding anymore, send the
+                # payload again as it is.
+                logging.warning("Server refused %s-encoded payload, sending "
+                                "it uncompressed.", content_encoding)
+                self._content_encoding = content_encoding = None
+                body = spayload
+                data = self._curl(body, computer_id, exchange_token,
+                                  message_api)
         except Exception:
             logging.exception("Error contacting the server at %s." % self._url)
             raise
         else:
-            logging.info("Sent %d bytes and received %d bytes in %s.",
-                         len(spayload), len(data),
-                         format_delta(time.time() - start_time))
+            sent_size = sum(len(chunk) for chunk in body)
+            if content_encoding:
+                logging.info("Sent %d bytes (%d before %s compression, %d "
+                             "saved) and received %d bytes in %s.",
+                             sent_size, payload_size, content_encoding,
+                             payload_size - sent_size, len(data),
+                             format_delta(time.time() - start_time))
+            else:
+                logging.info("Sent %d bytes and received %d bytes in %s.",
+                             sent_size, len(data),
+                             format_delta(time.time() - start_time))
 
         try:
             response = bpickle.loads(data)
@@ -83,6 +83,8 @@ class Configuration(BaseConfiguration):
               - C{ssl_public_key}
               - C{ignore_sigint} (C{False})
               - C{stagger_launch} (C{0.1})
+              - C{coalesce_runs} (C{False})
+              - C{coalesce_runs_jitter} (C{5.0})
         """
         parser = super(Configuration, self).make_parser()
         logging.add_cli_options(parser, logdir="/var/log/landscape")
@@ -104,6 +106,11 @@ class Configuration(BaseConfiguration):
                           type="int",
                           help="The interval between package monitor runs "
                                "(default: 1800).")
+        parser.add_option("--package-reporter-resident", default=False,
+                          action="store_true",
+                          help="Keep the package reporter running between "
+                               "package monitor runs, instead of starting "
+                               "it each time.")
         parser.add_option("--apt-update-interval", default=6 * 60 * 60,
                           type="int",
                           help="The interval between apt update runs "
@@ -116,6 +123,16 @@ class Configuration(BaseConfiguration):
                           dest="stagger_launch", default=0.1, type=float,
                           help="Ratio, between 0 and 1, by which to scatter "
                                "various tasks of landscape.")
+        parser.add_option("--coalesce-runs", default=False,
+                          action="store_true",
+                          help="Run the periodic tasks of each process "
+                               "together, at the multiples of their "
+                               "intervals, to wake up less often.")
+        parser.add_option("--coalesce-runs-jitter", metavar="SECONDS",
+                          default=5.0, type=float,
+                          help="With --coalesce-runs, the maximum random "
+                               "offset of the runs of each process "
+                               "(default: 5).")
 
         # Hidden options, used for load-testing to run in-process clones
         parser.add_option("--clones", default=0, type=int, help=SUPPRESS_HELP)
@@ -150,7 +167,9 @@ def get_versioned_persist(service):
     Load a L{Persist} database for the given C{service} and upgrade or
     mark as current, as necessary.
     """
-    persist = Persist(filename=service.persist_filename)
+    persist = Persist(filename=service.persist_filename,
+                      incremental=getattr(service, "persist_incremental",
+                                          False))
     upgrade_manager = UPGRADE_MANAGERS[service.service_name]
     if os.path.exists(service.persist_filename):
         upgrade_manager.apply(persist)
@@ -1,14 +1,21 @@
 import subprocess
 
-from twisted.python.compat import itervalues
+from twisted.python.compat import iteritems
 
-from landscape.client.diff import diff
 from landscape.lib.process import ProcessInformation
 from landscape.lib.jiffies import detect_jiffies
 from landscape.client.monitor.plugin import DataWatcher
 
 
 class ActiveProcessInfo(DataWatcher):
+    """Report the processes running on the system, and changes to them.
+
+    The processes reported to the server are kept in a table of compact
+    L{ProcessRecord}s, indexed by process ID. A process whose record is
+    the same as the reported one, including its start time, is left out
+    of the message, and only the records which changed are kept until the
+    message has been sent.
+    """
 
     message_type = "active-process-info"
     scope = "process"
@@ -17,8 +24,8 @@ class ActiveProcessInfo(DataWatcher):
                  uptime=None, popen=subprocess.Popen):
         super(ActiveProcessInfo, self).__init__()
         self._proc_dir = proc_dir
-        self._persist_processes = {}
-        self._previous_processes = {}
+        self._processes = {}
+        self._pending_processes = {}
         self._jiffies_per_sec = jiffies or detect_jiffies()
         self._popen = popen
         self._first_run = True
@@ -34,8 +41,8 @@ class ActiveProcessInfo(DataWatcher):
     def _reset(self):
         """Reset active process data."""
         self._first_run = True
-        self._persist_processes = {}
-        self._previous_processes = {}
+        self._processes = {}
+        self._pending_processes = {}
 
     def get_message(self):
         message = {}
@@ -50,31 +57,59 @@ class ActiveProcessInfo(DataWatcher):
 
     def persist_data(self):
         self._first_run = False
-        self._persist_processes = self._previous_processes
-        self._previous_processes = {}
+        for process_id, record in iteritems(self._pending_processes):
+            if record is None:
+                del self._processes[process_id]
+            else:
+                self._processes[process_id] = record
+        self._pending_processes = {}
         # This forces the registry to write the persistent store to disk
         # This means that the persistent data reflects the state of the
         # messages sent.
         self.registry.flush()
 
-    def _get_processes(self):
-        processes = {}
-        for process_info in self._process_info.get_all_process_info():
-            if process_info["state"] != b"X":
-                processes[process_info["pid"]] = process_info
-        return processes
-
     def _detect_process_changes(self):
+        """Compare the running processes with the reported ones.
+
+        A process ID which is reused by a new process is reported as an
+        update, since its record has a different start time.
+
+        The changed records are kept, with C{None} for the processes which
+        are gone, to be applied by L{persist_data}.
+        """
         changes = {}
-        processes = self._get_processes()
-        creates, updates, deletes = diff(self._persist_processes, processes)
+        processes = self._processes
+        pending = {}
+        creates = []
+        updates = []
+        running = set()
+        for record in self._process_info.get_all_process_records():
+            if record.state == b"X":
+                continue
+            process_id = record.pid
+            running.add(process_id)
+            reported = processes.get(process_id)
+            if reported == record:
+                continue
+            pending[process_id] = record
+            process_info = self._process_info.get_record_info(record)
+            if reported is None:
+                creates.append(process_info)
+            else:
+                updates.append(process_info)
+        deletes = [
+            process_id for process_id in processes
+            if process_id not in running]
+        for process_id in deletes:
+            pending[process_id] = None
+
         if creates:
-            changes["add-processes"] = list(itervalues(creates))
+            changes["add-processes"] = creates
         if updates:
-            changes["update-processes"] = list(itervalues(updates))
+            changes["update-processes"] = updates
         if deletes:
-            changes["kill-processes"] = list(deletes)
+            changes["kill-processes"] = deletes
 
-        # Update cached values for use on the next run.
-        self._previous_processes = processes
+        # Keep the changes until the message is sent.
+        self._pending_processes = pending
         return changes
@@ -1,19 +1,43 @@
 import codecs
+import logging
 import time
 import os
 
-from landscape.client.accumulate import Accumulator
-from landscape.lib.disk import get_mount_info, is_device_removable
+from collections import OrderedDict
+
+from twisted.internet.defer import Deferred, gatherResults
+from twisted.python.failure import Failure
+
+from landscape.client.accumulate import BatchAccumulator
+from landscape.lib.disk import get_mounts, get_mount_space, is_device_removable
 from landscape.lib.monitor import CoverageMonitor
 from landscape.client.monitor.plugin import MonitorPlugin
 
 
 class MountInfo(MonitorPlugin):
+    """Report the mounted filesystems, and the free space on them.
+
+    Mount points are probed with C{statvfs} in a pool of at most
+    C{max_probe_threads} threads of their own, so that a hung network
+    filesystem blocks neither the monitor nor the other users of the
+    reactor's thread pool. A mount point which doesn't answer within
+    C{statvfs_timeout} seconds is stale: it's left out of the reports, and
+    it isn't probed again for C{stale_mount_backoff} seconds, doubling up
+    to C{max_stale_mount_backoff} while it stays stale.
+
+    The probes which don't get a thread within C{statvfs_timeout} seconds,
+    because the threads are all taken by hung probes, are skipped until the
+    next run, without their mount points being considered stale.
+    """
 
     persist_name = "mount-info"
     scope = "disk"
 
     max_free_space_items_to_exchange = 200
+    statvfs_timeout = 10
+    stale_mount_backoff = 600
+    max_stale_mount_backoff = 6 * 60 * 60
+    max_probe_threads = 5
 
     def __init__(self, interval=300, monitor_interval=60 * 60,
                  mounts_file="/proc/mounts", create_time=time.time,
@@ -29,12 +53,22 @@ class MountInfo(MonitorPlugin):
         self._create_time = create_time
         self._free_space = []
         self._mount_info = []
+        self._pending_mount_info = set()
+        self._persisted_mount_info = None
         self._mount_info_to_persist = None
+        self._mtab_data = None
+        self._bound_mount_points = set()
+        self._stale_mounts = {}
+        # The mount points probed in a thread, and the ones waiting for one.
+        self._probing_mounts = set()
+        self._queued_probes = OrderedDict()
+        self._probe_pool = None
         self.is_device_removable = is_device_removable
 
     def register(self, registry):
         super(MountInfo, self).register(registry)
-        self._accumulate = Accumulator(self._persist, self.registry.step_size)
+        self._accumulate = BatchAccumulator(
+            self._persist, self.registry.step_size, "free-space-accumulator")
         self._monitor = CoverageMonitor(self.run_interval, 0.8,
                                         "mount info snapshot",
                                         create_time=self._create_time)
@@ -43,6 +77,10 @@ class MountInfo(MonitorPlugin):
         self.registry.reactor.call_on("stop", self._monitor.log, priority=2000)
         self.call_on_accepted("mount-info", self.send_messages, True)
 
+    def _reset(self):
+        super(MountInfo, self)._reset()
+        self._persisted_mount_info = None
+
     def create_messages(self):
         return [message
                 for message in [self.create_mount_info_message(),
@@ -54,6 +92,7 @@ class MountInfo(MonitorPlugin):
             message = {"type": "mount-info", "mount-info": self._mount_info}
             self._mount_info_to_persist = self._mount_info[:]
             self._mount_info = []
+            self._pending_mount_info = set()
             return message
         return None
 
@@ -80,9 +119,11 @@ class MountInfo(MonitorPlugin):
                                               self.send_messages)
 
     def persist_mount_info(self):
+        persisted_mount_info = self._get_persisted_mount_info()
         for timestamp, mount_info in self._mount_info_to_persist:
             mount_point = mount_info["mount-point"]
             self._persist.set(("mount-info", mount_point), mount_info)
+            persisted_mount_info[mount_point] = mount_info
         self._mount_info_to_persist = None
         # This forces the registry to write the persistent store to disk
         # This means that the persistent data reflects the state of the
@@ -92,51 +133,168 @@ class MountInfo(MonitorPlugin):
     def run(self):
         self._monitor.ping()
         now = int(self._create_time())
+        probes = []
+        for device, mount_point, filesystem in self._get_mounts():
+            probe = self._probe_mount(device, mount_point, filesystem)
+            if probe is not None:
+                probes.append(probe)
+        result = gatherResults(probes, consumeErrors=True)
+        result.addCallback(self._record_mount_info, now)
+        return result
+
+    def _get_persisted_mount_info(self):
+        """
+        Return the persisted mount information, indexed by mount point.
+
+        The index is read from the persist once, and then kept up to date
+        by L{persist_mount_info}.
+        """
+        if self._persisted_mount_info is None:
+            self._persisted_mount_info = self._persist.get("mount-info", {})
+        return self._persisted_mount_info
+
+    def _record_mount_info(self, mount_infos, now):
+        persisted_mount_info = self._get_persisted_mount_info()
         current_mount_points = set()
-        for mount_info in self._get_mount_info():
+        mount_infos = [
+            mount_info for mount_info in mount_infos if mount_info is not None]
+        all_step_data = self._accumulate(now, [
+            (("accumulate-free-space", mount_info["mount-point"]),
+             mount_info.pop("free-space"))
+            for mount_info in mount_infos])
+        for mount_info, step_data in zip(mount_infos, all_step_data):
             mount_point = mount_info["mount-point"]
-            free_space = mount_info.pop("free-space")
-
-            key = ("accumulate-free-space", mount_point)
-            step_data = self._accumulate(now, free_space, key)
             if step_data:
                 timestamp = step_data[0]
                 free_space = int(step_data[1])
                 self._free_space.append((timestamp, mount_point, free_space))
 
-            prev_mount_info = self._persist.get(("mount-info", mount_point))
+            prev_mount_info = persisted_mount_info.get(mount_point)
             if not prev_mount_info or prev_mount_info != mount_info:
-                if mount_info not in [m for t, m in self._mount_info]:
+                key = tuple(sorted(mount_info.items()))
+                if key not in self._pending_mount_info:
+                    self._pending_mount_info.add(key)
                     self._mount_info.append((now, mount_info))
 
             current_mount_points.add(mount_point)
 
-    def _get_mount_info(self):
+    def _probe_mount(self, device, mount_point, filesystem):
+        """Call C{statvfs} on a mount point in a thread, with a timeout.
+
+        @return: A L{Deferred} firing with the information about the mount
+            point, or with C{None} if it failed, timed out or didn't get a
+            thread in time. C{None} is returned instead if the mount point
+            is stale, or if a previous probe is still hung or waiting.
+        """
+        reactor = self.registry.reactor
+        if (mount_point in self._probing_mounts or
+                mount_point in self._queued_probes):
+            return None
+        stale = self._stale_mounts.get(mount_point)
+        if stale is not None and reactor.time() < stale[0]:
+            return None
+
+        deferred = Deferred()
+        calls = []
+
+        def not_started():
+            del self._queued_probes[mount_point]
+            logging.warning(
+                "Mount point %s wasn't probed, all the %d probe threads are "
+                "busy.", mount_point, self.max_probe_threads)
+            deferred.callback(None)
+
+        def timed_out():
+            if stale is None:
+                backoff = self.stale_mount_backoff
+            else:
+                backoff = min(stale[1] * 2, self.max_stale_mount_backoff)
+            self._stale_mounts[mount_point] = (reactor.time() + backoff,
+                                               backoff)
+            logging.warning(
+                "Mount point %s didn't respond in %d seconds, it won't be "
+                "reported for %d seconds.", mount_point,
+                self.statvfs_timeout, backoff)
+            deferred.callback(None)
+
+        def done():
+            self._probing_mounts.discard(mount_point)
+            self._start_probes()
+            if deferred.called:
+                return False
+            reactor.cancel_call(calls[-1])
+            return True
+
+        def probed(stats):
+            if not done():
+                return
+            if self._stale_mounts.pop(mount_point, None) is not None:
+                logging.info("Mount point %s is responding again.",
+                             mount_point)
+            deferred.callback(
+                get_mount_space(device, mount_point, filesystem, stats))
+
+        def failed(exc_type, exc_value, exc_tb):
+            if not done():
+                return
+            if issubclass(exc_type, OSError):
+                deferred.callback(None)
+            else:
+                deferred.errback(Failure(exc_value, exc_type, exc_tb))
+
+        def start():
+            reactor.cancel_call(calls[-1])
+            calls.append(reactor.call_later(self.statvfs_timeout, timed_out))
+            self._probing_mounts.add(mount_point)
+            reactor.call_in_pool(self._probe_pool, probed, failed,
+                                 self._statvfs, mount_point)
+
+        calls.append(reactor.call_later(self.statvfs_timeout, not_started))
+        self._queued_probes[mount_point] = start
+        self._start_probes()
+        return deferred
+
+    def _start_probes(self):
+        """Start the queued probes, as long as there are threads for them.
+        """
+        if self._probe_pool is None:
+            self._probe_pool = self.registry.reactor.create_thread_pool(
+                self.max_probe_threads, "mount-info-probes")
+        while (self._queued_probes and
+               len(self._probing_mounts) < self.max_probe_threads):
+            mount_point, start = self._queued_probes.popitem(last=False)
+            start()
+
+    def _get_mounts(self):
         """Generator yields local mount points worth recording data for."""
         bound_mount_points = self._get_bound_mount_points()
 
-        for info in get_mount_info(self._mounts_file, self._statvfs):
-            device = info["device"]
-            mount_point = info["mount-point"]
+        for device, mount_point, filesystem in get_mounts(self._mounts_file):
             if (device.startswith("/dev/") and
                 not mount_point.startswith("/dev/") and
                 not self.is_device_removable(device) and
                 mount_point not in bound_mount_points
                 ):
 
-                yield info
+                yield device, mount_point, filesystem
 
     def _get_bound_mount_points(self):
         """
         Returns a set of mount points that have the "bind" option
         by parsing /etc/mtab.
+
+        The file is parsed again only when its content changed.
         """
-        bound_points = set()
         if not self._mtab_file or not os.path.isfile(self._mtab_file):
-            return bound_points
+            return set()
+
+        with open(self._mtab_file, "r") as file:
+            data = file.read()
+        if data == self._mtab_data:
+            return self._bound_mount_points
 
-        file = open(self._mtab_file, "r")
-        for line in file:
+        bound_points = set()
+        for line in data.splitlines():
             try:
                 device, mount_point, filesystem, options = line.split()[:4]
                 mount_point = codecs.decode(mount_point, "unicode_escape")
@@ -144,4 +302,6 @@ class MountInfo(MonitorPlugin):
                 continue
             if "bind" in options.split(","):
                 bound_points.add(mount_point)
+        self._mtab_data = data
+        self._bound_mount_points = bound_points
         return bound_points
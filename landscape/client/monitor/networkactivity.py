@@ -6,7 +6,7 @@ with the inbound/outbound traffic per interface per step interval.
 import time
 
 from landscape.lib.network import get_network_traffic, is_64
-from landscape.client.accumulate import Accumulator
+from landscape.client.accumulate import BatchAccumulator
 
 from landscape.client.monitor.plugin import MonitorPlugin
 
@@ -38,7 +38,8 @@ class NetworkActivity(MonitorPlugin):
 
     def register(self, registry):
         super(NetworkActivity, self).register(registry)
-        self._accumulate = Accumulator(self._persist, self.registry.step_size)
+        self._accumulate = BatchAccumulator(
+            self._persist, self.registry.step_size, "traffic-accumulator")
         self.call_on_accepted("network-activity", self.exchange, True)
 
     def create_message(self):
@@ -112,12 +113,15 @@ class NetworkActivity(MonitorPlugin):
         """
         new_timestamp = int(self._create_time())
         new_traffic = get_network_traffic(self._source_file)
-        for interface, delta_out, delta_in in self._traffic_delta(new_traffic):
-            out_step_data = self._accumulate(
-                new_timestamp, delta_out, "delta-out-%s" % interface)
-
-            in_step_data = self._accumulate(
-                new_timestamp, delta_in, "delta-in-%s" % interface)
+        deltas = list(self._traffic_delta(new_traffic))
+        items = []
+        for interface, delta_out, delta_in in deltas:
+            items.append(("delta-out-%s" % interface, delta_out))
+            items.append(("delta-in-%s" % interface, delta_in))
+        all_step_data = self._accumulate(new_timestamp, items)
+        for i, (interface, delta_out, delta_in) in enumerate(deltas):
+            out_step_data = all_step_data[2 * i]
+            in_step_data = all_step_data[2 * i + 1]
 
             # there's only data when we cross a step boundary
             if not (in_step_data and out_step_data):
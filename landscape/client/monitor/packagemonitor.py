@@ -1,6 +1,9 @@
 import logging
 import os
 
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.protocol import ProcessProtocol
 from twisted.internet.utils import getProcessOutput
 
 from landscape.lib.apt.package.store import PackageStore
@@ -15,6 +18,9 @@ class PackageMonitor(MonitorPlugin):
     scope = "package"
 
     _reporter_command = None
+    # The ResidentReporterProtocol of the resident reporter, while it's
+    # running.
+    _resident_reporter = None
 
     def __init__(self, package_store_filename=None):
         super(PackageMonitor, self).__init__()
@@ -40,6 +46,8 @@ class PackageMonitor(MonitorPlugin):
                                   self._enqueue_message_as_reporter_task)
         registry.reactor.call_on("server-uuid-changed",
                                  self._server_uuid_changed)
+        registry.reactor.call_on("package-reporter-run",
+                                 self._package_reporter_run)
         self.call_on_accepted("packages", self.spawn_reporter)
         self.run()
 
@@ -118,11 +126,19 @@ class PackageMonitor(MonitorPlugin):
             else:
                 env["FAKE_GLOBAL_PACKAGE_STORE"] = "1"
 
+        resident = self.config.package_reporter_resident
+        if resident and self._resident_reporter is not None:
+            # The reporter is already running, just wake it up.
+            self._resident_reporter.wake_up()
+            return succeed(None)
+
         if self._reporter_command is None:
             self._reporter_command = find_reporter_command(self.config)
         # path is set to None so that getProcessOutput does not
         # chdir to "." see bug #211373
         env = encode_values(env)
+        if resident:
+            return self._spawn_resident_reporter(args, env)
         result = getProcessOutput(self._reporter_command,
                                   args=args, env=env,
                                   errortoo=1,
@@ -130,6 +146,35 @@ class PackageMonitor(MonitorPlugin):
         result.addCallback(self._got_reporter_output)
         return result
 
+    def _spawn_resident_reporter(self, args, env):
+        """Start a reporter which keeps running until we go away.
+
+        Its output is logged as it comes, rather than collected until it
+        exits like for other runs, and its standard input is kept open, since
+        the reporter exits once it gets closed.
+        """
+        exited = Deferred()
+        exited.addBoth(self._resident_reporter_exited)
+        self._resident_reporter = ResidentReporterProtocol(exited)
+        reactor.spawnProcess(
+            self._resident_reporter, self._reporter_command,
+            args=[self._reporter_command] + args, env=env, path=None)
+        return succeed(None)
+
+    def _resident_reporter_exited(self, passthrough):
+        """Start a new resident reporter the next time one is needed."""
+        self._resident_reporter = None
+        return passthrough
+
+    def _package_reporter_run(self):
+        """Called when the broker sends a package-reporter-run event.
+
+        The changer asks for the resident reporter to run this way, since
+        it can't start another reporter while the resident one is running.
+        """
+        if self.config.package_reporter_resident:
+            return self.spawn_reporter()
+
     def _got_reporter_output(self, output):
         if output:
             logging.warning("Package reporter output:\n%s" % output)
@@ -161,3 +206,28 @@ class PackageMonitor(MonitorPlugin):
         # so we don't clear our knowledge.
         if old_uuid is not None:
             self._package_store.clear_hash_ids()
+
+
+class ResidentReporterProtocol(ProcessProtocol):
+    """Wake up the resident reporter, log its output and notice when it
+    exits.
+
+    @param deferred: A deferred fired when the reporter exits.
+    """
+
+    def __init__(self, deferred):
+        self._deferred = deferred
+
+    def wake_up(self):
+        """Ask the reporter to run, by writing a line to its standard input.
+        """
+        self.transport.write(b"\n")
+
+    def outReceived(self, data):
+        logging.warning("Package reporter output:\n%s" %
+                        data.decode("utf-8", "replace"))
+
+    errReceived = outReceived
+
+    def processEnded(self, reason):
+        self._deferred.callback(None)
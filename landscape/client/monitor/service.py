@@ -18,6 +18,7 @@ class MonitorService(LandscapeService):
     """
 
     service_name = Monitor.name
+    persist_incremental = True
 
     def __init__(self, config):
         self.persist_filename = os.path.join(
@@ -253,6 +253,64 @@ class ActiveProcessInfoTest(LandscapeTest):
         plugin.exchange()
         self.assertEqual(len(self.mstore.get_pending_messages()), 1)
 
+    def test_only_report_changed_processes(self):
+        """
+        Processes which didn't change since they were reported are left out
+        of the message, while the changed ones are reported in full.
+        """
+        self.builder.create_data(671, self.builder.RUNNING, uid=1000,
+                                 gid=1000, started_after_boot=1010,
+                                 process_name="blargh")
+        self.builder.create_data(672, self.builder.RUNNING, uid=1000,
+                                 gid=1000, started_after_boot=1020,
+                                 process_name="blarpy")
+        plugin = ActiveProcessInfo(proc_dir=self.sample_dir, uptime=100,
+                                   jiffies=10, boot_time=0)
+        self.monitor.add(plugin)
+        plugin.exchange()
+
+        self.builder.remove_data(672)
+        self.builder.create_data(672, self.builder.SLEEPING, uid=1000,
+                                 gid=1000, started_after_boot=1020,
+                                 process_name="blarpy")
+        plugin.exchange()
+        plugin.exchange()
+
+        messages = self.mstore.get_pending_messages()
+        self.assertEqual(2, len(messages))
+        self.assertNotIn("add-processes", messages[1])
+        self.assertNotIn("kill-processes", messages[1])
+        self.assertEqual([{"state": b"S", "gid": 1000, "pid": 672,
+                           "vm-size": 11676, "name": "blarpy",
+                           "uid": 1000, "start-time": 102,
+                           "percent-cpu": 0.0}],
+                         messages[1]["update-processes"])
+
+    def test_reused_process_id(self):
+        """
+        A process ID which is reused by a new process is reported as an
+        update, with the start time of the new process.
+        """
+        self.builder.create_data(671, self.builder.RUNNING, uid=1000,
+                                 gid=1000, started_after_boot=1010,
+                                 process_name="blargh")
+        plugin = ActiveProcessInfo(proc_dir=self.sample_dir, uptime=100,
+                                   jiffies=10, boot_time=0)
+        self.monitor.add(plugin)
+        plugin.exchange()
+
+        self.builder.remove_data(671)
+        self.builder.create_data(671, self.builder.RUNNING, uid=1000,
+                                 gid=1000, started_after_boot=1050,
+                                 process_name="blargh")
+        plugin.exchange()
+
+        message = self.mstore.get_pending_messages()[1]
+        self.assertNotIn("kill-processes", message)
+        self.assertEqual([671], [process["pid"]
+                                 for process in message["update-processes"]])
+        self.assertEqual(105, message["update-processes"][0]["start-time"])
+
     def test_only_report_active_processes(self):
         """Test ensures the plugin only reports active processes."""
         self.builder.create_data(672, self.builder.DEAD,
@@ -367,18 +425,16 @@ class ActiveProcessInfoTest(LandscapeTest):
                                    jiffies=10, boot_time=0)
         self.monitor.add(plugin)
 
+        def get_pending_messages():
+            messages = self.mstore.get_pending_messages()
+            for message in messages:
+                message["add-processes"].sort(key=operator.itemgetter("pid"))
+            return messages
+
         plugin.exchange()
-        messages = self.mstore.get_pending_messages()
+        messages = get_pending_messages()
 
         expected_messages = [{"add-processes": [
-                               {"gid": 1000,
-                                "name": u"blarpy",
-                                "pid": 672,
-                                "start-time": 112,
-                                "state": b"t",
-                                "uid": 1000,
-                                "vm-size": 11676,
-                                "percent-cpu": 0.0},
                                {"gid": 0,
                                 "name": u"init",
                                 "pid": 1,
@@ -394,6 +450,14 @@ class ActiveProcessInfoTest(LandscapeTest):
                                 "state": b"T",
                                 "uid": 1000,
                                 "vm-size": 11676,
+                                "percent-cpu": 0.0},
+                               {"gid": 1000,
+                                "name": u"blarpy",
+                                "pid": 672,
+                                "start-time": 112,
+                                "state": b"t",
+                                "uid": 1000,
+                                "vm-size": 11676,
                                 "percent-cpu": 0.0}],
                               "kill-all-processes": True,
                               "type": "active-process-info"}]
@@ -401,14 +465,14 @@ class ActiveProcessInfoTest(LandscapeTest):
         self.assertMessages(messages, expected_messages)
 
         plugin.exchange()
-        messages = self.mstore.get_pending_messages()
+        messages = get_pending_messages()
         # No new messages should be pending
         self.assertMessages(messages, expected_messages)
 
         process_scope = ["process"]
         self.reactor.fire("resynchronize", process_scope)
         plugin.exchange()
-        messages = self.mstore.get_pending_messages()
+        messages = get_pending_messages()
         # The resynchronisation should cause the same messages to be generated
         # again.
         expected_messages.extend(expected_messages)
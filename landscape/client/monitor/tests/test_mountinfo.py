@@ -464,6 +464,51 @@ addr=ennui 0 0
                                "filesystem": "ext3"}),
                           ])
 
+    def test_bind_mounts_parsed_on_change(self):
+        """
+        The mtab file is only parsed again when its content changed.
+        """
+        mtab_filename = self.makeFile("/dev/hda1 / ext3 rw 0 0\n"
+                                      "/opt /mnt none rw,bind 0 0\n")
+        plugin = self.get_mount_info(mtab_file=mtab_filename)
+        bound_mount_points = plugin._get_bound_mount_points()
+        self.assertEqual({"/mnt"}, bound_mount_points)
+        with mock.patch("codecs.decode") as decode_mock:
+            self.assertIs(bound_mount_points,
+                          plugin._get_bound_mount_points())
+        self.assertFalse(decode_mock.called)
+
+        self.makeFile("/dev/hda1 / ext3 rw 0 0\n"
+                      "/opt /mnt none rw,bind 0 0\n"
+                      "/srv /var/srv none rw,bind 0 0\n",
+                      path=mtab_filename)
+        self.assertEqual({"/mnt", "/var/srv"},
+                         plugin._get_bound_mount_points())
+
+    def test_pending_mount_info_is_not_duplicated(self):
+        """
+        A mount point which is already waiting to be sent isn't queued
+        again, while a change after it was sent is.
+        """
+        plugin = self.get_mount_info(statvfs=statvfs_result_fixture,
+                                     create_time=self.reactor.time)
+        self.monitor.add(plugin)
+        plugin.run()
+        plugin.run()
+        self.assertEqual(1, len(plugin._mount_info))
+
+        plugin.create_mount_info_message()
+        plugin.persist_mount_info()
+        plugin.run()
+        self.assertEqual([], plugin._mount_info)
+
+        plugin._statvfs = lambda path: os.statvfs_result(
+            (4096, 0, mb(2000), mb(100), 0, 0, 0, 0, 0, 0))
+        plugin.run()
+        self.assertEqual([4096000 * 2],
+                         [info["total-space"]
+                          for timestamp, info in plugin._mount_info])
+
     def test_no_mtab_file(self):
         """
         If there's no mtab file available, then we can make no guesses about
@@ -636,3 +681,162 @@ addr=ennui 0 0
         self.assertEqual(len(messages), 0)
 
         plugin.registry.flush.assert_called_with()
+
+    def hang_mount_point(self, *mount_points):
+        """
+        Make the C{statvfs} probes of C{mount_points} hang, and return the
+        list of their callbacks, to be called when they stop hanging.
+        """
+        hung = []
+        call_in_thread = self.reactor.call_in_thread
+
+        def fake_call_in_thread(callback, errback, f, *args, **kwargs):
+            if args[0] in mount_points:
+                hung.append(callback)
+            else:
+                call_in_thread(callback, errback, f, *args, **kwargs)
+
+        self.reactor.call_in_thread = fake_call_in_thread
+        return hung
+
+    def get_stale_mount_info(self):
+        """Return a plugin with a / mount point and a stale /srv one."""
+        filename = self.makeFile("/dev/hda1 / ext4 rw 0 0\n"
+                                 "/dev/hdb1 /srv ext4 rw 0 0\n")
+        plugin = self.get_mount_info(
+            mounts_file=filename, mtab_file=filename, interval=100000,
+            statvfs=statvfs_result_fixture, create_time=self.reactor.time)
+        self.monitor.add(plugin)
+        return plugin
+
+    def test_hung_mount_point(self):
+        """
+        A mount point whose C{statvfs} call doesn't return before the
+        timeout is left out, while the other ones are reported.
+        """
+        plugin = self.get_stale_mount_info()
+        hung = self.hang_mount_point("/srv")
+        result = plugin.run()
+        self.assertNoResult(result)
+        self.assertEqual(1, len(hung))
+
+        self.reactor.advance(plugin.statvfs_timeout)
+        self.successResultOf(result)
+        message = plugin.create_mount_info_message()
+        self.assertEqual(["/"], [info["mount-point"]
+                                 for timestamp, info in message["mount-info"]])
+        self.assertIn("Mount point /srv didn't respond in 10 seconds, it "
+                      "won't be reported for 600 seconds.",
+                      self.logfile.getvalue())
+
+    def test_stale_mount_point_backoff(self):
+        """
+        A stale mount point isn't probed again while its probe hangs, nor
+        before its backoff expires, which doubles each time it times out.
+        """
+        plugin = self.get_stale_mount_info()
+        hung = self.hang_mount_point("/srv")
+        plugin.run()
+        self.reactor.advance(plugin.statvfs_timeout)
+
+        plugin.run()
+        self.assertEqual(1, len(hung))
+        # A late result is ignored.
+        hung[0](statvfs_result_fixture("/srv"))
+        plugin.run()
+        self.assertEqual(1, len(hung))
+        message = plugin.create_mount_info_message()
+        self.assertNotIn("/srv", [info["mount-point"] for timestamp, info
+                                  in message["mount-info"]])
+
+        self.reactor.advance(plugin.stale_mount_backoff)
+        plugin.run()
+        self.assertEqual(2, len(hung))
+        self.reactor.advance(plugin.statvfs_timeout)
+        self.assertIn("it won't be reported for 1200 seconds.",
+                      self.logfile.getvalue())
+
+    def test_stale_mount_point_recovers(self):
+        """
+        A stale mount point which responds again after its backoff is
+        reported again.
+        """
+        plugin = self.get_stale_mount_info()
+        hung = self.hang_mount_point("/srv")
+        plugin.run()
+        self.reactor.advance(plugin.statvfs_timeout)
+        hung[0](statvfs_result_fixture("/srv"))
+
+        del self.reactor.call_in_thread
+        self.reactor.advance(plugin.stale_mount_backoff)
+        plugin.run()
+        message = plugin.create_mount_info_message()
+        self.assertIn("/srv", [info["mount-point"]
+                               for timestamp, info in message["mount-info"]])
+        self.assertIn("Mount point /srv is responding again.",
+                      self.logfile.getvalue())
+
+    def test_more_hung_mount_points_than_probe_threads(self):
+        """
+        Mount points are probed in at most C{max_probe_threads} threads.
+        The probes which don't get a thread in time, because hung probes
+        hold them all, are skipped without their mount points being
+        considered stale, and they're tried again once threads free up.
+        """
+        filename = self.makeFile("/dev/hda1 /a ext4 rw 0 0\n"
+                                 "/dev/hdb1 /b ext4 rw 0 0\n"
+                                 "/dev/hdc1 /c ext4 rw 0 0\n"
+                                 "/dev/hdd1 / ext4 rw 0 0\n")
+        plugin = self.get_mount_info(
+            mounts_file=filename, mtab_file=filename, interval=100000,
+            statvfs=statvfs_result_fixture, create_time=self.reactor.time)
+        plugin.max_probe_threads = 2
+        self.monitor.add(plugin)
+        hung = self.hang_mount_point("/a", "/b", "/c")
+        result = plugin.run()
+        self.assertEqual(2, len(hung))
+        self.assertEqual({"/a", "/b"}, plugin._probing_mounts)
+
+        self.reactor.advance(plugin.statvfs_timeout)
+        self.successResultOf(result)
+        self.assertEqual(["/a", "/b"], sorted(plugin._stale_mounts))
+        self.assertEqual({}, plugin._queued_probes)
+        self.assertIn("Mount point /c wasn't probed, all the 2 probe threads "
+                      "are busy.", self.logfile.getvalue())
+        self.assertIn("Mount point / wasn't probed", self.logfile.getvalue())
+
+        # The hung probes return, freeing their threads.
+        hung[0](statvfs_result_fixture("/a"))
+        hung[1](statvfs_result_fixture("/b"))
+        self.assertEqual(set(), plugin._probing_mounts)
+        result = plugin.run()
+        self.assertEqual(3, len(hung))
+        self.assertEqual({"/c"}, plugin._probing_mounts)
+        self.reactor.advance(plugin.statvfs_timeout)
+        self.successResultOf(result)
+        message = plugin.create_mount_info_message()
+        self.assertEqual(["/"], [info["mount-point"]
+                                 for timestamp, info in message["mount-info"]])
+
+    def test_failed_mount_point(self):
+        """
+        A mount point whose C{statvfs} call fails is skipped, without
+        being considered stale.
+        """
+        filename = self.makeFile("/dev/hda1 / ext4 rw 0 0\n"
+                                 "/dev/hdb1 /srv ext4 rw 0 0\n")
+
+        def statvfs(path):
+            if path == "/srv":
+                raise OSError("Permission denied")
+            return statvfs_result_fixture(path)
+
+        plugin = self.get_mount_info(
+            mounts_file=filename, mtab_file=filename, interval=100000,
+            statvfs=statvfs, create_time=self.reactor.time)
+        self.monitor.add(plugin)
+        plugin.run()
+        message = plugin.create_mount_info_message()
+        self.assertEqual(["/"], [info["mount-point"]
+                                 for timestamp, info in message["mount-info"]])
+        self.assertEqual({}, plugin._stale_mounts)
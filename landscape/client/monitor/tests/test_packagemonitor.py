@@ -1,6 +1,7 @@
 import os
 import mock
 
+from twisted.internet import reactor
 from twisted.internet.defer import Deferred
 
 from landscape.lib.apt.package.store import PackageStore
@@ -200,6 +201,81 @@ class PackageMonitorTest(LandscapeTest):
 
         return result.addCallback(got_result)
 
+    def test_spawn_resident_reporter(self):
+        """
+        With C{package_reporter_resident} set, the reporter is only started
+        once, and woken up by writing a line to its standard input while
+        it's running.
+        """
+        self.config.package_reporter_resident = True
+        package_monitor = PackageMonitor(self.package_store_filename)
+        self.monitor.add(package_monitor)
+        with mock.patch.object(reactor, "spawnProcess") as spawn_mock:
+            spawn_mock.side_effect = (
+                lambda protocol, *args, **kwargs:
+                protocol.makeConnection(mock.Mock()))
+            package_monitor.spawn_reporter()
+            package_monitor.spawn_reporter()
+            self.assertEqual(1, spawn_mock.call_count)
+            protocol = spawn_mock.call_args[0][0]
+            protocol.transport.write.assert_called_once_with(b"\n")
+
+            # Once the reporter exits, a new one is started.
+            protocol.processEnded(None)
+            package_monitor.spawn_reporter()
+            self.assertEqual(2, spawn_mock.call_count)
+            self.assertEqual(1, protocol.transport.write.call_count)
+
+    def test_package_reporter_run(self):
+        """
+        A C{package-reporter-run} event, which the broker broadcasts when
+        the changer asks for the reporter to run, wakes up the resident
+        reporter.
+        """
+        self.config.package_reporter_resident = True
+        package_monitor = PackageMonitor(self.package_store_filename)
+        self.monitor.add(package_monitor)
+        with mock.patch.object(package_monitor, "spawn_reporter") as spawn:
+            self.monitor.reactor.fire("package-reporter-run")
+        spawn.assert_called_once_with()
+
+    def test_package_reporter_run_not_resident(self):
+        """
+        A C{package-reporter-run} event is ignored when the reporter isn't
+        resident, since the changer starts it by itself then.
+        """
+        package_monitor = PackageMonitor(self.package_store_filename)
+        self.monitor.add(package_monitor)
+        with mock.patch.object(package_monitor, "spawn_reporter") as spawn:
+            self.monitor.reactor.fire("package-reporter-run")
+        self.assertFalse(spawn.called)
+
+    def test_spawn_resident_reporter_logs_output(self):
+        """
+        The output of the resident reporter is logged as it comes, since it
+        only exits when the monitor goes away, and it gets woken up through
+        its standard input.
+        """
+        self.write_script(
+            self.config,
+            "landscape-package-reporter",
+            "#!/bin/sh\necho RESIDENT OUTPUT\nread line\necho WOKEN UP\n")
+        self.config.package_reporter_resident = True
+        package_monitor = PackageMonitor(self.package_store_filename)
+        self.monitor.add(package_monitor)
+        self.successResultOf(package_monitor.spawn_reporter())
+        exited = package_monitor._resident_reporter._deferred
+        self.successResultOf(package_monitor.spawn_reporter())
+
+        def got_result(result):
+            self.assertIn("Package reporter output:\nRESIDENT OUTPUT",
+                          self.logfile.getvalue())
+            # The output of both runs may come in at once.
+            self.assertIn("WOKEN UP", self.logfile.getvalue())
+            self.assertIs(None, package_monitor._resident_reporter)
+
+        return exited.addCallback(got_result)
+
     def test_call_on_accepted(self):
         with mock.patch.object(self.package_monitor, 'spawn_reporter') as mkd:
             self.monitor.add(self.package_monitor)
@@ -98,6 +98,11 @@ class PackageChanger(PackageTaskHandler):
             # Nothing was done
             return
 
+        if self._config.package_reporter_resident:
+            # The reporter started by the package monitor is still running
+            # and holds the reporter lock, so have the monitor wake it up.
+            return self._broker.fire_event("package-reporter-run")
+
         if os.getuid() == 0:
             os.setgid(grp.getgrnam("landscape").gr_gid)
             os.setuid(pwd.getpwnam("landscape").pw_uid)
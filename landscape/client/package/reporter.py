@@ -13,6 +13,8 @@ import re
 
 from twisted.internet.defer import (
     Deferred, succeed, inlineCallbacks, returnValue)
+from twisted.internet.protocol import Protocol
+from twisted.internet.stdio import StandardIO
 
 from landscape.lib import bpickle
 from landscape.lib.apt.package.store import (
@@ -22,6 +24,7 @@ from landscape.lib.sequenceranges import sequence_to_ranges
 from landscape.lib.twisted_util import gather_results, spawn_process
 from landscape.lib.fetch import fetch_async
 from landscape.lib.fs import touch_file, create_binary_file
+from landscape.lib.log import log_failure
 from landscape.lib.lsb_release import parse_lsb_release, LSB_RELEASE_FILENAME
 from landscape.client.package.taskhandler import (
     PackageTaskHandlerConfiguration, PackageTaskHandler, run_task_handler)
@@ -67,8 +70,16 @@ class PackageReporter(PackageTaskHandler):
     sources_list_filename = "/etc/apt/sources.list"
     sources_list_directory = "/etc/apt/sources.list.d"
     _got_task = False
+    # The state of the package files when the channels were last loaded, in
+    # resident mode.
+    _channels_state = None
 
     def run(self):
+        if self._config.package_reporter_resident:
+            return self.run_resident()
+        return self.run_once()
+
+    def run_once(self):
         self._got_task = False
 
         result = Deferred()
@@ -77,6 +88,10 @@ class PackageReporter(PackageTaskHandler):
 
         result.addCallback(lambda x: self.run_apt_update())
 
+        if self._config.package_reporter_resident:
+            # The channels are kept between runs, refresh them if needed.
+            result.addCallback(lambda x: self._reload_changed_channels())
+
         # If the appropriate hash=>id db is not there, fetch it
         result.addCallback(lambda x: self.fetch_hash_id_db())
 
@@ -98,6 +113,82 @@ class PackageReporter(PackageTaskHandler):
         result.callback(None)
         return result
 
+    def run_resident(self):
+        """Run now, and then again each time the package monitor asks to.
+
+        The apt cache and the package hashes are kept between runs, and only
+        reloaded when the package files change. The monitor wakes us up by
+        writing a line to our standard input, which it does when it's time
+        to run or when a C{package-reporter-run} event is fired in the
+        broker, for instance by the changer.
+
+        @return: A deferred firing when the monitor which started us goes
+            away, which closes our standard input.
+        """
+        self._stopped = Deferred()
+        self._running = False
+        self._run_requested = False
+        self._watch_monitor()
+        self._request_run()
+        return self._stopped
+
+    def _watch_monitor(self):
+        """Run when the monitor writes to our standard input, and stop
+        running when it gets closed."""
+        self._monitor_watcher = _MonitorWatcher(
+            self._request_run, self._stop_resident)
+        StandardIO(self._monitor_watcher)
+
+    def _stop_resident(self):
+        if not self._stopped.called:
+            self._stopped.callback(None)
+
+    def _request_run(self):
+        """Run as soon as the current run, if any, completes."""
+        if self._stopped.called:
+            return
+        if self._running:
+            self._run_requested = True
+        else:
+            self._run_resident_once()
+
+    def _run_resident_once(self):
+        self._running = True
+        result = self.run_once()
+        result.addErrback(log_failure, "Package reporter run failed")
+        result.addCallback(self._resident_run_done)
+
+    def _resident_run_done(self, result):
+        self._running = False
+        if self._run_requested and not self._stopped.called:
+            self._run_requested = False
+            self._run_resident_once()
+
+    def _get_package_files(self):
+        """Return the files apt reads the state of the packages from."""
+        status_file = apt_pkg.config.find_file("dir::state::status")
+        lists_dir = apt_pkg.config.find_dir("dir::state::lists")
+        files = [status_file, lists_dir]
+        files.extend(glob.glob("%s/*Packages" % lists_dir))
+        return files
+
+    def _reload_changed_channels(self):
+        """Reload the channels if the package files changed since last time.
+
+        The files are compared by modification time and size, so that files
+        replaced with older copies are noticed too.
+        """
+        state = []
+        for filename in sorted(self._get_package_files()):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            state.append((filename, stat.st_mtime, stat.st_size))
+        if state != self._channels_state:
+            self._facade.reload_channels()
+            self._channels_state = state
+
     def send_message(self, message):
         return self._broker.send_message(
             message, self._session_id, True)
@@ -581,13 +672,8 @@ class PackageReporter(PackageTaskHandler):
         if not os.path.exists(stamp_file):
             return True
 
-        status_file = apt_pkg.config.find_file("dir::state::status")
-        lists_dir = apt_pkg.config.find_dir("dir::state::lists")
-        files = [status_file, lists_dir]
-        files.extend(glob.glob("%s/*Packages" % lists_dir))
-
         last_checked = os.stat(stamp_file).st_mtime
-        for f in files:
+        for f in self._get_package_files():
             last_changed = os.stat(f).st_mtime
             if last_changed >= last_checked:
                 return True
@@ -638,49 +724,51 @@ class PackageReporter(PackageTaskHandler):
         backports_archive = "{}-backports".format(lsb["code-name"])
         security_archive = "{}-security".format(lsb["code-name"])
 
-        for package in self._facade.get_packages():
+        packages = list(self._facade.get_packages())
+        locked_packages = self._facade.get_locked_packages()
+        # Resolve all the hashes with a few batched queries, rather than
+        # with one query per package.
+        hash_ids = self._store.get_hash_id_map(
+            self._facade.get_package_hash(package)
+            for package in packages + locked_packages)
+
+        for package in packages:
+            id = hash_ids.get(self._facade.get_package_hash(package))
+            if id is None:
+                continue
+            archives = self._facade.get_package_archives(package)
             # Don't include package versions from the official backports
             # archive. The backports archive is enabled by default since
             # xenial with a pinning policy of 100. Ideally we would
             # support pinning, but we don't yet. In the mean time, we
             # ignore backports, so that packages don't get automatically
             # upgraded to the backports version.
-            backport_origins = [
-                origin for origin in package.origins
-                if origin.archive == backports_archive]
-            if backport_origins and (
-                    len(backport_origins) == len(package.origins)):
+            if archives and all(
+                    archive == backports_archive for archive in archives):
                 # Ignore the version if it's only in the official
                 # backports archive. If it's somewhere else as well,
                 # e.g. a PPA, we assume it was added manually and the
                 # user wants to get updates from it.
                 continue
-            hash = self._facade.get_package_hash(package)
-            id = self._store.get_hash_id(hash)
-            if id is not None:
-                if self._facade.is_package_installed(package):
-                    current_installed.add(id)
-                    if self._facade.is_package_available(package):
-                        current_available.add(id)
-                    if self._facade.is_package_autoremovable(package):
-                        current_autoremovable.add(id)
-                else:
+            if self._facade.is_package_installed(package):
+                current_installed.add(id)
+                if self._facade.is_package_available(package):
                     current_available.add(id)
+                if self._facade.is_package_autoremovable(package):
+                    current_autoremovable.add(id)
+            else:
+                current_available.add(id)
 
-                # Are there any packages that this package is an upgrade for?
-                if self._facade.is_package_upgrade(package):
-                    current_upgrades.add(id)
+            # Are there any packages that this package is an upgrade for?
+            if self._facade.is_package_upgrade(package):
+                current_upgrades.add(id)
 
-                # Is this package present in the security pocket?
-                security_origins = any(
-                    origin for origin in package.origins
-                    if origin.archive == security_archive)
-                if security_origins:
-                    current_security.add(id)
+            # Is this package present in the security pocket?
+            if security_archive in archives:
+                current_security.add(id)
 
-        for package in self._facade.get_locked_packages():
-            hash = self._facade.get_package_hash(package)
-            id = self._store.get_hash_id(hash)
+        for package in locked_packages:
+            id = hash_ids.get(self._facade.get_package_hash(package))
             if id is not None:
                 current_locked.add(id)
 
@@ -801,6 +889,24 @@ class PackageReporter(PackageTaskHandler):
         return result
 
 
+class _MonitorWatcher(Protocol):
+    """Watch the standard input of a resident reporter.
+
+    @param run: Called when data is written to the standard input.
+    @param stop: Called when the standard input is closed.
+    """
+
+    def __init__(self, run, stop):
+        self._run = run
+        self._stop = stop
+
+    def dataReceived(self, data):
+        self._run()
+
+    def connectionLost(self, reason):
+        self._stop()
+
+
 class FakeGlobalReporter(PackageReporter):
     """
     A standard reporter, which additionally stores messages sent into its
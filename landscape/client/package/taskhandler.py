@@ -35,6 +35,11 @@ class PackageTaskHandlerConfiguration(Configuration):
         """Get the path to the directory holding the stock hash-id stores."""
         return os.path.join(self.package_directory, "hash-id")
 
+    @property
+    def package_hash_cache_filename(self):
+        """Get the path to the file caching package hashes between runs."""
+        return os.path.join(self.package_directory, "hash-cache")
+
     @property
     def update_stamp_filename(self):
         """Get the path to the update-stamp file."""
@@ -106,6 +111,7 @@ class PackageTaskHandler(object):
         self._count = 0
         self._session_id = None
         self._reactor = reactor
+        self._hash_id_db_filename = None
 
     def run(self):
         return self.handle_tasks()
@@ -184,6 +190,10 @@ class PackageTaskHandler(object):
                 # and just go on
                 return
 
+            if hash_id_db_filename == self._hash_id_db_filename:
+                # Already attached by a previous run of a resident handler.
+                return
+
             try:
                 self._store.add_hash_id_db(hash_id_db_filename)
             except InvalidHashIdDb:
@@ -193,6 +203,7 @@ class PackageTaskHandler(object):
                                 hash_id_db_filename)
                 os.remove(hash_id_db_filename)
                 return
+            self._hash_id_db_filename = hash_id_db_filename
 
         result = self._determine_hash_id_db_filename()
         result.addCallback(use_it)
@@ -295,7 +306,8 @@ def run_task_handler(cls, args, reactor=None):
     # Delay importing of the facades so that we don't
     # import Apt unless we need to.
     from landscape.lib.apt.package.facade import AptFacade
-    package_facade = AptFacade()
+    package_facade = AptFacade(
+        hash_cache_filename=config.package_hash_cache_filename)
 
     def finish():
         connector.disconnect()
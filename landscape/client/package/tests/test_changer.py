@@ -692,6 +692,27 @@ class AptPackageChangerTest(LandscapeTest):
         system_mock.assert_called_once_with(
             "/fake/bin/landscape-package-reporter -c test.conf")
 
+    @patch("os.system")
+    def test_wake_up_resident_reporter_after_running(self, system_mock):
+        """
+        If the package reporter is resident, it's still running after the
+        changer has run, so rather than spawning another reporter, which
+        wouldn't be able to run, the changer wakes it up by firing the
+        C{package-reporter-run} event in the broker.
+        """
+        self.config.package_reporter_resident = True
+        callback = Mock()
+        self.broker_service.reactor.call_on("package-reporter-run", callback)
+        self.store.add_task("changer", {"type": "change-packages",
+                                        "operation-id": 123})
+
+        result = self.changer.run()
+        self.remote._factory.fake_connection.flush()
+        self.successResultOf(result)
+
+        callback.assert_called_once_with()
+        system_mock.assert_not_called()
+
     @patch("os.getuid", return_value=0)
     @patch("os.setgid")
     @patch("os.setuid")
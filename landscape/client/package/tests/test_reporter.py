@@ -9,6 +9,7 @@ import subprocess
 
 from twisted.internet.defer import Deferred, succeed, fail, inlineCallbacks
 from twisted.internet import reactor
+from twisted.internet.task import Clock
 
 
 from landscape.lib import bpickle
@@ -66,6 +67,15 @@ class PackageReporterAptTest(LandscapeTest):
         self.config.data_path = self.makeDir()
         os.mkdir(self.config.package_directory)
         self.check_stamp_file = self.config.detect_package_changes_stamp
+        # The resident reporter watches its standard input, don't let it
+        # touch the one of the tests.
+        patcher = mock.patch("landscape.client.package.reporter.StandardIO")
+        self.standard_io = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request_resident_run(self):
+        """Write to the standard input of the reporter, like the monitor."""
+        self.reporter._monitor_watcher.dataReceived(b"\n")
 
     def _clear_repository(self):
         """Remove all packages from self.repository."""
@@ -1225,6 +1235,115 @@ class PackageReporterAptTest(LandscapeTest):
         self.assertTrue(self.reporter.request_unknown_hashes.called)
         self.assertTrue(self.reporter.detect_changes.called)
 
+    def test_run_resident(self):
+        """
+        In resident mode, the reporter runs once and then again each time
+        the package monitor writes to its standard input.
+        """
+        self.config.package_reporter_resident = True
+        self.reporter.run_once = mock.Mock(return_value=succeed(None))
+        result = self.reporter.run()
+        self.assertEqual(1, self.reporter.run_once.call_count)
+        self._request_resident_run()
+        self.assertEqual(2, self.reporter.run_once.call_count)
+        self._request_resident_run()
+        self.assertEqual(3, self.reporter.run_once.call_count)
+        self.assertNoResult(result)
+        self.standard_io.assert_called_once_with(
+            self.reporter._monitor_watcher)
+
+    def test_run_resident_while_running(self):
+        """
+        Runs requested while the reporter is running are done once the
+        current run completes, and only once.
+        """
+        self.config.package_reporter_resident = True
+        deferred = Deferred()
+        self.reporter.run_once = mock.Mock(return_value=deferred)
+        self.reporter.run()
+        self._request_resident_run()
+        self._request_resident_run()
+        self.assertEqual(1, self.reporter.run_once.call_count)
+        self.reporter.run_once.return_value = succeed(None)
+        deferred.callback(None)
+        self.assertEqual(2, self.reporter.run_once.call_count)
+
+    @mock.patch("landscape.client.package.reporter.log_failure")
+    def test_run_resident_failure(self, log_failure_mock):
+        """
+        A failed run is logged, and the reporter keeps on running.
+        """
+        self.config.package_reporter_resident = True
+        self.reporter.run_once = mock.Mock(
+            return_value=fail(RuntimeError("Oops")))
+        result = self.reporter.run()
+        self.assertEqual(1, log_failure_mock.call_count)
+        self.reporter.run_once.return_value = succeed(None)
+        self._request_resident_run()
+        self.assertEqual(2, self.reporter.run_once.call_count)
+        self.assertNoResult(result)
+
+    def test_run_resident_stops(self):
+        """
+        The resident reporter stops once the monitor which started it goes
+        away, closing its standard input.
+        """
+        self.config.package_reporter_resident = True
+        self.reporter.run_once = mock.Mock(return_value=succeed(None))
+        result = self.reporter.run()
+        self.reporter._monitor_watcher.connectionLost(None)
+        self.assertIsNone(self.successResultOf(result))
+        self._request_resident_run()
+        self.assertEqual(1, self.reporter.run_once.call_count)
+
+    def test_run_resident_keeps_running(self):
+        """
+        The resident reporter doesn't wait for the monitor with a remote
+        call to the broker, so it keeps on running past the timeout of
+        such calls, and leaves no event handlers behind in the broker.
+        """
+        self.config.package_reporter_resident = True
+        self.reporter.run_once = mock.Mock(return_value=succeed(None))
+        clock = Clock()
+        self.remote._sender._clock = clock
+        handlers = self.broker_service.reactor._event_handlers
+        broker_handlers = list(handlers.get("package-reporter-run", []))
+        result = self.reporter.run()
+        clock.advance(self.remote._sender.timeout * 60)
+        self.reactor.advance(3600)
+        self.assertNoResult(result)
+        self.assertEqual(
+            broker_handlers, handlers.get("package-reporter-run", []))
+        self._request_resident_run()
+        self.assertEqual(2, self.reporter.run_once.call_count)
+
+    def test_run_resident_reloads_changed_channels(self):
+        """
+        In resident mode, each run reloads the channels if the package
+        files changed since they were last loaded.
+        """
+        self.config.package_reporter_resident = True
+        self.reporter._reload_changed_channels = mock.Mock()
+        for name in ["run_apt_update", "fetch_hash_id_db", "use_hash_id_db",
+                     "handle_tasks", "remove_expired_hash_id_requests",
+                     "request_unknown_hashes", "detect_changes"]:
+            setattr(self.reporter, name, mock.Mock(return_value=succeed(None)))
+        self.reporter.run_once()
+        self.reporter._reload_changed_channels.assert_called_once_with()
+
+    def test_reload_changed_channels(self):
+        """
+        L{PackageReporter._reload_changed_channels} only reloads the
+        channels when the package files have changed.
+        """
+        with mock.patch.object(self.facade, "reload_channels") as reload_mock:
+            self.reporter._reload_changed_channels()
+            self.reporter._reload_changed_channels()
+            self.assertEqual(1, reload_mock.call_count)
+            self._add_system_package("foo")
+            self.reporter._reload_changed_channels()
+            self.assertEqual(2, reload_mock.call_count)
+
     def test_main(self):
         mocktarget = "landscape.client.package.reporter.run_task_handler"
         with mock.patch(mocktarget) as m:
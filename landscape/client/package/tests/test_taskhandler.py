@@ -72,6 +72,28 @@ class PackageTaskHandlerTest(LandscapeTest):
 
         return result
 
+    def test_use_hash_id_db_only_once(self):
+        """
+        The hash=>id database isn't attached again if it's already attached,
+        as happens for the handlers which run more than once.
+        """
+        self.config.data_path = self.makeDir()
+        os.makedirs(os.path.join(self.config.data_path, "package", "hash-id"))
+        hash_id_db_filename = os.path.join(self.config.data_path, "package",
+                                           "hash-id", "uuid_codename_arch")
+        HashIdStore(hash_id_db_filename).set_hash_ids({b"hash": 123})
+        message_store = self.broker_service.message_store
+        message_store.set_server_uuid("uuid")
+        self.handler.lsb_release_filename = self.makeFile(SAMPLE_LSB_RELEASE)
+        self.facade.set_arch("arch")
+
+        result = self.handler.use_hash_id_db()
+        result.addCallback(lambda x: self.handler.use_hash_id_db())
+
+        def callback(ignored):
+            self.assertEqual(1, len(self.store._hash_id_stores))
+        return result.addCallback(callback)
+
     @patch("logging.warning")
     def test_use_hash_id_db_undetermined_codename(self, logging_mock):
 
@@ -16,6 +16,8 @@ class LandscapeService(Service, object):
 
     @cvar service_name: The lower-case name of the service. This is used to
         generate the bpickle and the Unix socket filenames.
+    @cvar persist_incremental: Whether the L{Persist} only saves the
+        subtrees which changed since the last save.
     @ivar config: A L{Configuration} object.
     @ivar reactor: A L{LandscapeReactor} object.
     @ivar persist: A L{Persist} object, if C{persist_filename} is defined.
@@ -24,10 +26,13 @@ class LandscapeService(Service, object):
     """
     reactor_factory = LandscapeReactor
     persist_filename = None
+    persist_incremental = False
 
     def __init__(self, config):
         self.config = config
         self.reactor = self.reactor_factory()
+        if self.config is not None and self.config.coalesce_runs:
+            self.reactor.scheduler.enable(self.config.coalesce_runs_jitter)
         if self.persist_filename:
             self.persist = get_versioned_persist(self)
         if not (self.config is not None and self.config.ignore_sigusr1):
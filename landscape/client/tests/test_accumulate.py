@@ -1,5 +1,6 @@
 from landscape.lib.persist import Persist
-from landscape.client.accumulate import Accumulator, accumulate
+from landscape.client.accumulate import (
+    Accumulator, BatchAccumulator, accumulate)
 from landscape.client.tests.helpers import LandscapeTest
 
 
@@ -157,3 +158,97 @@ class AccumulatorTest(LandscapeTest):
         step_data = accumulate(0, 14, "key")
         self.assertEqual(step_data, None)
         self.assertEqual(persist.get("key"), (0, 0))
+
+
+class BatchAccumulatorTest(LandscapeTest):
+    """Tests for the BatchAccumulator plugin helper class."""
+
+    def test_accumulate(self):
+        """
+        L{BatchAccumulator} returns the step data of each item, and keeps
+        the state of all the keys in a single persist entry.
+        """
+        persist = Persist()
+        accumulate = BatchAccumulator(persist, 5, "state")
+        self.assertEqual([(5, 4), (5, 14)],
+                         accumulate(5, [("key1", 4), ("key2", 14)]))
+        self.assertEqual((("key1", "key2"), (5, 5), (0, 0)),
+                         persist.get("state"))
+        self.assertEqual([(10, 3), (10, 2)],
+                         accumulate(10, [("key1", 3), ("key2", 2)]))
+
+    def test_same_step_data_as_accumulator(self):
+        """
+        L{BatchAccumulator} returns the same step data as L{Accumulator}
+        does for each key, with keys coming and going.
+        """
+        accumulate = Accumulator(Persist(), 300)
+        batch_accumulate = BatchAccumulator(Persist(), 300, "state")
+        for timestamp in range(0, 3000, 70):
+            items = [("key%d" % i, (timestamp * i) % 17)
+                     for i in range(10) if (timestamp + i) % 3]
+            self.assertEqual(
+                [accumulate(timestamp, value, key) for key, value in items],
+                batch_accumulate(timestamp, items))
+
+    def test_accumulator_state(self):
+        """
+        The state persisted by L{Accumulator} for a key is used and removed
+        the first time the key is seen.
+        """
+        persist = Persist()
+        persist.set("key", (7, 8))
+        accumulate = BatchAccumulator(persist, 5, "state")
+        self.assertEqual([(10, float((2 * 4) + (3 * 3)) / 5)],
+                         accumulate(13, [("key", 3)]))
+        self.assertFalse(persist.has("key"))
+        self.assertEqual((("key",), (13,), (9,)), persist.get("state"))
+
+    def test_persist_reset(self):
+        """
+        When the state is removed from the persist, the keys start again
+        from scratch.
+        """
+        persist = Persist()
+        accumulate = BatchAccumulator(persist, 5, "state")
+        accumulate(2, [("key", 4)])
+        persist.remove("state")
+        self.assertEqual([None], accumulate(3, [("key", 4)]))
+        self.assertEqual((("key",), (3,), (12,)), persist.get("state"))
+
+    def test_drop_stale_keys(self):
+        """
+        Keys that haven't been seen for more than a step are dropped, and
+        start again from scratch when they're seen again.
+        """
+        persist = Persist()
+        accumulate = BatchAccumulator(persist, 5, "state")
+        accumulate(4, [("key1", 1), ("key2", 2)])
+        accumulate(6, [("key1", 1)])
+        self.assertEqual((("key1", "key2"), (6, 4), (1, 8)),
+                         persist.get("state"))
+        self.assertEqual([(10, 1.0)], accumulate(11, [("key1", 1)]))
+        self.assertEqual((("key1",), (11,), (1,)), persist.get("state"))
+        self.assertEqual([None, (15, 1.0)],
+                         accumulate(16, [("key2", 3), ("key1", 1)]))
+        self.assertEqual((("key1", "key2"), (16, 16), (1, 3)),
+                         persist.get("state"))
+
+    def test_copied_state(self):
+        """
+        The state is looked up by value, so it doesn't matter whether the
+        persist hands back the same tuples that were saved or copies.
+        """
+        persist = Persist()
+        accumulate = BatchAccumulator(persist, 5, "state")
+        accumulate(4, [("key1", 1), ("key2", 2)])
+        keys, timestamps, values = persist.get("state")
+        persist.set("state", (tuple(reversed(keys)),
+                              tuple(reversed(timestamps)),
+                              tuple(reversed(values))))
+        self.assertEqual([(5, 2.0), (5, 1.0)],
+                         accumulate(6, [("key2", 2), ("key1", 1)]))
+        persist.set("state", tuple(list(column)
+                                   for column in persist.get("state")))
+        self.assertEqual([(10, 1.0), (10, 2.0)],
+                         accumulate(11, [("key1", 1), ("key2", 2)]))
@@ -52,6 +52,17 @@ class LandscapeServiceTest(LandscapeTest):
         service = TestService(self.config)
         self.assertFalse(hasattr(service, "persist"))
 
+    def test_coalesce_runs(self):
+        """
+        If the C{coalesce_runs} option is set, the reactor's periodic
+        scheduler is enabled.
+        """
+        service = TestService(self.config)
+        self.assertFalse(service.reactor.scheduler.enabled)
+        self.config.coalesce_runs = True
+        service = TestService(self.config)
+        self.assertTrue(service.reactor.scheduler.enabled)
+
     def test_usr1_rotates_logs(self):
         """
         SIGUSR1 should cause logs to be reopened.
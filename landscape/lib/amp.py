@@ -49,12 +49,13 @@ from uuid import uuid4
 from twisted.internet.defer import Deferred, maybeDeferred, succeed
 from twisted.internet.protocol import ServerFactory, ReconnectingClientFactory
 from twisted.python.failure import Failure
-from twisted.python.compat import xrange
+from twisted.python.compat import xrange, _PY3
 
 from twisted.protocols.amp import (
     Argument, String, Integer, Command, AMP, MAX_VALUE_LENGTH, CommandLocator)
 
 from landscape.lib import bpickle
+from landscape.lib.log import log_failure
 
 
 class MethodCallArgument(Argument):
@@ -118,16 +119,45 @@ class MethodCallChunk(Command):
 
     - C{chunk}: A portion of the big BPickle C{arguments} string which is
       being split and buffered.
+
+    - C{size}: The total size of the C{arguments} string, only sent with the
+      first chunk, so the receiver can allocate its buffer upfront. It's
+      optional, for compatibility with peers which don't send it.
     """
 
     arguments = [(b"sequence", Integer()),
-                 (b"chunk", String())]
+                 (b"chunk", String()),
+                 (b"size", Integer(optional=True))]
 
     response = [(b"result", Integer())]
 
     errors = {MethodCallError: b"METHOD_CALL_ERROR"}
 
 
+class _ChunkBuffer(object):
+    """Reassemble the chunks of the arguments of a L{MethodCall}.
+
+    @param size: The total size of the arguments, if known, in which case
+        the chunks are copied into a buffer allocated upfront.
+    """
+
+    def __init__(self, size=None):
+        self._data = bytearray(size or 0)
+        self._length = 0
+
+    def append(self, chunk):
+        """Copy C{chunk} after the chunks received so far."""
+        end = self._length + len(chunk)
+        # This grows the buffer if it's too small.
+        self._data[self._length:end] = chunk
+        self._length = end
+
+    def getvalue(self):
+        """Return the reassembled arguments as a byte string."""
+        # Decoding from a byte string is faster than from a bytearray.
+        return bytes(self._data[:self._length])
+
+
 class MethodCallReceiver(CommandLocator):
     """Expose methods of a local object over AMP.
 
@@ -163,7 +193,7 @@ class MethodCallReceiver(CommandLocator):
         if chunks is not None:
             # We got some L{MethodCallChunk}s before, this is the last.
             chunks.append(arguments)
-            arguments = b"".join(chunks)
+            arguments = chunks.getvalue()
 
         # Pass the the arguments as-is without reinterpreting strings.
         args, kwargs = bpickle.loads(arguments, as_is=True)
@@ -188,13 +218,16 @@ class MethodCallReceiver(CommandLocator):
         return deferred
 
     @MethodCallChunk.responder
-    def receive_method_call_chunk(self, sequence, chunk):
+    def receive_method_call_chunk(self, sequence, chunk, size=None):
         """Receive a part of a multi-chunk L{MethodCall}.
 
         Add the received C{chunk} to the buffer of the L{MethodCall} identified
         by C{sequence}.
         """
-        self._pending_chunks.setdefault(sequence, []).append(chunk)
+        chunks = self._pending_chunks.get(sequence)
+        if chunks is None:
+            chunks = self._pending_chunks[sequence] = _ChunkBuffer(size)
+        chunks.append(chunk)
         return {"result": sequence}
 
     def _check_result(self, result):
@@ -270,30 +303,31 @@ class MethodCallSender(object):
         # As we send the method name to remote, we need bytes.
         method = method.encode("utf-8")
 
-        # Split the given arguments in one or more chunks
-        chunks = [arguments[i:i + self._chunk_size]
-                  for i in xrange(0, len(arguments), self._chunk_size)]
-
-        result = Deferred()
-        if len(chunks) > 1:
-            # If we have N chunks, send the first N-1 as MethodCallChunk's
-            for chunk in chunks[:-1]:
-
-                def create_send_chunk(sequence, chunk):
-                    send_chunk = (lambda x: self._protocol.callRemote(
-                        MethodCallChunk, sequence=sequence, chunk=chunk))
-                    return send_chunk
-
-                result.addCallback(create_send_chunk(sequence, chunk))
-
-        def send_last_chunk(ignored):
-            chunk = chunks[-1]
-            return self._call_remote_with_timeout(
-                MethodCall, sequence=sequence, method=method, arguments=chunk)
-
-        result.addCallback(send_last_chunk)
+        # Split the given arguments in one or more chunks, as views of the
+        # arguments rather than copies. On Python 2 AMP can't join views with
+        # the rest of the box, so slice the byte string itself.
+        size = len(arguments)
+        view = memoryview(arguments) if _PY3 else arguments
+        last = (size - 1) // self._chunk_size * self._chunk_size
+
+        # If we have N chunks, send the first N-1 as MethodCallChunk's. They
+        # don't need to be acknowledged before sending the next one, since
+        # AMP delivers commands in order.
+        for offset in xrange(0, last, self._chunk_size):
+            extra = {"size": size} if offset == 0 else {}
+            chunk_result = self._protocol.callRemote(
+                MethodCallChunk, sequence=sequence,
+                chunk=view[offset:offset + self._chunk_size], **extra)
+            # If sending a chunk fails, so does the MethodCall sent after it,
+            # whose caller gets the error.
+            chunk_result.addErrback(
+                log_failure, "Error sending chunk of %s call." %
+                method.decode("utf-8"))
+
+        result = self._call_remote_with_timeout(
+            MethodCall, sequence=sequence, method=method,
+            arguments=view[last:])
         result.addCallback(lambda response: response["result"])
-        result.callback(None)
         return result
 
 
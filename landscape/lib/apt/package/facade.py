@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 import hashlib
 import logging
+import multiprocessing
 import os
 import subprocess
 import sys
@@ -17,13 +18,15 @@ import apt_pkg
 from aptsources.sourceslist import SourcesList
 from apt.progress.text import AcquireProgress
 from apt.progress.base import InstallProgress
-from twisted.python.compat import itervalues
+from twisted.python.compat import itervalues, _PY3
 
 
 from landscape.lib.compat import StringIO
 from landscape.lib.fs import append_text_file, create_text_file
 from landscape.lib.fs import read_text_file, read_binary_file, touch_file
-from .skeleton import build_skeleton_apt
+from .hashcache import PackageHashCache
+from .skeleton import (
+    build_skeleton_apt, get_record_hash, get_relation_fields)
 
 
 class TransactionError(Exception):
@@ -122,6 +125,8 @@ class AptFacade(object):
     these features slightly more comfortable.
 
     @param root: The root dir of the Apt configuration files.
+    @param hash_cache_filename: Optionally, the file where package hashes
+        are cached between runs, see L{PackageHashCache}.
     @ivar refetch_package_index: Whether to refetch the package indexes
         when reloading the channels, or reuse the existing local
         database.
@@ -129,9 +134,13 @@ class AptFacade(object):
 
     max_dpkg_retries = 12  # number of dpkg retries before we give up
     dpkg_retry_sleep = 5
+    # Hash the packages in a pool of worker processes when there are at
+    # least that many to hash. By default, one worker per CPU is used.
+    parallel_hash_threshold = 5000
+    hash_processes = None
     _dpkg_status = "/var/lib/dpkg/status"
 
-    def __init__(self, root=None):
+    def __init__(self, root=None, hash_cache_filename=None):
         self._root = root
         self._dpkg_args = []
         if self._root is not None:
@@ -143,6 +152,14 @@ class AptFacade(object):
         self._channels_loaded = False
         self._pkg2hash = {}
         self._hash2pkg = {}
+        # Indexes over the versions in self._hash2pkg, rebuilt together
+        # with it by reload_channels().
+        self._name2pkgs = {}
+        self._installed_versions = []
+        self._packages = set()
+        self._hash_cache = None
+        if hash_cache_filename is not None:
+            self._hash_cache = PackageHashCache(hash_cache_filename)
         self._version_installs = []
         self._package_installs = set()
         self._global_upgrade = False
@@ -185,7 +202,7 @@ class AptFacade(object):
         For Apt, it means all packages that are held.
         """
         return [
-            version for version in self.get_packages()
+            version for version in self._installed_versions
             if (self.is_package_installed(version) and
                 self._is_package_held(version.package))]
 
@@ -254,19 +271,92 @@ class AptFacade(object):
 
         self._pkg2hash.clear()
         self._hash2pkg.clear()
+        hash_cache = self._hash_cache
+        if hash_cache is not None:
+            hash_cache.load()
+        versions = []
+        hashes = []
         for package in self._cache:
             if not self._is_main_architecture(package):
                 continue
             for version in package.versions:
-                hash = self.get_package_skeleton(
-                    version, with_info=False).get_hash()
-                # Use a tuple including the package, since the Version
-                # objects of two different packages can have the same
-                # hash.
-                self._pkg2hash[(package, version)] = hash
-                self._hash2pkg[hash] = version
+                hash = None
+                if hash_cache is not None:
+                    hash = hash_cache.get(*self._get_hash_cache_key(version))
+                versions.append(version)
+                hashes.append(hash)
+        unhashed = [index for index, hash in enumerate(hashes) if hash is None]
+        new_hashes = self._get_package_hashes(
+            [versions[index] for index in unhashed])
+        for index, hash in zip(unhashed, new_hashes):
+            hashes[index] = hash
+            if hash_cache is not None:
+                key = self._get_hash_cache_key(versions[index])
+                hash_cache.set(*(key + (hash,)))
+        for version, hash in zip(versions, hashes):
+            # Use a tuple including the package, since the Version
+            # objects of two different packages can have the same
+            # hash.
+            self._pkg2hash[(version.package, version)] = hash
+            self._hash2pkg[hash] = version
+        if hash_cache is not None:
+            hash_cache.save()
+        self._build_indexes()
         self._channels_loaded = True
 
+    def _build_indexes(self):
+        """Index the versions in the channels by name and installed state."""
+        self._name2pkgs.clear()
+        del self._installed_versions[:]
+        self._packages.clear()
+        for version in self.get_packages():
+            self._name2pkgs.setdefault(version.package.name, []).append(
+                version)
+            if self.is_package_installed(version):
+                self._installed_versions.append(version)
+            self._packages.add(version.package)
+
+    def _get_hash_cache_key(self, version):
+        """Return the key of C{version} in the package hash cache."""
+        # The first package file is the one the version's record, and so
+        # its skeleton, comes from.
+        filename = version._cand.file_list[0][0].filename
+        return (filename, version.package.name, version.version,
+                version.architecture)
+
+    def _get_package_hashes(self, versions):
+        """Compute the hashes of the given versions, in the same order.
+
+        With enough versions, the hashes are computed by a pool of worker
+        processes from the relation fields of the versions' apt records,
+        which are extracted here since apt objects can't be passed to other
+        processes. The workers are started as new interpreters rather than
+        forked, since the reporter runs this with its reactor running,
+        sqlite connections open and the apt cache loaded; Python 2 can't do
+        that, so it always hashes the versions in-process.
+        """
+        processes = self.hash_processes or multiprocessing.cpu_count()
+        if (_PY3 and processes > 1 and
+                len(versions) >= self.parallel_hash_threshold):
+            packages = [
+                (version.package.name, version.version,
+                 get_relation_fields(version.record))
+                for version in versions]
+            context = multiprocessing.get_context("spawn")
+            try:
+                pool = context.Pool(processes)
+            except OSError as error:
+                logging.warning("Can't hash packages in parallel: %s", error)
+            else:
+                try:
+                    chunksize = len(packages) // (processes * 4) + 1
+                    return pool.map(get_record_hash, packages, chunksize)
+                finally:
+                    pool.close()
+                    pool.join()
+        return [self.get_package_skeleton(version, with_info=False).get_hash()
+                for version in versions]
+
     def ensure_channels_reloaded(self):
         """Reload the channels if they haven't been reloaded yet."""
         if self._channels_loaded:
@@ -442,6 +532,18 @@ class AptFacade(object):
         """
         return self._hash2pkg.get(hash)
 
+    def get_package_archives(self, version):
+        """Return the archives of the package files C{version} comes from.
+
+        This gives the same archive names as C{version.origins}, reading them
+        straight from the package files instead of building an
+        L{apt.package.Origin} for each of them.
+
+        @param version: an L{apt.package.Version} object.
+        """
+        return [package_file.archive
+                for package_file, index in version._cand.file_list]
+
     def is_package_installed(self, version):
         """Is the package version installed?"""
         return version == version.package.installed
@@ -479,9 +581,7 @@ class AptFacade(object):
 
         @param name: The name the returned packages should have.
         """
-        return [
-            version for version in self.get_packages()
-            if version.package.name == name]
+        return list(self._name2pkgs.get(name, ()))
 
     def _is_package_broken(self, package):
         """Is the package broken?
@@ -505,9 +605,15 @@ class AptFacade(object):
 
     def _get_broken_packages(self):
         """Return the packages that are in a broken state."""
+        if self._cache.broken_count == 0:
+            # Nothing has unmet dependencies, so only the packages we
+            # marked for install can have been unmarked by apt.
+            packages = self._package_installs
+        else:
+            packages = self._packages
         return set(
-            version.package for version in self.get_packages()
-            if self._is_package_broken(version.package))
+            package for package in packages
+            if self._is_package_broken(package))
 
     def _get_changed_versions(self, package):
         """Return the versions that will be changed for the package.
@@ -0,0 +1,132 @@
+"""On-disk cache of package hashes, to avoid rebuilding package skeletons."""
+import logging
+import os
+import tempfile
+
+from landscape.lib import bpickle
+
+
+class PackageHashCache(object):
+    """Cache package hashes across runs, keyed by the state of apt's indexes.
+
+    Hashes are grouped by the package index file (a list file in
+    C{/var/lib/apt/lists}, the dpkg status file, etc.) the package version
+    was read from. The modification time and size of each index file are
+    saved along with its hashes, and the hashes are discarded as soon as any
+    of them changes.
+
+    @param filename: The file the cache is persisted to.
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._files = {}
+        self._hashes = {}
+        self._used = {}
+        self._current_states = {}
+        self._dirty = False
+
+    def load(self):
+        """Load the cached hashes, discarding them if they can't be read."""
+        self._files = {}
+        self._hashes = {}
+        self._used = {}
+        self._current_states = {}
+        self._dirty = False
+        if not os.path.exists(self._filename):
+            return
+        try:
+            with open(self._filename, "rb") as fd:
+                data = bpickle.loads(fd.read())
+            self._files = dict((filename, tuple(state))
+                               for filename, state in data["files"].items())
+            self._hashes = data["hashes"]
+        except Exception:
+            logging.warning("Discarding invalid package hash cache %s.",
+                            self._filename)
+            self._files = {}
+            self._hashes = {}
+
+    def _get_file_state(self, filename):
+        """Return the current C{(mtime, size)} of an index file."""
+        state = self._current_states.get(filename)
+        if state is None:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                state = ()
+            else:
+                state = (stat.st_mtime, stat.st_size)
+            self._current_states[filename] = state
+        return state
+
+    def get(self, filename, name, version, architecture):
+        """Return the cached hash of a package version, or C{None}.
+
+        @param filename: The index file the version was read from.
+        @param name: The package name.
+        @param version: The version string.
+        @param architecture: The architecture of the version.
+        """
+        state = self._get_file_state(filename)
+        if not state or self._files.get(filename) != state:
+            return None
+        key = (name, version, architecture)
+        hash = self._hashes[filename].get(key)
+        if hash is not None:
+            self._used.setdefault(filename, {})[key] = hash
+        return hash
+
+    def set(self, filename, name, version, architecture, hash):
+        """Cache the hash of a package version.
+
+        The parameters are the same as for L{get}, plus the C{hash}.
+        """
+        state = self._get_file_state(filename)
+        if not state:
+            return
+        if self._files.get(filename) != state:
+            self._files[filename] = state
+            self._hashes[filename] = {}
+        key = (name, version, architecture)
+        self._hashes[filename][key] = hash
+        self._used.setdefault(filename, {})[key] = hash
+        self._dirty = True
+
+    def _has_unused(self):
+        """Whether some of the loaded hashes haven't been used."""
+        if set(self._used) != set(self._hashes):
+            return True
+        return any(len(self._used[filename]) != len(self._hashes[filename])
+                   for filename in self._used)
+
+    def save(self):
+        """Persist the hashes which have been used since L{load}.
+
+        Hashes for package versions which are gone are dropped. Nothing is
+        written if all the hashes came from the cache in the first place.
+        """
+        if not self._dirty and not self._has_unused():
+            return
+        data = {"files": dict((filename, list(self._files[filename]))
+                              for filename in self._used),
+                "hashes": self._used}
+        # Other processes may be saving the same cache, so each one writes
+        # to a file of its own before renaming it over the cache. The cache
+        # is shared by processes running as different users, so it must
+        # stay readable by all of them.
+        temp_fd, temp_filename = tempfile.mkstemp(
+            dir=os.path.dirname(self._filename))
+        try:
+            os.fchmod(temp_fd, 0o644)
+            with os.fdopen(temp_fd, "wb") as fd:
+                fd.write(bpickle.dumps(data))
+            os.rename(temp_filename, self._filename)
+        except Exception:
+            os.unlink(temp_filename)
+            raise
+        self._files = dict((filename, self._files[filename])
+                           for filename in self._used)
+        self._hashes = dict((filename, dict(hashes))
+                            for filename, hashes in self._used.items())
+        self._dirty = False
@@ -113,6 +113,57 @@ def parse_record_field(record, record_field, relation_type,
     return relations
 
 
+# The fields of an apt record the skeleton relations are built from.
+RELATION_FIELDS = ("Provides", "Pre-Depends", "Depends", "Conflicts", "Breaks")
+
+
+def get_relation_fields(record):
+    """Return a C{dict} of the L{RELATION_FIELDS} of an apt record."""
+    return dict((field, record[field]) for field in RELATION_FIELDS
+                if field in record)
+
+
+def get_relations(name, version, record):
+    """Return the sorted skeleton relations of a package version.
+
+    @param name: The package name.
+    @param version: The version string.
+    @param record: The apt record of the version, or anything with a
+        C{get} method returning its fields, like the C{dict} returned by
+        L{get_relation_fields}.
+    """
+    relations = set()
+    relations.update(parse_record_field(record, "Provides", DEB_PROVIDES))
+    relations.add((DEB_NAME_PROVIDES, "%s = %s" % (name, version)))
+    relations.update(parse_record_field(
+        record, "Pre-Depends", DEB_REQUIRES, DEB_OR_REQUIRES))
+    relations.update(parse_record_field(
+        record, "Depends", DEB_REQUIRES, DEB_OR_REQUIRES))
+
+    relations.add((DEB_UPGRADES, "%s < %s" % (name, version)))
+
+    relations.update(parse_record_field(record, "Conflicts", DEB_CONFLICTS))
+    relations.update(parse_record_field(record, "Breaks", DEB_CONFLICTS))
+    return sorted(relations)
+
+
+def get_record_hash(package):
+    """Return the skeleton hash of a package version, from its apt record.
+
+    This gives the same hash as C{build_skeleton_apt(version).get_hash()},
+    but only needs picklable arguments, so it can be computed in another
+    process.
+
+    @param package: A C{(name, version, fields)} tuple, where C{fields} are
+        the relation fields of the version's apt record, as returned by
+        L{get_relation_fields}.
+    """
+    name, version, fields = package
+    skeleton = PackageSkeleton(DEB_PACKAGE, name, version)
+    skeleton.relations = get_relations(name, version, fields)
+    return skeleton.get_hash()
+
+
 def build_skeleton_apt(version, with_info=False, with_unicode=False):
     """Build a package skeleton from an apt package.
 
@@ -126,25 +177,8 @@ def build_skeleton_apt(version, with_info=False, with_unicode=False):
     if with_unicode:
         name, version_string = unicode(name), unicode(version_string)
     skeleton = PackageSkeleton(DEB_PACKAGE, name, version_string)
-    relations = set()
-    relations.update(parse_record_field(
-        version.record, "Provides", DEB_PROVIDES))
-    relations.add((
-        DEB_NAME_PROVIDES,
-        "%s = %s" % (version.package.name, version.version)))
-    relations.update(parse_record_field(
-        version.record, "Pre-Depends", DEB_REQUIRES, DEB_OR_REQUIRES))
-    relations.update(parse_record_field(
-        version.record, "Depends", DEB_REQUIRES, DEB_OR_REQUIRES))
-
-    relations.add((
-        DEB_UPGRADES, "%s < %s" % (version.package.name, version.version)))
-
-    relations.update(parse_record_field(
-        version.record, "Conflicts", DEB_CONFLICTS))
-    relations.update(parse_record_field(
-        version.record, "Breaks", DEB_CONFLICTS))
-    skeleton.relations = sorted(relations)
+    skeleton.relations = get_relations(
+        version.package.name, version.version, version.record)
 
     if with_info:
         skeleton.section = version.section
@@ -12,6 +12,25 @@ from landscape.lib import bpickle
 from landscape.lib.store import with_cursor
 
 
+# How many hashes are looked up with a single query, kept under the default
+# SQLITE_MAX_VARIABLE_NUMBER of 999.
+HASH_ID_BATCH_SIZE = 500
+
+
+def _add_ids(cursor, table, ids):
+    """Insert the given package C{ids} into C{table}."""
+    rows = [(id,) for id in ids]
+    if rows:
+        cursor.executemany("REPLACE INTO %s VALUES (?)" % table, rows)
+
+
+def _remove_ids(cursor, table, ids):
+    """Delete the given package C{ids} from C{table}."""
+    rows = [(int(id),) for id in ids]
+    if rows:
+        cursor.executemany("DELETE FROM %s WHERE id=?" % table, rows)
+
+
 class UnknownHashIDRequest(Exception):
     """Raised for unknown hash id requests."""
 
@@ -42,9 +61,9 @@ class HashIdStore(object):
 
         @param hash_ids: a C{dict} of hash=>id mappings.
         """
-        for hash, id in iteritems(hash_ids):
-            cursor.execute("REPLACE INTO hash VALUES (?, ?)",
-                           (id, sqlite3.Binary(hash)))
+        rows = [(id, sqlite3.Binary(hash)) for hash, id in iteritems(hash_ids)]
+        if rows:
+            cursor.executemany("REPLACE INTO hash VALUES (?, ?)", rows)
 
     @with_cursor
     def get_hash_id(self, cursor, hash):
@@ -65,6 +84,27 @@ class HashIdStore(object):
         cursor.execute("SELECT hash, id FROM hash")
         return {bytes(row[0]): row[1] for row in cursor.fetchall()}
 
+    @with_cursor
+    def get_hash_id_map(self, cursor, hashes):
+        """Return a C{dict} mapping each of C{hashes} to its id.
+
+        Hashes without an associated id are left out. The ids are fetched in
+        batches of L{HASH_ID_BATCH_SIZE} hashes per query.
+
+        @param hashes: an iterable of C{bytes} hashes.
+        """
+        hashes = list(hashes)
+        hash_ids = {}
+        for start in range(0, len(hashes), HASH_ID_BATCH_SIZE):
+            batch = hashes[start:start + HASH_ID_BATCH_SIZE]
+            cursor.execute(
+                "SELECT hash, id FROM hash WHERE hash IN (%s)"
+                % ",".join("?" * len(batch)),
+                [sqlite3.Binary(hash) for hash in batch])
+            for hash, id in cursor.fetchall():
+                hash_ids[bytes(hash)] = id
+        return hash_ids
+
     @with_cursor
     def get_id_hash(self, cursor, id):
         """Return the hash associated to C{id}, or C{None} if not available."""
@@ -111,6 +151,7 @@ class PackageStore(HashIdStore):
         self._hash_id_stores = []
 
     def _ensure_schema(self):
+        tune_package_db(self._db)
         super(PackageStore, self)._ensure_schema()
         ensure_package_schema(self._db)
 
@@ -161,6 +202,25 @@ class PackageStore(HashIdStore):
         # Fall back to the locally-populated db
         return HashIdStore.get_hash_id(self, hash)
 
+    def get_hash_id_map(self, hashes):
+        """Return a C{dict} mapping each of C{hashes} to its id.
+
+        This is the bulk version of L{get_hash_id}, looking hashes up in the
+        attached lookaside databases first and then in the main one.
+        """
+        remaining = set(hashes)
+        hash_ids = {}
+        for store in self._hash_id_stores:
+            if not remaining:
+                break
+            for hash, id in iteritems(store.get_hash_id_map(remaining)):
+                if id:
+                    hash_ids[hash] = id
+                    remaining.discard(hash)
+        if remaining:
+            hash_ids.update(HashIdStore.get_hash_id_map(self, remaining))
+        return hash_ids
+
     def get_id_hash(self, id):
         """Return the hash associated to C{id}, or C{None} if not available.
 
@@ -176,13 +236,11 @@ class PackageStore(HashIdStore):
 
     @with_cursor
     def add_available(self, cursor, ids):
-        for id in ids:
-            cursor.execute("REPLACE INTO available VALUES (?)", (id,))
+        _add_ids(cursor, "available", ids)
 
     @with_cursor
     def remove_available(self, cursor, ids):
-        id_list = ",".join(str(int(id)) for id in ids)
-        cursor.execute("DELETE FROM available WHERE id IN (%s)" % id_list)
+        _remove_ids(cursor, "available", ids)
 
     @with_cursor
     def clear_available(self, cursor):
@@ -195,14 +253,11 @@ class PackageStore(HashIdStore):
 
     @with_cursor
     def add_available_upgrades(self, cursor, ids):
-        for id in ids:
-            cursor.execute("REPLACE INTO available_upgrade VALUES (?)", (id,))
+        _add_ids(cursor, "available_upgrade", ids)
 
     @with_cursor
     def remove_available_upgrades(self, cursor, ids):
-        id_list = ",".join(str(int(id)) for id in ids)
-        cursor.execute("DELETE FROM available_upgrade WHERE id IN (%s)"
-                       % id_list)
+        _remove_ids(cursor, "available_upgrade", ids)
 
     @with_cursor
     def clear_available_upgrades(self, cursor):
@@ -215,13 +270,11 @@ class PackageStore(HashIdStore):
 
     @with_cursor
     def add_autoremovable(self, cursor, ids):
-        for id in ids:
-            cursor.execute("REPLACE INTO autoremovable VALUES (?)", (id,))
+        _add_ids(cursor, "autoremovable", ids)
 
     @with_cursor
     def remove_autoremovable(self, cursor, ids):
-        id_list = ",".join(str(int(id)) for id in ids)
-        cursor.execute("DELETE FROM autoremovable WHERE id IN (%s)" % id_list)
+        _remove_ids(cursor, "autoremovable", ids)
 
     @with_cursor
     def clear_autoremovable(self, cursor):
@@ -234,13 +287,11 @@ class PackageStore(HashIdStore):
 
     @with_cursor
     def add_security(self, cursor, ids):
-        for id in ids:
-            cursor.execute("REPLACE INTO security VALUES (?)", (id,))
+        _add_ids(cursor, "security", ids)
 
     @with_cursor
     def remove_security(self, cursor, ids):
-        id_list = ",".join(str(int(id)) for id in ids)
-        cursor.execute("DELETE FROM security WHERE id IN (%s)" % id_list)
+        _remove_ids(cursor, "security", ids)
 
     @with_cursor
     def clear_security(self, cursor):
@@ -253,13 +304,11 @@ class PackageStore(HashIdStore):
 
     @with_cursor
     def add_installed(self, cursor, ids):
-        for id in ids:
-            cursor.execute("REPLACE INTO installed VALUES (?)", (id,))
+        _add_ids(cursor, "installed", ids)
 
     @with_cursor
     def remove_installed(self, cursor, ids):
-        id_list = ",".join(str(int(id)) for id in ids)
-        cursor.execute("DELETE FROM installed WHERE id IN (%s)" % id_list)
+        _remove_ids(cursor, "installed", ids)
 
     @with_cursor
     def clear_installed(self, cursor):
@@ -279,13 +328,11 @@ class PackageStore(HashIdStore):
     @with_cursor
     def add_locked(self, cursor, ids):
         """Add the given package ids to the list of locked packages."""
-        for id in ids:
-            cursor.execute("REPLACE INTO locked VALUES (?)", (id,))
+        _add_ids(cursor, "locked", ids)
 
     @with_cursor
     def remove_locked(self, cursor, ids):
-        id_list = ",".join(str(int(id)) for id in ids)
-        cursor.execute("DELETE FROM locked WHERE id IN (%s)" % id_list)
+        _remove_ids(cursor, "locked", ids)
 
     @with_cursor
     def clear_locked(self, cursor):
@@ -441,6 +488,28 @@ class PackageTask(object):
         cursor.execute("DELETE FROM task WHERE id=?", (self.id,))
 
 
+def tune_package_db(db):
+    """Set up a connection to a L{PackageStore} database for bulk writes.
+
+    The database is switched to write-ahead logging, so that writers don't
+    block readers in the other package processes, and each commit only needs
+    to sync the log. Temporary tables and indexes are kept in memory.
+
+    @param db: A connection to a SQLite database.
+    """
+    cursor = db.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    except (sqlite3.OperationalError, sqlite3.DatabaseError):
+        # Read-only databases or file systems not supporting shared memory
+        # are still usable with the default settings.
+        pass
+    finally:
+        cursor.close()
+
+
 def ensure_hash_id_schema(db):
     """Create all tables needed by a L{HashIdStore}.
 
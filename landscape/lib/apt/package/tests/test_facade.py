@@ -12,7 +12,7 @@ from apt.package import Package
 from aptsources.sourceslist import SourcesList
 from apt.cache import LockFailedException
 import mock
-from twisted.python.compat import unicode
+from twisted.python.compat import unicode, _PY3
 
 from landscape.lib.fs import read_text_file, create_text_file
 from landscape.lib import testing
@@ -779,6 +779,69 @@ class AptFacadeTest(testing.HelperTestCase, testing.FSTestCase,
         [pkg] = self.facade.get_packages_by_name("name2")
         self.assertEqual(HASH2, self.facade.get_package_hash(pkg))
 
+    def test_get_package_hash_cached(self):
+        """
+        If the facade has a hash cache, package skeletons aren't built again
+        when reloading the channels, unless the package indexes changed.
+        """
+        deb_dir = self.makeDir()
+        create_simple_repository(deb_dir)
+        facade = self.Facade(root=self.apt_root,
+                             hash_cache_filename=self.makeFile())
+        facade.refetch_package_index = True
+        facade.add_channel_deb_dir(deb_dir)
+        facade.reload_channels()
+        self.assertEqual(sorted([HASH1, HASH2, HASH3]),
+                         sorted(facade.get_package_hashes()))
+
+        with mock.patch.object(facade, "get_package_skeleton") as skeleton:
+            facade.reload_channels()
+            self.assertEqual([], skeleton.mock_calls)
+            self.assertEqual(sorted([HASH1, HASH2, HASH3]),
+                             sorted(facade.get_package_hashes()))
+
+            self._touch_packages_file(deb_dir)
+            skeleton.return_value.get_hash.return_value = b"new"
+            facade.reload_channels()
+            self.assertEqual([b"new"], list(set(
+                facade.get_package_hashes())))
+
+    def test_get_package_hashes_parallel(self):
+        """
+        The hashes computed by a pool of worker processes are the same as
+        the ones computed in the facade's process.
+        """
+        deb_dir = self.makeDir()
+        self._add_system_package("baz", version="1.0")
+        self._add_package_to_deb_dir(deb_dir, "baz", version="2.0")
+        self._add_package_to_deb_dir(deb_dir, "bar")
+        self._add_package_to_deb_dir(
+            deb_dir, "foo", control_fields={
+                "Depends": "bar (>= 1.0) | baz, qux", "Provides": "quux",
+                "Pre-Depends": "corge", "Breaks": "grault (<< 2.0)",
+                "Conflicts": "garply"})
+        self.facade.add_channel_apt_deb(
+            "file://%s" % deb_dir, "./", trusted=True)
+        self.facade.reload_channels()
+        serial = sorted(
+            (version.package.name, version.version, hash)
+            for (package, version), hash in self.facade._pkg2hash.items())
+
+        self.facade.parallel_hash_threshold = 0
+        self.facade.hash_processes = 2
+        with mock.patch.object(self.facade, "get_package_skeleton") as skel:
+            self.facade.reload_channels()
+            self.assertEqual([], skel.mock_calls)
+        parallel = sorted(
+            (version.package.name, version.version, hash)
+            for (package, version), hash in self.facade._pkg2hash.items())
+        self.assertEqual(4, len(parallel))
+        self.assertEqual(serial, parallel)
+
+    if not _PY3:
+        test_get_package_hashes_parallel.skip = (
+            "packages are only hashed in parallel on Python 3")
+
     def test_get_package_hashes(self):
         """
         C{get_package_hashes} returns the hashes for all packages in the
@@ -949,6 +1012,25 @@ class AptFacadeTest(testing.HelperTestCase, testing.FSTestCase,
         [package] = self.facade.get_packages_by_name("name1")
         self.assertTrue(self.facade.is_package_available(package))
 
+    def test_get_package_archives(self):
+        """
+        C{get_package_archives} returns the archive names of the package
+        files a version comes from, like C{version.origins} does.
+        """
+        deb_dir = self.makeDir()
+        self._add_package_to_deb_dir(deb_dir, "name1")
+        with open(os.path.join(deb_dir, "Release"), "w") as release:
+            release.write("Suite: trusty-security\n")
+        self.facade.add_channel_apt_deb(
+            "file://%s" % deb_dir, "./", trusted=True)
+        self.facade.reload_channels()
+        [package] = self.facade.get_packages_by_name("name1")
+        self.assertEqual(["trusty-security"],
+                         self.facade.get_package_archives(package))
+        self.assertEqual(
+            [origin.archive for origin in package.origins],
+            self.facade.get_package_archives(package))
+
     def test_is_package_available_not_in_channel_installed(self):
         """
         A package is not considered available if the package is
@@ -1087,6 +1169,35 @@ class AptFacadeTest(testing.HelperTestCase, testing.FSTestCase,
             sorted([(version.package.name, version.version)
                     for version in self.facade.get_packages_by_name("foo")]))
 
+    def test_get_packages_by_name_after_reload(self):
+        """
+        The packages returned by C{get_packages_by_name} are updated
+        when the channels are reloaded.
+        """
+        deb_dir = self.makeDir()
+        self._add_system_package("foo", version="1.0")
+        self._add_package_to_deb_dir(deb_dir, "bar")
+        self.facade.add_channel_apt_deb(
+            "file://%s" % deb_dir, "./", trusted=True)
+        self.facade.reload_channels()
+        self._add_package_to_deb_dir(deb_dir, "foo", version="1.5")
+        self._touch_packages_file(deb_dir)
+        self.facade.reload_channels()
+        self.assertEqual(
+            ["1.0", "1.5"],
+            sorted(version.version
+                   for version in self.facade.get_packages_by_name("foo")))
+
+    def test_get_packages_by_name_returns_new_list(self):
+        """
+        Changing the list returned by C{get_packages_by_name} doesn't
+        affect the following calls.
+        """
+        self._add_system_package("foo", version="1.0")
+        self.facade.reload_channels()
+        self.facade.get_packages_by_name("foo").pop()
+        self.assertEqual(1, len(self.facade.get_packages_by_name("foo")))
+
     def test_perform_changes_with_nothing_to_do(self):
         """
         perform_changes() should return None when there's nothing to do.
@@ -0,0 +1,134 @@
+import os
+import unittest
+
+from landscape.lib import testing
+from landscape.lib.apt.package.hashcache import PackageHashCache
+
+
+class PackageHashCacheTest(testing.FSTestCase, unittest.TestCase):
+
+    def setUp(self):
+        super(PackageHashCacheTest, self).setUp()
+        self.filename = self.makeFile()
+        self.index = self.makeFile("Package: foo\n")
+        self.cache = PackageHashCache(self.filename)
+        self.cache.load()
+
+    def reload(self):
+        """Return a new cache loaded from the same file."""
+        cache = PackageHashCache(self.filename)
+        cache.load()
+        return cache
+
+    def test_get_unknown(self):
+        """
+        L{PackageHashCache.get} returns C{None} for unknown packages.
+        """
+        self.assertIs(None, self.cache.get(self.index, "foo", "1.0", "all"))
+
+    def test_set_and_get(self):
+        """
+        Cached hashes are available right away, and after a save and load.
+        """
+        self.cache.set(self.index, "foo", "1.0", "all", b"hash")
+        self.assertEqual(b"hash",
+                         self.cache.get(self.index, "foo", "1.0", "all"))
+        self.cache.save()
+        cache = self.reload()
+        self.assertEqual(b"hash", cache.get(self.index, "foo", "1.0", "all"))
+        self.assertIs(None, cache.get(self.index, "foo", "1.1", "all"))
+
+    def test_index_file_changed(self):
+        """
+        Hashes are discarded once the index file they come from changes.
+        """
+        self.cache.set(self.index, "foo", "1.0", "all", b"hash")
+        self.cache.save()
+        with open(self.index, "a") as fd:
+            fd.write("Version: 1.0\n")
+        cache = self.reload()
+        self.assertIs(None, cache.get(self.index, "foo", "1.0", "all"))
+
+    def test_index_file_touched(self):
+        """
+        Hashes are discarded if the index file got a new modification time,
+        even if its size is the same.
+        """
+        self.cache.set(self.index, "foo", "1.0", "all", b"hash")
+        self.cache.save()
+        mtime = os.stat(self.index).st_mtime + 10
+        os.utime(self.index, (mtime, mtime))
+        cache = self.reload()
+        self.assertIs(None, cache.get(self.index, "foo", "1.0", "all"))
+
+    def test_index_file_missing(self):
+        """
+        Nothing gets cached for index files which don't exist.
+        """
+        os.unlink(self.index)
+        self.cache.set(self.index, "foo", "1.0", "all", b"hash")
+        self.assertIs(None, self.cache.get(self.index, "foo", "1.0", "all"))
+
+    def test_save_drops_unused(self):
+        """
+        Hashes which weren't used since the cache was loaded are dropped when
+        saving it.
+        """
+        self.cache.set(self.index, "foo", "1.0", "all", b"hash1")
+        self.cache.set(self.index, "bar", "1.0", "all", b"hash2")
+        self.cache.save()
+        cache = self.reload()
+        self.assertEqual(b"hash1", cache.get(self.index, "foo", "1.0", "all"))
+        cache.save()
+        cache = self.reload()
+        self.assertEqual(b"hash1", cache.get(self.index, "foo", "1.0", "all"))
+        self.assertIs(None, cache.get(self.index, "bar", "1.0", "all"))
+
+    def test_save_unchanged(self):
+        """
+        The cache file isn't written again if all the cached hashes were used
+        and none was added.
+        """
+        self.cache.set(self.index, "foo", "1.0", "all", b"hash")
+        self.cache.save()
+        os.utime(self.filename, (0, 0))
+        cache = self.reload()
+        cache.get(self.index, "foo", "1.0", "all")
+        cache.save()
+        self.assertEqual(0, os.stat(self.filename).st_mtime)
+
+    def test_save_with_temporary_file(self):
+        """
+        The cache is written to a temporary file of its own, next to the
+        cache file, which is then renamed over it.
+        """
+        directory = self.makeDir()
+        filename = os.path.join(directory, "hash-cache")
+        # Left behind by another process saving the same cache.
+        with open(filename + ".new", "wb") as fd:
+            fd.write(b"partial")
+        cache = PackageHashCache(filename)
+        cache.load()
+        cache.set(self.index, "foo", "1.0", "all", b"hash")
+        cache.save()
+        self.assertEqual(["hash-cache", "hash-cache.new"],
+                         sorted(os.listdir(directory)))
+        self.assertEqual(0o644, os.stat(filename).st_mode & 0o777)
+        with open(filename + ".new", "rb") as fd:
+            self.assertEqual(b"partial", fd.read())
+        cache = PackageHashCache(filename)
+        cache.load()
+        self.assertEqual(b"hash", cache.get(self.index, "foo", "1.0", "all"))
+
+    def test_load_invalid(self):
+        """
+        An unreadable cache file is discarded.
+        """
+        with open(self.filename, "wb") as fd:
+            fd.write(b"garbage")
+        cache = self.reload()
+        self.assertIs(None, cache.get(self.index, "foo", "1.0", "all"))
+        cache.set(self.index, "foo", "1.0", "all", b"hash")
+        cache.save()
+        self.assertEqual(b"hash",
+                         self.reload().get(self.index, "foo", "1.0", "all"))
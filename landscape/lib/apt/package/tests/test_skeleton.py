@@ -11,9 +11,9 @@ from landscape.lib.apt.package.testing import (
     HASH_MULTIPLE_RELATIONS, PKGNAME_OR_RELATIONS, PKGDEB_OR_RELATIONS,
     HASH_OR_RELATIONS)
 from landscape.lib.apt.package.skeleton import (
-    build_skeleton_apt, DEB_PROVIDES, DEB_PACKAGE,
-    DEB_NAME_PROVIDES, DEB_REQUIRES, DEB_OR_REQUIRES, DEB_UPGRADES,
-    DEB_CONFLICTS, PackageSkeleton)
+    build_skeleton_apt, get_record_hash, get_relation_fields, DEB_PROVIDES,
+    DEB_PACKAGE, DEB_NAME_PROVIDES, DEB_REQUIRES, DEB_OR_REQUIRES,
+    DEB_UPGRADES, DEB_CONFLICTS, PackageSkeleton)
 
 from twisted.python.compat import unicode
 
@@ -284,6 +284,21 @@ class SkeletonAptTest(BaseTestCase):
         self.assertEqual(relations, skeleton.relations)
         self.assertEqual(HASH_OR_RELATIONS, skeleton.get_hash())
 
+    def test_get_record_hash(self):
+        """
+        C{get_record_hash} gives the same hash as the skeleton built by
+        C{build_skeleton_apt}, from the relation fields of the version's
+        apt record.
+        """
+        for name in ["name1", "name2", "name3", "minimal",
+                     "simple-relations", "version-relations",
+                     "multiple-relations", "or-relations"]:
+            version = self.get_package(name)
+            package = (name, version.version,
+                       get_relation_fields(version.record))
+            self.assertEqual(build_skeleton_apt(version).get_hash(),
+                             get_record_hash(package))
+
 
 class SkeletonTest(BaseTestCase):
 
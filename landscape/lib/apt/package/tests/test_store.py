@@ -32,6 +32,26 @@ class HashIdStoreTest(BaseTestCase):
         self.store1.set_hash_ids(hash_ids)
         self.assertEqual(self.store1.get_hash_ids(), hash_ids)
 
+    def test_get_hash_id_map(self):
+        """
+        L{HashIdStore.get_hash_id_map} returns the ids of the given hashes,
+        leaving out the unknown ones.
+        """
+        self.store1.set_hash_ids({b"ha\x00sh1": 123, b"hash2": 456,
+                                  b"hash3": 789})
+        self.assertEqual(
+            self.store1.get_hash_id_map([b"ha\x00sh1", b"hash3", b"hash4"]),
+            {b"ha\x00sh1": 123, b"hash3": 789})
+
+    def test_get_hash_id_map_batches(self):
+        """
+        L{HashIdStore.get_hash_id_map} works with more hashes than fit in a
+        single query.
+        """
+        hash_ids = {("hash%d" % i).encode("ascii"): i for i in range(1200)}
+        self.store1.set_hash_ids(hash_ids)
+        self.assertEqual(self.store1.get_hash_id_map(hash_ids), hash_ids)
+
     def test_wb_lazy_connection(self):
         """
         The connection to the sqlite database is created only when some query
@@ -205,6 +225,21 @@ class PackageStoreTest(BaseTestCase):
         self.assertEqual(self.store1.get_hash_id(b"hash2"), 3)
         self.assertEqual(self.store1.get_hash_id(b"ha\x00sh1"), 5)
 
+    def test_get_hash_id_map_using_hash_id_dbs(self):
+        """
+        L{PackageStore.get_hash_id_map} gives the same ids as
+        L{PackageStore.get_hash_id}, querying the lookaside dbs first.
+        """
+        self.store1.set_hash_ids({b"hash1": 1, b"hash4": 6})
+        self.store1.add_hash_id_db(self.hash_id_db_factory({b"hash1": 2,
+                                                            b"hash2": 3}))
+        self.store1.add_hash_id_db(self.hash_id_db_factory({b"hash2": 4,
+                                                            b"ha\x00sh1": 5}))
+        hashes = [b"hash1", b"hash2", b"ha\x00sh1", b"hash4", b"hash5"]
+        self.assertEqual(
+            self.store1.get_hash_id_map(hashes),
+            {b"hash1": 2, b"hash2": 3, b"ha\x00sh1": 5, b"hash4": 6})
+
     def test_get_id_hash_using_hash_id_db(self):
         """
         When lookaside hash->id dbs are used, L{get_id_hash} has
@@ -234,6 +269,24 @@ class PackageStoreTest(BaseTestCase):
         self.store1.remove_available([2, 3])
         self.assertEqual(self.store2.get_available(), [1, 4])
 
+    def test_add_and_remove_many_available(self):
+        """
+        Adding and removing more ids than fit in a single SQL statement works.
+        """
+        self.store1.add_available(range(1, 5001))
+        self.store1.remove_available(range(1, 5000))
+        self.assertEqual(self.store2.get_available(), [5000])
+
+    def test_write_ahead_logging(self):
+        """
+        The package database uses write-ahead logging, so that writers don't
+        block the readers in other processes.
+        """
+        self.store1.add_available([1])
+        self.assertEqual("wal", self.store1._db.execute(
+            "PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual(self.store2.get_available(), [1])
+
     def test_clear_available(self):
         self.store1.add_available([1, 2, 3, 4])
         self.store1.clear_available()
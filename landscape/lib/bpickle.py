@@ -30,28 +30,381 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 This file is modified from the original to work with python3, but should be
 wire compatible and behave the same way (bugs notwithstanding).
+
+L{dumps} and L{loads} are implemented as single-pass functions which handle
+the builtin types inline, rather than going through a function call per
+value. The per-type functions registered in C{dumps_table} and
+C{loads_table} are kept as the reference implementation, and are still
+used for types that aren't handled inline. L{Decoder} can decode objects
+incrementally from a file-like object or a memoryview.
+
+L{chunked_dumps} returns the serialized data as a list of chunks, which can
+be streamed out without joining them, and L{EncodedDict}s let already
+serialized data be spliced into the output without encoding it again.
+L{LazyEncodedDict}s do the same, without even decoding the data unless
+their items are looked at.
 """
 
+import re
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
 from twisted.python.compat import _PY3
 
 dumps_table = {}
 loads_table = {}
 
+_CHUNK_SIZE = 64 * 1024
+
 
 def dumps(obj, _dt=dumps_table):
+    if _dt is not dumps_table:
+        return _table_dumps(obj, _dt)
+    chunks = []
     try:
-        return _dt[type(obj)](obj)
+        _encode(obj, chunks.append)
+    except KeyError as e:
+        raise ValueError("Unsupported type: %s" % e)
+    return b"".join(chunks)
+
+
+def chunked_dumps(obj):
+    """Serialize C{obj} like L{dumps}, but return a list of C{bytes} chunks.
+
+    The concatenation of the chunks is what L{dumps} would return.
+    """
+    chunks = []
+    try:
+        _encode(obj, chunks.append)
     except KeyError as e:
         raise ValueError("Unsupported type: %s" % e)
+    return chunks
+
+
+class EncodedDict(dict):
+    """A C{dict} which carries its own serialized form.
+
+    When dumped, C{encoded} is emitted verbatim rather than serializing the
+    dictionary again, so it must not be modified after creation.
+
+    @param encoded: The serialized form of the dictionary.
+    """
+
+    def __init__(self, items, encoded):
+        super(EncodedDict, self).__init__(items)
+        self.encoded = encoded
+
+
+class LazyEncodedDict(Mapping):
+    """A read-only mapping which is only decoded when its items are needed.
+
+    When dumped, C{encoded} is emitted verbatim, like for L{EncodedDict}.
+
+    @param encoded: The serialized form of a dictionary.
+    @param as_is: don't reinterpret dict keys as str, when decoding.
+    @param known: Items which are known without decoding C{encoded}, and
+        can be looked up without decoding it.
+    """
+
+    __hash__ = None
+
+    def __init__(self, encoded, as_is=False, **known):
+        self.encoded = encoded
+        self._as_is = as_is
+        self._known = known
+        self._items = None
+
+    def _get_items(self):
+        if self._items is None:
+            self._items = loads(self.encoded, as_is=self._as_is)
+        return self._items
+
+    def __getitem__(self, key):
+        if self._items is None and key in self._known:
+            return self._known[key]
+        return self._get_items()[key]
+
+    def __iter__(self):
+        return iter(self._get_items())
+
+    def __len__(self):
+        return len(self._get_items())
+
+    def __repr__(self):
+        return repr(self._get_items())
+
+    def copy(self):
+        """Return a decoded copy of the mapping, as a plain C{dict}."""
+        return dict(self._get_items())
 
 
 def loads(byte_string, _lt=loads_table, as_is=False):
     """Load a serialized byte_string.
 
-    @param byte_string: the serialized data
+    @param byte_string: the serialized data, either C{bytes} or a
+        C{memoryview}, which is decoded without copying it as a whole.
     @param _lt: the conversion map
     @param as_is: don't reinterpret dict keys as str
     """
+    if not byte_string:
+        raise ValueError("Can't load empty string")
+    if _lt is not loads_table:
+        return _table_loads(byte_string, _lt, as_is)
+    if isinstance(byte_string, memoryview):
+        return Decoder(_MemoryReader(byte_string).read, as_is=as_is).decode()
+    return _decode(byte_string, 0, as_is, _no_more_data)[0]
+
+
+def load(fileobj, as_is=False):
+    """Load a single serialized object from the file-like C{fileobj}."""
+    return Decoder(fileobj.read, as_is=as_is).decode()
+
+
+class Decoder(object):
+    """Incrementally decode serialized objects from a stream.
+
+    Data is read in chunks of C{chunk_size} bytes, so large payloads never
+    need to be held in memory as a whole in their serialized form.
+
+    @param read: A callable taking a number of bytes and returning up to that
+        many bytes, or an empty string at the end of the stream, like the
+        C{read} method of file objects.
+    @param as_is: don't reinterpret dict keys as str
+    """
+
+    def __init__(self, read, as_is=False, chunk_size=_CHUNK_SIZE):
+        self._read = read
+        self._as_is = as_is
+        self._chunk_size = chunk_size
+        self._buffer = b""
+        self._pos = 0
+
+    def decode(self):
+        """Decode and return the next object in the stream.
+
+        @raise EOFError: If the stream is exhausted.
+        @raise ValueError: If the data is corrupted or truncated.
+        """
+        if self._pos >= len(self._buffer):
+            self._buffer = self._read(self._chunk_size)
+            self._pos = 0
+            if not self._buffer:
+                raise EOFError("No more objects to decode")
+        obj, self._pos, self._buffer = _decode(
+            self._buffer, self._pos, self._as_is, self._more)
+        return obj
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.decode()
+            except EOFError:
+                return
+
+    def _more(self, buffer, pos, size=1):
+        # Read everything that's missing before joining it with the rest of
+        # the buffer, so a value spanning many chunks is copied only once.
+        chunks = [buffer[pos:]]
+        missing = max(size - len(chunks[0]), 1)
+        while missing > 0:
+            data = self._read(max(missing, self._chunk_size))
+            if not data:
+                raise ValueError("Corrupted data")
+            chunks.append(data)
+            missing -= len(data)
+        return b"".join(chunks), 0
+
+
+class _MemoryReader(object):
+    """Expose a C{memoryview} as a stream of C{bytes} chunks."""
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def read(self, size):
+        data = self._view[self._pos:self._pos + size].tobytes()
+        self._pos += len(data)
+        return data
+
+
+def _no_more_data(buffer, pos, size=1):
+    raise ValueError("Corrupted data")
+
+
+if bytes is str:
+    _text_type = unicode  # noqa
+    _int_types = (int, long)  # noqa
+else:
+    _text_type = str
+    _int_types = (int,)
+
+
+def _encode(obj, append, _dt=dumps_table):
+    """Append the serialized form of C{obj} to a list of chunks."""
+    t = type(obj)
+    if t is dict:
+        append(b"d")
+        for key in sorted(obj):
+            _encode(key, append)
+            _encode(obj[key], append)
+        append(b";")
+    elif t is list or t is tuple:
+        append(b"l" if t is list else b"t")
+        for value in obj:
+            # Inline the most common scalars, to save a call per item.
+            t = type(value)
+            if t is int:
+                append(b"i%d;" % value)
+            elif t is bytes:
+                append(b"s%d:" % len(value))
+                append(value)
+            else:
+                _encode(value, append)
+        append(b";")
+    elif t is bytes:
+        append(b"s%d:" % len(obj))
+        append(obj)
+    elif t is _text_type:
+        obj = obj.encode("utf-8")
+        append(b"u%d:" % len(obj))
+        append(obj)
+    elif t in _int_types:
+        append(b"i%d;" % obj)
+    elif t is bool:
+        append(b"b1" if obj else b"b0")
+    elif obj is None:
+        append(b"n")
+    else:
+        append(_dt[t](obj))
+
+
+_MISSING = object()
+_INT_SEQUENCE = re.compile(br"[lt]((?:i-?[0-9]+;)*);")
+
+
+def _decode(buffer, pos, as_is, more):
+    """Decode an object from C{buffer}, starting at C{pos}.
+
+    Containers are tracked on an explicit stack instead of recursing, and
+    scalar values are parsed inline.
+
+    @param more: A callable taking the buffer, the current position and
+        optionally the number of bytes needed from there, and returning a
+        new buffer with more data and the position mapped into it, or
+        raising C{ValueError} if there's no more data.
+    @return: A tuple with the decoded object, the position right after it
+        and the buffer.
+    """
+    decode_keys = _PY3 and not as_is
+    stack = []
+    # The container being filled, its type character and, for
+    # dictionaries, the key waiting for its value.
+    container = kind = None
+    key = _MISSING
+    while True:
+        char = buffer[pos:pos + 1]
+        while not char:
+            buffer, pos = more(buffer, pos)
+            char = buffer[pos:pos + 1]
+
+        if char == b"i":
+            end = buffer.find(b";", pos)
+            while end < 0:
+                buffer, pos = more(buffer, pos)
+                end = buffer.find(b";", pos)
+            value = int(buffer[pos + 1:end])
+            pos = end + 1
+        elif char == b"s" or char == b"u":
+            colon = buffer.find(b":", pos)
+            while colon < 0:
+                buffer, pos = more(buffer, pos)
+                colon = buffer.find(b":", pos)
+            start = colon + 1
+            end = start + int(buffer[pos + 1:colon])
+            while len(buffer) < end:
+                offset = pos
+                buffer, pos = more(buffer, pos, end - pos)
+                start -= offset - pos
+                end -= offset - pos
+            value = buffer[start:end]
+            if char == b"u":
+                value = value.decode("utf-8")
+            pos = end
+        elif char == b"l" or char == b"t":
+            # Sequences of integers, like package ids, are very common and
+            # can be parsed at once.
+            match = _INT_SEQUENCE.match(buffer, pos)
+            if match is None:
+                stack.append((container, kind, key))
+                container = []
+                kind = char
+                key = _MISSING
+                pos += 1
+                continue
+            items = match.group(1)
+            value = [int(item) for item in items[1:-1].split(b";i")
+                     ] if items else []
+            if char == b"t":
+                value = tuple(value)
+            pos = match.end()
+        elif char == b"d":
+            stack.append((container, kind, key))
+            container = {}
+            kind = char
+            key = _MISSING
+            pos += 1
+            continue
+        elif char == b";" and kind is not None and key is _MISSING:
+            value = tuple(container) if kind == b"t" else container
+            container, kind, key = stack.pop()
+            pos += 1
+        elif char == b"f":
+            end = buffer.find(b";", pos)
+            while end < 0:
+                buffer, pos = more(buffer, pos)
+                end = buffer.find(b";", pos)
+            value = float(buffer[pos + 1:end])
+            pos = end + 1
+        elif char == b"b":
+            while len(buffer) < pos + 2:
+                buffer, pos = more(buffer, pos)
+            value = bool(int(buffer[pos + 1:pos + 2]))
+            pos += 2
+        elif char == b"n":
+            value = None
+            pos += 1
+        else:
+            raise ValueError("Unknown type character: %s" % char)
+
+        if kind is None:
+            return value, pos, buffer
+        elif kind != b"d":
+            container.append(value)
+        elif key is _MISSING:
+            if decode_keys and isinstance(value, bytes):
+                # Although the wire format of dictionary keys is ASCII
+                # bytes, the code actually expects them to be strings,
+                # so we convert them here.
+                value = value.decode("ascii")
+            key = value
+        else:
+            container[key] = value
+            key = _MISSING
+
+
+def _table_dumps(obj, _dt=dumps_table):
+    try:
+        return _dt[type(obj)](obj)
+    except KeyError as e:
+        raise ValueError("Unsupported type: %s" % e)
+
+
+def _table_loads(byte_string, _lt=loads_table, as_is=False):
+    """Load a serialized byte_string using the per-type functions."""
     if not byte_string:
         raise ValueError("Can't load empty string")
     try:
@@ -113,6 +466,10 @@ def dumps_none(obj):
     return b"n"
 
 
+def dumps_encoded(obj):
+    return obj.encoded
+
+
 def loads_bool(bytestring, pos, as_is=False):
     return bool(int(bytestring[pos+1:pos+2])), pos+2
 
@@ -187,6 +544,8 @@ dumps_table.update({
     dict: dumps_dict,
     type(None): dumps_none,
     bytes: dumps_bytes,
+    EncodedDict: dumps_encoded,
+    LazyEncodedDict: dumps_encoded,
 })
 
 
@@ -16,20 +16,16 @@ STABLE_FILESYSTEMS = frozenset(
 EXTRACT_DEVICE = re.compile("([a-z]+)[0-9]*")
 
 
-def get_mount_info(mounts_file, statvfs_,
-                   filesystems_whitelist=STABLE_FILESYSTEMS):
+def get_mounts(mounts_file, filesystems_whitelist=STABLE_FILESYSTEMS):
     """
-    This is a generator that yields information about mounted filesystems.
+    This is a generator that yields the mounted filesystems, without
+    looking at them.
 
     @param mounts_file: A file with information about mounted filesystems,
         such as C{/proc/mounts}.
-    @param statvfs_: A function to get file status information.
     @param filesystems_whitelist: Optionally, a list of which filesystems to
-        stat.
-    @return: A C{dict} with C{device}, C{mount-point}, C{filesystem},
-        C{total-space} and C{free-space} keys. If the filesystem information
-        is not available, C{None} is returned. Both C{total-space} and
-        C{free-space} are in megabytes.
+        yield.
+    @return: C{(device, mount_point, filesystem)} tuples.
     """
     for line in open(mounts_file):
         try:
@@ -44,17 +40,45 @@ def get_mount_info(mounts_file, statvfs_,
             filesystem not in filesystems_whitelist
             ):
             continue
-        megabytes = 1024 * 1024
+        yield device, mount_point, filesystem
+
+
+def get_mount_space(device, mount_point, filesystem, stats):
+    """
+    Return information about a mounted filesystem, given its C{statvfs}
+    result C{stats}, in the format of L{get_mount_info}.
+    """
+    megabytes = 1024 * 1024
+    block_size = stats.f_bsize
+    total_space = (stats.f_blocks * block_size) // megabytes
+    free_space = (stats.f_bfree * block_size) // megabytes
+    return {"device": device, "mount-point": mount_point,
+            "filesystem": filesystem, "total-space": total_space,
+            "free-space": free_space}
+
+
+def get_mount_info(mounts_file, statvfs_,
+                   filesystems_whitelist=STABLE_FILESYSTEMS):
+    """
+    This is a generator that yields information about mounted filesystems.
+
+    @param mounts_file: A file with information about mounted filesystems,
+        such as C{/proc/mounts}.
+    @param statvfs_: A function to get file status information.
+    @param filesystems_whitelist: Optionally, a list of which filesystems to
+        stat.
+    @return: A C{dict} with C{device}, C{mount-point}, C{filesystem},
+        C{total-space} and C{free-space} keys. If the filesystem information
+        is not available, C{None} is returned. Both C{total-space} and
+        C{free-space} are in megabytes.
+    """
+    for device, mount_point, filesystem in get_mounts(
+            mounts_file, filesystems_whitelist):
         try:
             stats = statvfs_(mount_point)
         except OSError:
             continue
-        block_size = stats.f_bsize
-        total_space = (stats.f_blocks * block_size) // megabytes
-        free_space = (stats.f_bfree * block_size) // megabytes
-        yield {"device": device, "mount-point": mount_point,
-               "filesystem": filesystem, "total-space": total_space,
-               "free-space": free_space}
+        yield get_mount_space(device, mount_point, filesystem, stats)
 
 
 def get_filesystem_for_path(path, mounts_file, statvfs_):
@@ -1,9 +1,16 @@
 import os
 import sys
 import io
+import threading
+import time
 
 from optparse import OptionParser
 
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
 from twisted.internet.defer import DeferredList
 from twisted.internet.threads import deferToThread
 from twisted.python.compat import iteritems, networkString
@@ -46,12 +53,14 @@ class PyCurlError(FetchError):
 
 def fetch(url, post=False, data="", headers={}, cainfo=None, curl=None,
           connect_timeout=30, total_timeout=600, insecure=False, follow=True,
-          user_agent=None, proxy=None):
+          user_agent=None, proxy=None, header_function=None):
     """Retrieve a URL and return the content.
 
     @param url: The url to be fetched.
     @param post: If true, the POST method will be used (defaults to GET).
-    @param data: Data to be sent to the server as the POST content.
+    @param data: Data to be sent to the server as the POST content. It can
+        also be a list of C{bytes} chunks, which are streamed to the server
+        one after the other, without joining them first.
     @param headers: Dictionary of header => value entries to be used on the
         request.
     @param curl: A pycurl.Curl instance to use. If not provided, one will be
@@ -63,11 +72,18 @@ def fetch(url, post=False, data="", headers={}, cainfo=None, curl=None,
     @param follow: If True, follow HTTP redirects (default True).
     @param user_agent: The user-agent to set in the request.
     @param proxy: The proxy url to use for the request.
+    @param header_function: Optionally, a function called with each line
+        of the response headers.
     """
     import pycurl
-    if not isinstance(data, bytes):
-        data = data.encode("utf-8")
-    output = io.BytesIO(data)
+    if isinstance(data, list):
+        output = _ChunksReader(data)
+        data_size = output.size
+    else:
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8")
+        output = io.BytesIO(data)
+        data_size = len(data)
     input = io.BytesIO()
 
     if curl is None:
@@ -80,8 +96,8 @@ def fetch(url, post=False, data="", headers={}, cainfo=None, curl=None,
     if post:
         curl.setopt(pycurl.POST, True)
 
-        if data:
-            curl.setopt(pycurl.POSTFIELDSIZE, len(data))
+        if data_size:
+            curl.setopt(pycurl.POSTFIELDSIZE, data_size)
             curl.setopt(pycurl.READFUNCTION, output.read)
 
     if cainfo and url.startswith("https:"):
@@ -103,6 +119,9 @@ def fetch(url, post=False, data="", headers={}, cainfo=None, curl=None,
     if proxy is not None:
         curl.setopt(pycurl.PROXY, networkString(proxy))
 
+    if header_function is not None:
+        curl.setopt(pycurl.HEADERFUNCTION, header_function)
+
     curl.setopt(pycurl.MAXREDIRS, 5)
     curl.setopt(pycurl.CONNECTTIMEOUT, connect_timeout)
     curl.setopt(pycurl.LOW_SPEED_LIMIT, 1)
@@ -126,6 +145,135 @@ def fetch(url, post=False, data="", headers={}, cainfo=None, curl=None,
     return body
 
 
+class _ChunksReader(object):
+    """File-like reader over a list of C{bytes} chunks.
+
+    Chunks are returned as they are, or sliced when they're bigger than
+    the requested size, so they never get copied into a single buffer.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._index = 0
+        self._offset = 0
+        self.size = sum(len(chunk) for chunk in chunks)
+
+    def read(self, size=-1):
+        if size < 0:
+            data = b"".join(self._chunks[self._index:])[self._offset:]
+            self._index = len(self._chunks)
+            return data
+        while self._index < len(self._chunks):
+            chunk = self._chunks[self._index]
+            if self._offset == 0 and len(chunk) <= size:
+                self._index += 1
+                if chunk:
+                    return chunk
+                continue
+            data = chunk[self._offset:self._offset + size]
+            self._offset += len(data)
+            if self._offset >= len(chunk):
+                self._index += 1
+                self._offset = 0
+            return data
+        return b""
+
+
+class CurlPool(object):
+    """Keep curl handles alive between requests to the same host.
+
+    Reusing a handle lets curl reuse its open connection, and its TLS
+    session and DNS caches, instead of going through a new handshake for
+    every request. A handle is only ever used by one request at a time, and
+    handles which have been idle for longer than C{max_idle} seconds are
+    closed.
+
+    @param max_idle: Number of seconds an unused handle is kept around.
+    @param curl_factory: Callable creating new handles, C{pycurl.Curl} by
+        default.
+    @param clock: Callable returning the current time.
+    """
+
+    def __init__(self, max_idle=300, curl_factory=None, clock=time.time):
+        if curl_factory is None:
+            import pycurl
+            curl_factory = pycurl.Curl
+        self.max_idle = max_idle
+        self._curl_factory = curl_factory
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def _get_key(self, url):
+        parsed = urlparse(url)
+        return (parsed.scheme, parsed.hostname, parsed.port)
+
+    def _evict(self, now):
+        """Close the handles which have been idle for too long.
+
+        Must be called with the lock held.
+        """
+        for key in list(self._idle):
+            handles = []
+            for curl, last_used in self._idle[key]:
+                if now - last_used > self.max_idle:
+                    curl.close()
+                else:
+                    handles.append((curl, last_used))
+            if handles:
+                self._idle[key] = handles
+            else:
+                del self._idle[key]
+
+    def get(self, url):
+        """Return a curl handle to use for a request to C{url}.
+
+        The handle is the most recently used one for the same scheme, host
+        and port if there's any, with its options reset, or a new one.
+        """
+        with self._lock:
+            self._evict(self._clock())
+            handles = self._idle.get(self._get_key(url))
+            if handles:
+                curl = handles.pop()[0]
+                curl.reset()
+                return curl
+        return self._curl_factory()
+
+    def put(self, url, curl):
+        """Give back a curl handle obtained with L{get} after a request."""
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            self._idle.setdefault(self._get_key(url), []).append((curl, now))
+
+    def close(self):
+        """Close all the idle handles."""
+        with self._lock:
+            for handles in self._idle.values():
+                for curl, last_used in handles:
+                    curl.close()
+            self._idle.clear()
+
+    def fetch(self, url, **kwargs):
+        """Like L{fetch}, but using a handle from the pool.
+
+        Handles which hit a curl error are closed rather than given back,
+        since their connection may be in an unknown state.
+        """
+        curl = self.get(url)
+        try:
+            result = fetch(url, curl=curl, **kwargs)
+        except PyCurlError:
+            curl.close()
+            raise
+        except Exception:
+            self.put(url, curl)
+            raise
+        self.put(url, curl)
+        return result
+
+
 def fetch_async(*args, **kwargs):
     """Retrieve a URL asynchronously.
 
@@ -25,6 +25,8 @@ import re
 
 from twisted.python.compat import StringType  # Py2: basestring, Py3: str
 
+from landscape.lib.hashlib import sha1
+
 
 __all__ = ["Persist", "PickleBackend", "BPickleBackend",
            "path_string_to_tuple", "path_tuple_to_string", "RootedPersist",
@@ -33,6 +35,10 @@ __all__ = ["Persist", "PickleBackend", "BPickleBackend",
 
 NOTHING = object()
 
+# Top-level key of the manifest written by incremental saves, mapping each
+# top-level key of the persisted tree to the file holding its subtree.
+MANIFEST_KEY = "__persist_manifest__"
+
 
 class PersistError(Exception):
     pass
@@ -58,9 +64,16 @@ class Persist(object):
     @ivar filename: The name of the file where persist data is saved
         or None if no filename is available.
 
+    In incremental mode, each top-level subtree (which is what L{root_at} is
+    used for) is saved to its own file in a C{<filename>.d} directory, and
+    L{save} only writes the subtrees that changed since the last save. The
+    file at C{filename} then holds a small manifest listing the current
+    subtree files. It's replaced atomically, so a save either happens
+    entirely or not at all. Both layouts can be loaded in either mode.
+
     """
 
-    def __init__(self, backend=None, filename=None):
+    def __init__(self, backend=None, filename=None, incremental=False):
         """
         @param backend: The backend to use. If none is specified,
             L{BPickleBackend} will be used.
@@ -68,6 +81,8 @@ class Persist(object):
             specified, and the file exists, it will be immediately
             loaded. Specifying this will also allow L{save} to be called
             without any arguments to save the persist.
+        @param incremental: Whether to save only the top-level subtrees
+            which changed, instead of the whole tree.
         """
         if backend is None:
             backend = BPickleBackend()
@@ -78,6 +93,13 @@ class Persist(object):
         self._readonly = False
         self._modified = False
         self._config = self
+        self._incremental = incremental
+        # Top-level keys changed since the last incremental save, and the
+        # subtree files of the manifest at self._parts_path.
+        self._dirty = set()
+        self._parts = {}
+        self._parts_path = None
+        self._generation = 0
         self.filename = filename
         if filename is not None and os.path.exists(filename):
             self.load(filename)
@@ -118,7 +140,8 @@ class Persist(object):
                 # warning("Broken configuration file at %s" % filepath)
                 # warning("Trying backup at %s" % filepathold)
                 try:
-                    self._hardmap = self._backend.load(filepathold)
+                    self._set_hardmap(filepathold,
+                                      self._backend.load(filepathold))
                 except Exception:
                     raise PersistError("Broken configuration file at %s" %
                                        filepathold)
@@ -134,12 +157,44 @@ class Persist(object):
             load_old()
             return
         try:
-            self._hardmap = self._backend.load(filepath)
+            self._set_hardmap(filepath, self._backend.load(filepath))
+        except PersistError:
+            # A broken part of an incremental save, which the .old file
+            # predates, so it can't be used instead.
+            raise
         except Exception:
             if load_old():
                 return
             raise PersistError("Broken configuration file at %s" % filepath)
 
+    def _set_hardmap(self, filepath, map):
+        """Use the C{map} loaded from C{filepath} as the persisted tree.
+
+        If C{map} is a manifest written by an incremental save, the subtrees
+        it lists are loaded from their files.
+        """
+        self._dirty = set(map)
+        self._parts = {}
+        self._parts_path = None
+        manifest = None
+        if type(map) is dict and len(map) == 1:
+            manifest = map.get(MANIFEST_KEY)
+        if manifest is not None:
+            parts_dir = filepath + ".d"
+            map = self._backend.new()
+            for key, name in manifest["parts"].items():
+                part_path = os.path.join(parts_dir, name)
+                try:
+                    map.update(self._backend.load(part_path))
+                except Exception:
+                    raise PersistError("Broken configuration file at %s" %
+                                       part_path)
+            self._dirty = set()
+            self._parts = dict(manifest["parts"])
+            self._parts_path = filepath
+            self._generation = manifest["generation"]
+        self._hardmap = map
+
     def save(self, filepath=None):
         """Save the persist to the given C{filepath}.
 
@@ -147,19 +202,72 @@ class Persist(object):
         be used.
 
         If the destination file already exists, it will be renamed
-        to C{<filepath>.old}.
+        to C{<filepath>.old}, unless the persist is in incremental mode, in
+        which case any C{<filepath>.old} is removed instead.
         """
         if filepath is None:
             if self.filename is None:
                 raise PersistError("Need a filename!")
             filepath = self.filename
         filepath = os.path.expanduser(filepath)
-        if os.path.isfile(filepath):
-            os.rename(filepath, filepath + ".old")
         dirname = os.path.dirname(filepath)
         if dirname and not os.path.isdir(dirname):
             os.makedirs(dirname)
+        if self._incremental:
+            self._save_incremental(filepath)
+            return
+        if os.path.isfile(filepath):
+            os.rename(filepath, filepath + ".old")
         self._backend.save(filepath, self._hardmap)
+        self._parts_path = None
+
+    def _save_incremental(self, filepath):
+        """Save the subtrees which changed, and a manifest listing them all.
+
+        New subtree files get names which aren't in use by the current
+        manifest, so the files it references are left untouched until the
+        new manifest is renamed over it.
+        """
+        parts_dir = filepath + ".d"
+        if self._parts_path == filepath:
+            if not self._dirty:
+                return
+            dirty = self._dirty
+            parts = dict(self._parts)
+        else:
+            dirty = set(self._hardmap)
+            parts = {}
+        if not os.path.isdir(parts_dir):
+            os.makedirs(parts_dir)
+        generation = self._generation + 1
+        for key in dirty:
+            parts.pop(key, None)
+            if key in self._hardmap:
+                name = "%s.%d" % (sha1(repr(key).encode("utf-8")).hexdigest(),
+                                  generation)
+                self._backend.save(os.path.join(parts_dir, name),
+                                   {key: self._hardmap[key]})
+                parts[key] = name
+        manifest = {MANIFEST_KEY: {"generation": generation, "parts": parts}}
+        self._backend.save(filepath + ".new", manifest)
+        os.rename(filepath + ".new", filepath)
+        if os.path.exists(filepath + ".old"):
+            # It's from before incremental saves, and shouldn't ever be
+            # loaded instead of what was just saved.
+            os.unlink(filepath + ".old")
+
+        # Files from earlier saves, or from saves interrupted by a crash.
+        current = set(parts.values())
+        for name in os.listdir(parts_dir):
+            if name not in current:
+                try:
+                    os.unlink(os.path.join(parts_dir, name))
+                except OSError:
+                    pass
+        self._dirty = set()
+        self._parts = parts
+        self._parts_path = filepath
+        self._generation = generation
 
     def _traverse(self, obj, path, default=NOTHING, setvalue=NOTHING):
         if setvalue is not NOTHING:
@@ -260,6 +368,7 @@ class Persist(object):
         else:
             self.assert_writable()
             self._modified = True
+            self._dirty.add(path[0])
             map = self._hardmap
         self._traverse(map, path, setvalue=value)
 
@@ -274,6 +383,7 @@ class Persist(object):
         else:
             self.assert_writable()
             self._modified = True
+            self._dirty.add(path[0])
             map = self._hardmap
         if unique:
             current = self._traverse(map, path)
@@ -293,6 +403,7 @@ class Persist(object):
         else:
             self.assert_writable()
             self._modified = True
+            self._dirty.add(path[0])
             map = self._hardmap
         marker = NOTHING
         while path:
@@ -2,12 +2,81 @@ from __future__ import absolute_import
 
 import logging
 import os
+from collections import namedtuple
 from datetime import timedelta, datetime
 
+from twisted.python.compat import _PY3
+
 from landscape.lib import sysstats
 from landscape.lib.timestamp import to_timestamp
 from landscape.lib.jiffies import detect_jiffies
 
+try:
+    from os import scandir
+except ImportError:  # Python 2
+    scandir = None
+
+
+# The offsets of some /proc/<pid>/stat fields (see proc(5)), counted from
+# the process state, which comes right after the command name.
+STAT_UTIME = 11
+STAT_STIME = 12
+STAT_STARTTIME = 19
+
+# The size of the reads from /proc files, which fits most of them.
+READ_SIZE = 4096
+
+# The fields read from /proc/<pid>/status. The kernel writes VmSize after
+# the other ones, so the rest of the file isn't looked at.
+STATUS_FIELDS = ("Name", "State", "Uid", "Gid", "VmSize")
+
+
+# The fields of a process as they are read from /proc, in a tuple which is
+# much smaller than the equivalent dict. The start time is kept in jiffies
+# after boot, and C{vm_size} is C{None} for kernel threads.
+ProcessRecord = namedtuple("ProcessRecord", [
+    "pid", "name", "state", "uid", "gid", "vm_size", "percent_cpu",
+    "start_ticks"])
+
+
+def _decode(data):
+    """Return the text of C{data}, read from a /proc file."""
+    if _PY3:
+        return data.decode("utf-8", "replace")
+    return data
+
+
+def parse_status(status):
+    """Return a C{dict} of the L{STATUS_FIELDS} in a /proc/<pid>/status file.
+
+    The fields are looked up directly, rather than splitting the file in
+    lines, and the values are returned stripped.
+    """
+    status = "\n" + status
+    fields = {}
+    for field in STATUS_FIELDS:
+        start = status.find("\n%s:" % field)
+        if start == -1:
+            continue
+        start += len(field) + 2
+        end = status.find("\n", start)
+        if end == -1:
+            end = len(status)
+        fields[field] = status[start:end].strip()
+    return fields
+
+
+def parse_stat(stat):
+    """Return the fields of a /proc/<pid>/stat file, starting at the state.
+
+    The command name may contain spaces and parentheses, so the fields are
+    found after the last closing parenthesis, which ends it.
+    """
+    end = stat.rfind(")")
+    if end == -1:
+        return stat.split()[2:]
+    return stat[end + 1:].split()
+
 
 class ProcessInformation(object):
     """
@@ -29,106 +98,151 @@ class ProcessInformation(object):
         self._jiffies_per_sec = jiffies or detect_jiffies()
         self._uptime = uptime
 
-    def get_all_process_info(self):
-        """Get process information for all processes on the system."""
-        for filename in os.listdir(self._proc_dir):
+    def _get_process_dirs(self):
+        """Yield the C{(process_id, process_dir)} of each running process."""
+        if scandir is None:
+            for filename in os.listdir(self._proc_dir):
+                yield filename, os.path.join(self._proc_dir, filename)
+            return
+        for entry in scandir(self._proc_dir):
+            yield entry.name, entry.path
+
+    def get_all_process_records(self):
+        """Get a L{ProcessRecord} for all processes on the system.
+
+        The uptime is read once for all the processes.
+        """
+        uptime = self._uptime or sysstats.get_uptime()
+        for filename, process_dir in self._get_process_dirs():
             try:
                 process_id = int(filename)
             except ValueError:
                 continue
-            process_info = self.get_process_info(process_id)
-            if process_info:
-                yield process_info
+            record = self._get_process_record(process_id, process_dir, uptime)
+            if record is not None:
+                yield record
+
+    def get_all_process_info(self):
+        """Get process information for all processes on the system."""
+        for record in self.get_all_process_records():
+            yield self.get_record_info(record)
 
     def get_process_info(self, process_id):
         """
-        Parse the /proc/<pid>/cmdline and /proc/<pid>/status files for
-        information about the running process with process_id.
+        Parse the /proc/<pid>/cmdline, /proc/<pid>/status and
+        /proc/<pid>/stat files for information about the running process
+        with process_id.
+        """
+        process_dir = os.path.join(self._proc_dir, str(process_id))
+        record = self._get_process_record(
+            process_id, process_dir, self._uptime)
+        if record is None:
+            return None
+        return self.get_record_info(record)
+
+    def get_record_info(self, record):
+        """Return the process information C{dict} of a L{ProcessRecord}."""
+        process_info = {"pid": record.pid,
+                        "name": record.name,
+                        "state": record.state,
+                        "uid": record.uid,
+                        "gid": record.gid,
+                        "percent-cpu": record.percent_cpu,
+                        "start-time": self.get_start_time(record.start_ticks)}
+        if record.vm_size is not None:
+            process_info["vm-size"] = record.vm_size
+        return process_info
+
+    def get_start_time(self, start_ticks):
+        """Return the timestamp of a start time in jiffies after boot."""
+        delta = timedelta(0, start_ticks // self._jiffies_per_sec)
+        return to_timestamp(self._boot_time + delta)
+
+    def _read(self, filename):
+        """Return the text of a /proc file.
+
+        Files are read with plain system calls, which is much cheaper than
+        going through file objects, in most cases with a single read.
+        """
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            data = os.read(fd, READ_SIZE)
+            if len(data) == READ_SIZE:
+                chunks = [data]
+                while data:
+                    data = os.read(fd, READ_SIZE)
+                    chunks.append(data)
+                data = b"".join(chunks)
+        finally:
+            os.close(fd)
+        return _decode(data)
+
+    def _get_process_record(self, process_id, process_dir, uptime):
+        """
+        Get the L{ProcessRecord} of a process, from the files in its
+        C{process_dir}.
 
         The /proc filesystem doesn't behave like ext2, open files can disappear
         during the read process.
-        """
-        cmd_line_name = ""
-        process_dir = os.path.join(self._proc_dir, str(process_id))
-        process_info = {"pid": process_id}
 
+        @param uptime: The system uptime, or C{None} to read it.
+        """
         try:
-            file = open(os.path.join(process_dir, "cmdline"), "r")
-            try:
-                # cmdline is a \0 separated list of strings
-                # We take the first, and then strip off the path, leaving
-                # us with the basename.
-                cmd_line = file.readline()
-                cmd_line_name = os.path.basename(cmd_line.split("\0")[0])
-            finally:
-                file.close()
-
-            file = open(os.path.join(process_dir, "status"), "r")
-            try:
-                for line in file:
-                    parts = line.split(":", 1)
-                    if parts[0] == "Name":
-                        process_info["name"] = (cmd_line_name.strip() or
-                                                parts[1].strip())
-                    elif parts[0] == "State":
-                        state = parts[1].strip()
-                        # In Lucid, capital T is used for both tracing stop
-                        # and stopped. Starting with Natty, lowercase t is
-                        # used for tracing stop.
-                        if state == "T (tracing stop)":
-                            state = state.lower()
-                        process_info["state"] = state[0].encode("ascii")
-                    elif parts[0] == "Uid":
-                        value_parts = parts[1].split()
-                        process_info["uid"] = int(value_parts[0])
-                    elif parts[0] == "Gid":
-                        value_parts = parts[1].split()
-                        process_info["gid"] = int(value_parts[0])
-                    elif parts[0] == "VmSize":
-                        value_parts = parts[1].split()
-                        process_info["vm-size"] = int(value_parts[0])
-                        break
-            finally:
-                file.close()
-
-            file = open(os.path.join(process_dir, "stat"), "r")
-            try:
-                # These variable names are lifted directly from proc(5)
-                # utime: The number of jiffies that this process has been
-                #        scheduled in user mode.
-                # stime: The number of jiffies that this process has been
-                #        scheduled in kernel mode.
-                # cutime: The number of jiffies that this process's waited-for
-                #         children have been scheduled in user mode.
-                # cstime: The number of jiffies that this process's waited-for
-                #         children have been scheduled in kernel mode.
-                parts = file.read().split()
-                start_time = int(parts[21])
-                utime = int(parts[13])
-                stime = int(parts[14])
-                uptime = self._uptime or sysstats.get_uptime()
-                pcpu = calculate_pcpu(utime, stime, uptime,
-                                      start_time, self._jiffies_per_sec)
-                process_info["percent-cpu"] = pcpu
-                delta = timedelta(0, start_time // self._jiffies_per_sec)
-                if self._boot_time is None:
-                    logging.warning(
-                        "Skipping process (PID %s) without boot time.")
-                    return None
-                process_info["start-time"] = to_timestamp(
-                    self._boot_time + delta)
-            finally:
-                file.close()
-
-        except IOError:
+            # cmdline is a \0 separated list of strings
+            # We take the first, and then strip off the path, leaving
+            # us with the basename.
+            cmd_line = self._read(os.path.join(process_dir, "cmdline"))
+            cmd_line_name = os.path.basename(
+                cmd_line.split("\n", 1)[0].split("\0", 1)[0])
+
+            status = parse_status(
+                self._read(os.path.join(process_dir, "status")))
+            name = state = uid = gid = vm_size = None
+            if "Name" in status:
+                name = cmd_line_name.strip() or status["Name"]
+            if "State" in status:
+                state = status["State"]
+                # In Lucid, capital T is used for both tracing stop
+                # and stopped. Starting with Natty, lowercase t is
+                # used for tracing stop.
+                if state == "T (tracing stop)":
+                    state = state.lower()
+                state = state[0].encode("ascii")
+            if "Uid" in status:
+                uid = int(status["Uid"].split()[0])
+            if "Gid" in status:
+                gid = int(status["Gid"].split()[0])
+            if "VmSize" in status:
+                vm_size = int(status["VmSize"].split()[0])
+
+            # These variable names are lifted directly from proc(5)
+            # utime: The number of jiffies that this process has been
+            #        scheduled in user mode.
+            # stime: The number of jiffies that this process has been
+            #        scheduled in kernel mode.
+            stat = parse_stat(self._read(os.path.join(process_dir, "stat")))
+            start_time = int(stat[STAT_STARTTIME])
+            utime = int(stat[STAT_UTIME])
+            stime = int(stat[STAT_STIME])
+            if uptime is None:
+                uptime = sysstats.get_uptime()
+            pcpu = calculate_pcpu(utime, stime, uptime,
+                                  start_time, self._jiffies_per_sec)
+            if self._boot_time is None:
+                logging.warning(
+                    "Skipping process (PID %s) without boot time.",
+                    process_id)
+                return None
+
+        except (IOError, OSError):
             # Handle the race that happens when we find a process
             # which terminates before we open the stat file.
             return None
 
-        assert("pid" in process_info and "state" in process_info and
-               "name" in process_info and "uid" in process_info and
-               "gid" in process_info and "start-time" in process_info)
-        return process_info
+        assert(name is not None and state is not None and
+               uid is not None and gid is not None)
+        return ProcessRecord(process_id, name, state, uid, gid, vm_size,
+                             pcpu, start_time)
 
 
 def calculate_pcpu(utime, stime, uptime, start_time, hertz):
@@ -3,12 +3,20 @@ Extend the regular Twisted reactor with event-handling features.
 """
 from __future__ import absolute_import
 
+import heapq
 import logging
+import math
+import random
+import threading
 import time
 
-from twisted.internet.threads import deferToThread
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread, deferToThreadPool
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
 
 from landscape.lib.format import format_object
+from landscape.lib.log import log_failure
 
 
 class InvalidID(Exception):
@@ -32,6 +40,173 @@ class EventID(object):
         self._pair = pair
 
 
+class PeriodicCallID(object):
+    """Unique identifier for a call scheduled by a L{PeriodicScheduler}.
+
+    @ivar name: The name of the called function, for logs and stats.
+    @ivar active: Whether the call is still scheduled.
+    @ivar due: The time of the next run of the call.
+    """
+
+    def __init__(self, seconds, f, args, kwargs):
+        self.seconds = seconds
+        self.name = format_object(f)
+        self.active = True
+        self.due = None
+        self._f = f
+        self._args = args
+        self._kwargs = kwargs
+        self._running = False
+
+
+class PeriodicScheduler(object):
+    """Run periodic calls together, on shared wakeups of a reactor.
+
+    Each call runs at the multiples of its period, shifted by an offset
+    which is the same for all the calls of the scheduler. The calls whose
+    periods are multiples of each other's thus run in the same wakeup,
+    instead of each having its own timer. The offset is a random fraction
+    of the jitter, so that processes on different hosts don't all wake up
+    at the same time.
+
+    A call returning a L{Deferred} isn't run again before it fires, which
+    counts as a skipped run. The number of runs and the time they took are
+    kept for each call, see L{get_stats}.
+
+    @param reactor: The reactor to schedule wakeups with.
+    @ivar enabled: Whether L{EventHandlingReactorMixin.call_every} should
+        schedule calls with this scheduler, see L{enable}.
+    """
+
+    def __init__(self, reactor):
+        self._reactor = reactor
+        self.enabled = False
+        self._offset = 0
+        self._wheel = {}
+        self._dues = []
+        self._wakeup = None
+        self._stats = {}
+
+    def enable(self, jitter=0):
+        """Use this scheduler for the reactor's periodic calls.
+
+        @param jitter: The maximum offset, in seconds, of the wakeups.
+        """
+        self.enabled = True
+        self._offset = random.random() * jitter
+
+    def call_every(self, seconds, f, *args, **kwargs):
+        """Call a function repeatedly, every C{seconds}.
+
+        The first call happens at least C{seconds} from now.
+
+        @return: The L{PeriodicCallID} of the call.
+        """
+        call = PeriodicCallID(seconds, f, args, kwargs)
+        call.due = self._align(self._reactor.time() + seconds, seconds)
+        self._schedule(call)
+        self._set_wakeup()
+        return call
+
+    def cancel_call(self, call):
+        """Cancel a call scheduled with L{call_every}."""
+        call.active = False
+        self._stats.pop(call, None)
+
+    def get_stats(self):
+        """Return the run statistics of the scheduled calls.
+
+        @return: A C{dict} mapping the L{PeriodicCallID}s of the calls
+            which ran to C{dict}s with the number of C{runs} and C{skipped}
+            runs, and the C{total-time}, C{max-time} and C{last-time} of
+            the runs, in seconds. Several calls may have the same C{name},
+            for instance when they're methods of different instances.
+        """
+        return dict((call, dict(stats))
+                    for call, stats in self._stats.items())
+
+    def _align(self, time, seconds):
+        """Return the first wakeup of a call with a period of C{seconds}
+        which isn't before C{time}."""
+        steps = math.ceil(float(time - self._offset) / seconds)
+        return self._offset + steps * seconds
+
+    def _schedule(self, call):
+        calls = self._wheel.get(call.due)
+        if calls is None:
+            calls = self._wheel[call.due] = []
+            heapq.heappush(self._dues, call.due)
+        calls.append(call)
+
+    def _set_wakeup(self):
+        """Make sure the reactor wakes up for the earliest due calls."""
+        if not self._dues:
+            return
+        due = self._dues[0]
+        if self._wakeup is not None:
+            if self._wakeup[0] <= due:
+                return
+            self._reactor.cancel_call(self._wakeup[1])
+        delay = max(0, due - self._reactor.time())
+        self._wakeup = (due, self._reactor.call_later(delay, self._tick))
+
+    def _tick(self):
+        """Run the calls which are due, and schedule their next runs."""
+        self._wakeup = None
+        now = self._reactor.time()
+        calls = []
+        while self._dues and self._dues[0] <= now:
+            calls.extend(self._wheel.pop(heapq.heappop(self._dues)))
+        for call in calls:
+            if not call.active:
+                continue
+            call.due += call.seconds
+            if call.due <= now:
+                # The reactor woke up late, skip the runs that were missed.
+                call.due = self._align(now + call.seconds, call.seconds)
+            self._schedule(call)
+        self._set_wakeup()
+        for call in calls:
+            if call.active:
+                self._run(call)
+
+    def _run(self, call):
+        stats = self._stats.get(call)
+        if stats is None:
+            stats = self._stats[call] = {
+                "runs": 0, "skipped": 0, "total-time": 0.0, "max-time": 0.0,
+                "last-time": 0.0}
+        if call._running:
+            stats["skipped"] += 1
+            return
+
+        def record(started):
+            elapsed = time.time() - started
+            stats["runs"] += 1
+            stats["total-time"] += elapsed
+            stats["max-time"] = max(stats["max-time"], elapsed)
+            stats["last-time"] = elapsed
+
+        def finished(result, started):
+            call._running = False
+            record(started)
+            if isinstance(result, Failure):
+                log_failure(result, "Error running %s." % call.name)
+
+        started = time.time()
+        try:
+            result = call._f(*call._args, **call._kwargs)
+        except Exception:
+            logging.exception("Error running %s.", call.name)
+            record(started)
+            return
+        if isinstance(result, Deferred):
+            call._running = True
+            result.addBoth(finished, started)
+        else:
+            record(started)
+
+
 class EventHandlingReactorMixin(object):
     """Fire events identified by strings and register handlers for them.
 
@@ -40,11 +215,16 @@ class EventHandlingReactorMixin(object):
     run the real Twisted reactor (except of course if the event handlers
     themselves contain asynchronous calls that need the Twisted reactor
     running).
+
+    The handlers of each event type are kept in a list sorted by priority,
+    which is replaced rather than modified when handlers are registered or
+    cancelled, so that events can be fired without copying it.
     """
 
     def __init__(self):
         super(EventHandlingReactorMixin, self).__init__()
         self._event_handlers = {}
+        self.scheduler = PeriodicScheduler(self)
 
     def call_on(self, event_type, handler, priority=0):
         """Register an event handler.
@@ -61,9 +241,14 @@ class EventHandlingReactorMixin(object):
         """
         pair = (handler, priority)
 
-        handlers = self._event_handlers.setdefault(event_type, [])
-        handlers.append(pair)
-        handlers.sort(key=lambda pair: pair[1])
+        handlers = list(self._event_handlers.get(event_type, ()))
+        # Handlers with the same priority are called in the order they
+        # were registered.
+        index = len(handlers)
+        while index and handlers[index - 1][1] > priority:
+            index -= 1
+        handlers.insert(index, pair)
+        self._event_handlers[event_type] = handlers
 
         return EventID(event_type, pair)
 
@@ -77,16 +262,20 @@ class EventHandlingReactorMixin(object):
         @param args: Positional arguments to pass to the registered handlers.
         @param kwargs: Keyword arguments to pass to the registered handlers.
         """
-        logging.debug("Started firing %s.", event_type)
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        if debug:
+            logging.debug("Started firing %s.", event_type)
         results = []
-        # Make a copy of the handlers that are registered at this point in
-        # time, so we have a stable list in case handlers are cancelled
+        # The list of handlers is never modified, only replaced, so this is
+        # a stable list in case handlers are registered or cancelled
         # dynamically by executing the handlers themselves.
-        handlers = list(self._event_handlers.get(event_type, ()))
+        handlers = self._event_handlers.get(event_type, ())
         for handler, priority in handlers:
             try:
-                logging.debug("Calling %s for %s with priority %d.",
-                              format_object(handler), event_type, priority)
+                if debug:
+                    logging.debug("Calling %s for %s with priority %d.",
+                                  format_object(handler), event_type,
+                                  priority)
                 results.append(handler(*args, **kwargs))
             except KeyboardInterrupt:
                 logging.exception("Keyboard interrupt while running event "
@@ -100,16 +289,22 @@ class EventHandlingReactorMixin(object):
                                   "event type %r with args %r %r.",
                                   format_object(handler), event_type,
                                   args, kwargs)
-        logging.debug("Finished firing %s.", event_type)
+        if debug:
+            logging.debug("Finished firing %s.", event_type)
         return results
 
     def cancel_call(self, id):
         """Unregister an event handler.
 
-        @param id: the L{EventID} of the handler to unregister.
+        @param id: the L{EventID} of the handler to unregister, or the
+            L{PeriodicCallID} of a call to cancel.
         """
-        if type(id) is EventID:
-            self._event_handlers[id._event_type].remove(id._pair)
+        if type(id) is PeriodicCallID:
+            self.scheduler.cancel_call(id)
+        elif type(id) is EventID:
+            handlers = list(self._event_handlers[id._event_type])
+            handlers.remove(id._pair)
+            self._event_handlers[id._event_type] = handlers
         else:
             raise InvalidID("EventID instance expected, received %r" % id)
 
@@ -158,10 +353,14 @@ class EventHandlingReactor(EventHandlingReactorMixin):
         """Call a function repeatedly.
 
         Create a new L{twisted.internet.task.LoopingCall} object and
-        start it.
+        start it, unless the L{PeriodicScheduler} is enabled, in which case
+        the call is scheduled with it.
 
-        @return: the created C{LoopingCall} object.
+        @return: the created C{LoopingCall} object, or the
+            L{PeriodicCallID} of the call.
         """
+        if self.scheduler.enabled:
+            return self.scheduler.call_every(seconds, f, *args, **kwargs)
         lc = self._LoopingCall(f, *args, **kwargs)
         lc.start(seconds, now=False)
         return lc
@@ -170,10 +369,11 @@ class EventHandlingReactor(EventHandlingReactorMixin):
         """Cancel a scheduled function or event handler.
 
         @param id: The function call or handler to remove. It can be an
-            L{EventID}, a L{LoopingCall} or a C{IDelayedCall}, as returned
-            by L{call_on}, L{call_every} and L{call_later} respectively.
+            L{EventID}, a L{LoopingCall} or L{PeriodicCallID}, or a
+            C{IDelayedCall}, as returned by L{call_on}, L{call_every} and
+            L{call_later} respectively.
         """
-        if isinstance(id, EventID):
+        if isinstance(id, (EventID, PeriodicCallID)):
             return EventHandlingReactorMixin.cancel_call(self, id)
         if isinstance(id, self._LoopingCall):
             return id.stop()
@@ -208,6 +408,32 @@ class EventHandlingReactor(EventHandlingReactorMixin):
         @note: Both C{callback} and C{errback} will be executed in the
             the parent thread.
         """
+        self._handle_thread_result(
+            deferToThread(f, *args, **kwargs), callback, errback)
+
+    def create_thread_pool(self, size, name):
+        """Return a pool of at most C{size} threads, for L{call_in_pool}.
+
+        Its threads are daemon threads, and the pool isn't stopped with the
+        reactor, so that calls which never return, like C{statvfs} on a
+        dead network filesystem, don't keep the process from exiting.
+        """
+        pool = ThreadPool(0, size, name)
+        pool.threadFactory = _daemon_thread
+        pool.start()
+        return pool
+
+    def call_in_pool(self, pool, callback, errback, f, *args, **kwargs):
+        """Like L{call_in_thread}, but in one of the threads of C{pool}.
+
+        @param pool: A thread pool created by L{create_thread_pool}.
+        """
+        self._handle_thread_result(
+            deferToThreadPool(self._reactor, pool, f, *args, **kwargs),
+            callback, errback)
+
+    def _handle_thread_result(self, deferred, callback, errback):
+        """Call C{callback} or C{errback} with the result of C{deferred}."""
         def on_success(result):
             if callback:
                 return callback(result)
@@ -219,7 +445,6 @@ class EventHandlingReactor(EventHandlingReactorMixin):
             else:
                 logging.error(exc_info[1], exc_info=exc_info)
 
-        deferred = deferToThread(f, *args, **kwargs)
         deferred.addCallback(on_success)
         deferred.addErrback(on_failure)
 
@@ -249,3 +474,10 @@ class EventHandlingReactor(EventHandlingReactorMixin):
         for call in self._reactor.getDelayedCalls():
             if call.active():
                 call.cancel()
+
+
+def _daemon_thread(*args, **kwargs):
+    """Return a daemon thread, for the pools of L{create_thread_pool}."""
+    thread = threading.Thread(*args, **kwargs)
+    thread.daemon = True
+    return thread
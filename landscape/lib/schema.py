@@ -1,4 +1,11 @@
-"""A schema system. Yes. Another one!"""
+"""A schema system. Yes. Another one!
+
+Schemas coerce values with their C{coerce} method, which walks the schema
+tree for every value. L{compile_schema} instead turns a schema into a
+single function, built once, which coerces values the same way and raises
+the same L{InvalidError}s, but with the dispatch over the schema tree done
+upfront. This matters for the big lists of items some messages carry.
+"""
 from twisted.python.compat import iteritems, unicode, long
 
 
@@ -7,6 +14,46 @@ class InvalidError(Exception):
     pass
 
 
+def compile_schema(schema):
+    """Return a function coercing values like C{schema.coerce} does.
+
+    Schemas made of other schemas provide a C{compile} method returning
+    such a function, the C{coerce} method of other schemas is used as it
+    is.
+    """
+    if hasattr(schema, "compile"):
+        return schema.compile()
+    if hasattr(schema, "coerce"):
+        return schema.coerce
+
+    # Not a schema at all, like in C{List(None)} for lists which are always
+    # empty, so fail like the schema would only if it's actually used.
+    def coerce(value):
+        return schema.coerce(value)
+
+    return coerce
+
+
+def _get_accepted_types(schema):
+    """Return the types that C{schema} can possibly accept, if known.
+
+    Values of other types are sure to make C{schema.coerce} raise an
+    L{InvalidError}. Subclasses might override C{coerce}, so only the
+    schema classes defined here are known.
+    """
+    return _ACCEPTED_TYPES.get(type(schema))
+
+
+def _get_checked_types(schema):
+    """Return the types of the values that C{schema} accepts as they are.
+
+    This is only known for schemas which just check the type of values,
+    the C{coerce} method of which can then be skipped when the value is
+    an instance of one of these types.
+    """
+    return _CHECKED_TYPES.get(type(schema))
+
+
 class Constant(object):
     """Something that must be equal to a constant value."""
     def __init__(self, value):
@@ -39,6 +86,31 @@ class Any(object):
         raise InvalidError("%r did not match any schema in %s"
                            % (value, self.schemas))
 
+    def compile(self):
+        # Skip the schemas which would reject the value for its type, rather
+        # than letting them raise and format an error.
+        schemas = [(_get_accepted_types(schema), _get_checked_types(schema),
+                    compile_schema(schema))
+                   for schema in self.schemas]
+        all_schemas = self.schemas
+
+        def coerce(value):
+            for accepted_types, checked_types, coerce_schema in schemas:
+                if (accepted_types is not None and
+                        not isinstance(value, accepted_types)):
+                    continue
+                if checked_types is not None:
+                    # The schema only checks the type, which matched.
+                    return value
+                try:
+                    return coerce_schema(value)
+                except InvalidError:
+                    pass
+            raise InvalidError("%r did not match any schema in %s"
+                               % (value, all_schemas))
+
+        return coerce
+
 
 class Bool(object):
     """Something that must be a C{bool}."""
@@ -115,6 +187,35 @@ class List(object):
                     % (subvalue, self.schema, e))
         return new_list
 
+    def compile(self):
+        item_schema = self.schema
+        coerce_item = compile_schema(item_schema)
+        checked_types = _get_checked_types(item_schema)
+
+        def coerce(value):
+            if not isinstance(value, list):
+                raise InvalidError("%r is not a list" % (value,))
+            if checked_types is not None:
+                for subvalue in value:
+                    if not isinstance(subvalue, checked_types):
+                        break
+                else:
+                    return list(value)
+            try:
+                return [coerce_item(subvalue) for subvalue in value]
+            except InvalidError:
+                pass
+            # Find the offending item again, to tell which one it was.
+            for subvalue in value:
+                try:
+                    coerce_item(subvalue)
+                except InvalidError as e:
+                    raise InvalidError(
+                        "%r could not coerce with %s: %s"
+                        % (subvalue, item_schema, e))
+
+        return coerce
+
 
 class Tuple(object):
     """Something which must be a fixed-length tuple.
@@ -137,6 +238,21 @@ class Tuple(object):
             new_value.append(schema.coerce(value))
         return tuple(new_value)
 
+    def compile(self):
+        coercers = [compile_schema(schema) for schema in self.schema]
+        length = len(coercers)
+
+        def coerce(value):
+            if not isinstance(value, tuple):
+                raise InvalidError("%r is not a tuple" % (value,))
+            if len(value) != length:
+                raise InvalidError("Need %s items, got %s in %r"
+                                   % (length, len(value), value))
+            return tuple([coerce_item(item)
+                          for coerce_item, item in zip(coercers, value)])
+
+        return coerce
+
 
 class KeyDict(object):
     """Something which must be a C{dict} with defined keys.
@@ -173,6 +289,40 @@ class KeyDict(object):
             raise InvalidError("Missing keys %s" % (missing,))
         return new_dict
 
+    def compile(self):
+        schema = self.schema
+        coercers = dict(
+            (key, (_get_checked_types(value_schema),
+                   compile_schema(value_schema)))
+            for key, value_schema in iteritems(schema))
+        required_keys = set(schema) - self.optional
+
+        def coerce(value):
+            if not isinstance(value, dict):
+                raise InvalidError("%r is not a dict." % (value,))
+            new_dict = {}
+            for k, v in iteritems(value):
+                coercer = coercers.get(k)
+                if coercer is None:
+                    raise InvalidError("%r is not a valid key as per %r"
+                                       % (k, schema))
+                checked_types, coerce_value = coercer
+                if checked_types is not None and isinstance(v, checked_types):
+                    new_dict[k] = v
+                    continue
+                try:
+                    new_dict[k] = coerce_value(v)
+                except InvalidError as e:
+                    raise InvalidError(
+                        "Value of %r key of dict %r could not coerce with "
+                        "%s: %s" % (k, value, schema[k], e))
+            missing = required_keys.difference(new_dict)
+            if missing:
+                raise InvalidError("Missing keys %s" % (missing,))
+            return new_dict
+
+        return coerce
+
 
 class Dict(object):
     """Something which must be a C{dict} with arbitrary keys.
@@ -192,3 +342,37 @@ class Dict(object):
         for k, v in value.items():
             new_dict[self.key_schema.coerce(k)] = self.value_schema.coerce(v)
         return new_dict
+
+    def compile(self):
+        coerce_key = compile_schema(self.key_schema)
+        coerce_value = compile_schema(self.value_schema)
+
+        def coerce(value):
+            if not isinstance(value, dict):
+                raise InvalidError("%r is not a dict." % (value,))
+            new_dict = {}
+            for k, v in value.items():
+                new_dict[coerce_key(k)] = coerce_value(v)
+            return new_dict
+
+        return coerce
+
+
+_CHECKED_TYPES = {
+    Bool: (bool,),
+    Int: (int, long),
+    Float: (int, long, float),
+    Bytes: (bytes,),
+}
+
+_ACCEPTED_TYPES = {
+    Bool: (bool,),
+    Int: (int, long),
+    Float: (int, long, float),
+    Bytes: (bytes,),
+    Unicode: (bytes, unicode),
+    List: (list,),
+    Tuple: (tuple,),
+    KeyDict: (dict,),
+    Dict: (dict,),
+}
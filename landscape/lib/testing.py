@@ -610,6 +610,8 @@ class FakeReactor(EventHandlingReactorMixin):
         self._calls.insert(index, call)
 
     def call_every(self, seconds, f, *args, **kwargs):
+        if self.scheduler.enabled:
+            return self.scheduler.call_every(seconds, f, *args, **kwargs)
 
         def fake():
             # update the call so that cancellation will continue
@@ -656,6 +658,15 @@ class FakeReactor(EventHandlingReactorMixin):
         self._in_thread(callback, errback, f, args, kwargs)
         self._run_threaded_callbacks()
 
+    def create_thread_pool(self, size, name):
+        """Emulate L{LandscapeReactor.create_thread_pool}."""
+        return (name, size)
+
+    def call_in_pool(self, pool, callback, errback, f, *args, **kwargs):
+        """Emulate L{LandscapeReactor.call_in_pool}, like L{call_in_thread}.
+        """
+        self.call_in_thread(callback, errback, f, *args, **kwargs)
+
     def listen_unix(self, socket_path, factory):
 
         class FakePort(object):
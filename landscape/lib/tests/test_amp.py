@@ -1,16 +1,18 @@
 import unittest
 
+import mock
+
 from twisted.internet import reactor
 from twisted.internet.error import ConnectError, ConnectionDone
 from twisted.internet.task import Clock
 from twisted.internet.defer import Deferred, inlineCallbacks
 from twisted.python.failure import Failure
 
-from landscape.lib import testing
+from landscape.lib import bpickle, testing
 from landscape.lib.amp import (
-    MethodCallError, MethodCallServerProtocol, MethodCallClientProtocol,
-    MethodCallServerFactory, MethodCallClientFactory, RemoteObject,
-    MethodCallSender)
+    MethodCall, MethodCallChunk, MethodCallError, MethodCallServerProtocol,
+    MethodCallClientProtocol, MethodCallServerFactory,
+    MethodCallClientFactory, RemoteObject, MethodCallSender)
 
 
 class FakeTransport(object):
@@ -278,6 +280,57 @@ class MethodCallTest(BaseTestCase):
         self.assertEqual(80000, self.successResultOf(deferred1))
         self.assertEqual(90000, self.successResultOf(deferred2))
 
+    def test_with_long_argument_pipelined(self):
+        """
+        All the chunks of a method call with a long argument are sent right
+        away, without waiting for the previous ones to be acknowledged.
+        """
+        self.object.method = lambda word: len(word)
+        self.sender._chunk_size = 1000
+        deferred = self.sender.send_method_call(method="method",
+                                                args=["!" * 5500],
+                                                kwargs={})
+        # Five L{MethodCallChunk}s and the final L{MethodCall}.
+        self.assertEqual(6, len(self.connection.client.transport.stream))
+        self.connection.flush()
+        self.assertEqual(5500, self.successResultOf(deferred))
+
+    def test_with_long_argument_and_lost_connection(self):
+        """
+        If sending the chunks of a method call fails, the errors are logged
+        and the method call fails too.
+        """
+        self.sender._chunk_size = 1000
+        with mock.patch("landscape.lib.amp.log_failure") as log_failure:
+            deferred = self.sender.send_method_call(method="method",
+                                                    args=["!" * 2500],
+                                                    kwargs={})
+        self.connection.client.connectionLost(Failure(ConnectionDone()))
+        self.failureResultOf(deferred)
+        self.assertEqual(2, log_failure.call_count)
+        failure, message = log_failure.call_args[0]
+        failure.trap(ConnectionDone)
+        self.assertEqual("Error sending chunk of method call.", message)
+
+    def test_with_long_argument_without_size(self):
+        """
+        The receiver of a method call with a long argument copes with chunks
+        which don't carry the total size of the arguments, like the ones sent
+        by older peers.
+        """
+        self.object.method = lambda word: len(word)
+        arguments = bpickle.dumps((["!" * 2500], {}))
+        protocol = self.connection.client
+        protocol.callRemote(MethodCallChunk, sequence=1,
+                            chunk=arguments[:1000])
+        protocol.callRemote(MethodCallChunk, sequence=1,
+                            chunk=arguments[1000:2000])
+        deferred = protocol.callRemote(MethodCall, sequence=1,
+                                       method=b"method",
+                                       arguments=arguments[2000:])
+        self.connection.flush()
+        self.assertEqual({"result": 2500}, self.successResultOf(deferred))
+
     def test_with_exception(self):
         """
         If the target object method raises an exception, the remote call fails
@@ -1,5 +1,8 @@
+import io
 import unittest
 
+import mock
+
 from landscape.lib import bpickle
 
 
@@ -61,3 +64,112 @@ class BPickleTest(unittest.TestCase):
     def test_long(self):
         long = 99999999999999999999999999999
         self.assertEqual(bpickle.loads(bpickle.dumps(long)), long)
+
+    def test_same_bytes_as_table_functions(self):
+        """
+        L{bpickle.dumps} generates exactly the same bytes as the per-type
+        functions in C{dumps_table}.
+        """
+        obj = {u"type": u"packages", u"data": [(1, 2.5, None), b"\x00:;"],
+               u"flags": [True, False], u"nested": {b"key": [u"\xc0", []]},
+               u"long": 99999999999999999999999999999, u"neg": -3}
+        self.assertEqual(bpickle._table_dumps(obj), bpickle.dumps(obj))
+        self.assertEqual(bpickle._table_loads(bpickle.dumps(obj)),
+                         bpickle.loads(bpickle._table_dumps(obj)))
+
+    def test_unsupported_type(self):
+        self.assertRaises(ValueError, bpickle.dumps, object())
+        self.assertRaises(ValueError, bpickle.dumps, [set()])
+
+    def test_corrupted_data(self):
+        self.assertRaises(ValueError, bpickle.loads, b"x")
+        self.assertRaises(ValueError, bpickle.loads, b"l")
+        self.assertRaises(ValueError, bpickle.loads, b"s5:abc")
+        self.assertRaises(ValueError, bpickle.loads, b"ds3:key;")
+        self.assertRaises(ValueError, bpickle.loads, b"bpickle")
+
+    def test_memoryview(self):
+        data = bpickle.dumps({"data": [b"x" * 100, u"\xc0"]})
+        self.assertEqual(bpickle.loads(memoryview(data)),
+                         {"data": [b"x" * 100, u"\xc0"]})
+
+    def test_load_from_file(self):
+        """
+        L{bpickle.load} decodes an object from a file-like object.
+        """
+        data = bpickle.dumps({"data": [b"x" * 100, 1, 2.5, u"\xc0"]})
+        self.assertEqual(bpickle.load(io.BytesIO(data)),
+                         {"data": [b"x" * 100, 1, 2.5, u"\xc0"]})
+
+    def test_decoder_with_small_chunks(self):
+        """
+        The L{bpickle.Decoder} handles values split across chunks, and can
+        decode several objects in a row from the same stream.
+        """
+        objects = [{b"data": [b"x" * 100, 12345, -2.5e-05, u"\xc0\xc1"]},
+                   (True, None, [b""]), u"last"]
+        stream = io.BytesIO(b"".join(bpickle.dumps(obj) for obj in objects))
+        for chunk_size in (1, 2, 3, 7, 1024):
+            stream.seek(0)
+            decoder = bpickle.Decoder(stream.read, as_is=True,
+                                      chunk_size=chunk_size)
+            self.assertEqual(objects, list(decoder))
+
+    def test_decoder_with_large_value(self):
+        """
+        The L{bpickle.Decoder} reads the rest of a value spanning many chunks
+        at once, rather than one chunk at a time.
+        """
+        stream = io.BytesIO(bpickle.dumps([b"x" * 100000, b"y"]))
+        reads = []
+
+        def read(size):
+            reads.append(size)
+            return stream.read(size)
+
+        decoder = bpickle.Decoder(read, chunk_size=16)
+        self.assertEqual([b"x" * 100000, b"y"], decoder.decode())
+        self.assertTrue(len(reads) < 5)
+
+    def test_decoder_with_truncated_stream(self):
+        stream = io.BytesIO(bpickle.dumps([b"x" * 100])[:-10])
+        decoder = bpickle.Decoder(stream.read, chunk_size=16)
+        self.assertRaises(ValueError, decoder.decode)
+
+    def test_chunked_dumps(self):
+        obj = {u"data": [b"x" * 100, 1, u"\xc0"], u"none": None}
+        chunks = bpickle.chunked_dumps(obj)
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(bpickle.dumps(obj), b"".join(chunks))
+
+    def test_encoded_dict(self):
+        """
+        The serialized form of an L{EncodedDict} is spliced into the output
+        as it is.
+        """
+        encoded = bpickle.dumps({u"type": u"test"})
+        message = bpickle.EncodedDict({u"type": u"test"}, encoded)
+        self.assertEqual(encoded, bpickle.dumps(message))
+        self.assertEqual(b"l" + encoded + b";", bpickle.dumps([message]))
+        self.assertEqual({u"type": u"test"}, message)
+        message = bpickle.EncodedDict({}, b"n")
+        self.assertEqual(b"ln;", bpickle.dumps([message]))
+
+    def test_lazy_encoded_dict(self):
+        """
+        The serialized form of a L{LazyEncodedDict} is spliced into the
+        output as it is, and only decoded when its items are looked at,
+        unless they're known upfront.
+        """
+        encoded = bpickle.dumps({u"type": u"test", u"data": 1})
+        message = bpickle.LazyEncodedDict(encoded, type=u"test")
+        with mock.patch("landscape.lib.bpickle.loads") as loads:
+            self.assertEqual(b"l" + encoded + b";", bpickle.dumps([message]))
+            self.assertEqual(u"test", message["type"])
+            self.assertEqual(u"test", message.get("type"))
+            self.assertFalse(loads.called)
+        self.assertEqual(1, message["data"])
+        self.assertEqual({u"type": u"test", u"data": 1}, message)
+        self.assertEqual(message, {u"type": u"test", u"data": 1})
+        self.assertEqual({u"type": u"test", u"data": 1}, message.copy())
+        self.assertEqual(2, len(message))
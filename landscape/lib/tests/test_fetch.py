@@ -10,7 +10,7 @@ from twisted.python.compat import unicode
 from landscape.lib import testing
 from landscape.lib.fetch import (
     fetch, fetch_async, fetch_many_async, fetch_to_files,
-    url_to_filename, HTTPCodeError, PyCurlError)
+    url_to_filename, CurlPool, HTTPCodeError, PyCurlError)
 
 
 class CurlStub(object):
@@ -45,6 +45,23 @@ class CurlStub(object):
         self.performed = True
 
 
+class PooledCurlStub(CurlStub):
+    """A L{CurlStub} which can be reset and closed, like pooled handles."""
+
+    def __init__(self, *args, **kwargs):
+        super(PooledCurlStub, self).__init__(*args, **kwargs)
+        self.resets = 0
+        self.closed = False
+
+    def reset(self):
+        self.options = {}
+        self.performed = False
+        self.resets += 1
+
+    def close(self):
+        self.closed = True
+
+
 class CurlManyStub(object):
 
     def __init__(self, url_results):
@@ -148,6 +165,22 @@ class FetchTest(testing.FSTestCase, testing.TwistedTestCase,
                           pycurl.DNS_CACHE_TIMEOUT: 0,
                           pycurl.ENCODING: b"gzip,deflate"})
 
+    def test_post_data_chunks(self):
+        """
+        The data to post can be a list of chunks, which are streamed to the
+        server without joining them.
+        """
+        curl = CurlStub(b"result")
+        chunks = [b"abc", b"", b"defgh", b"i"]
+        result = fetch("http://example.com", post=True, data=chunks,
+                       curl=curl)
+        self.assertEqual(result, b"result")
+        self.assertEqual(curl.options[pycurl.POSTFIELDSIZE], 9)
+        read = curl.options[pycurl.READFUNCTION]
+        self.assertIs(chunks[0], read(4))
+        self.assertEqual([b"de", b"fg", b"h", b"i", b""],
+                         [read(2) for i in range(5)])
+
     def test_cainfo(self):
         curl = CurlStub(b"result")
         result = fetch("https://example.com", cainfo="cainfo", curl=curl)
@@ -501,3 +534,96 @@ class FetchTest(testing.FSTestCase, testing.TwistedTestCase,
 
         result.addErrback(check_error)
         return result
+
+
+class CurlPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        super(CurlPoolTest, self).setUp()
+        self.now = 1000
+        self.curls = []
+        self.pool = CurlPool(max_idle=60, curl_factory=self.create_curl,
+                             clock=lambda: self.now)
+
+    def create_curl(self):
+        curl = PooledCurlStub(b"result")
+        self.curls.append(curl)
+        return curl
+
+    def test_fetch_reuses_handle(self):
+        """
+        Requests to the same host go through the same curl handle, which is
+        reset between them.
+        """
+        self.assertEqual(b"result", self.pool.fetch("https://example.com/a"))
+        self.assertEqual(b"result", self.pool.fetch("https://example.com/b"))
+        [curl] = self.curls
+        self.assertEqual(1, curl.resets)
+        self.assertEqual(b"https://example.com/b", curl.options[pycurl.URL])
+
+    def test_fetch_per_host(self):
+        """
+        Handles are only reused for requests with the same scheme, host and
+        port.
+        """
+        self.pool.fetch("https://example.com/")
+        self.pool.fetch("http://example.com/")
+        self.pool.fetch("https://example.com:8443/")
+        self.pool.fetch("https://example.org/")
+        self.assertEqual(4, len(self.curls))
+
+    def test_get_while_in_use(self):
+        """
+        A handle is never handed out twice before being given back.
+        """
+        first = self.pool.get("https://example.com/")
+        second = self.pool.get("https://example.com/")
+        self.assertIsNot(first, second)
+        self.pool.put("https://example.com/", first)
+        self.assertIs(first, self.pool.get("https://example.com/"))
+
+    def test_evict_idle(self):
+        """
+        Handles which have been idle for longer than C{max_idle} seconds are
+        closed instead of being reused.
+        """
+        self.pool.fetch("https://example.com/")
+        self.now += 61
+        self.pool.fetch("https://example.com/")
+        first, second = self.curls
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+
+    def test_fetch_curl_error(self):
+        """
+        Handles which hit a curl error are closed and not reused.
+        """
+        self.pool.fetch("https://example.com/")
+        [curl] = self.curls
+        curl.error = pycurl.error(7, "Connection refused")
+        self.assertRaises(PyCurlError, self.pool.fetch, "https://example.com/")
+        self.assertTrue(curl.closed)
+        self.pool.fetch("https://example.com/")
+        self.assertEqual(2, len(self.curls))
+
+    def test_fetch_http_error(self):
+        """
+        Handles are given back to the pool after HTTP errors, since their
+        connection is still usable.
+        """
+        curl = self.pool.get("https://example.com/")
+        curl.infos = {pycurl.HTTP_CODE: 404}
+        self.pool.put("https://example.com/", curl)
+        self.assertRaises(HTTPCodeError, self.pool.fetch,
+                          "https://example.com/")
+        self.assertFalse(curl.closed)
+        self.assertIs(curl, self.pool.get("https://example.com/"))
+
+    def test_close(self):
+        """
+        L{CurlPool.close} closes all the idle handles.
+        """
+        self.pool.fetch("https://example.com/")
+        self.pool.fetch("https://example.org/")
+        self.pool.close()
+        self.assertEqual([True, True], [curl.closed for curl in self.curls])
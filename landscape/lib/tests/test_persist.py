@@ -482,3 +482,188 @@ class RootedPersistTest(GeneralPersistTest):
         self.assertFalse(self.persist.modified)
         self.persist.move("cd", "ef")
         self.assertTrue(self.persist.modified)
+
+
+class IncrementalPersistTest(testing.FSTestCase, unittest.TestCase):
+
+    def setUp(self):
+        super(IncrementalPersistTest, self).setUp()
+        self.filename = os.path.join(self.makeDir(), "persist.bpickle")
+        self.parts_dir = self.filename + ".d"
+        self.persist = Persist(filename=self.filename, incremental=True)
+
+    def get_parts(self):
+        return sorted(os.listdir(self.parts_dir))
+
+    def test_save_and_load(self):
+        """
+        An incremental persist can be loaded back both in incremental mode
+        and by a plain L{Persist}.
+        """
+        self.persist.set("a.b", 1)
+        self.persist.set("c", [1, 2])
+        self.persist.save()
+
+        persist = Persist(filename=self.filename, incremental=True)
+        self.assertEqual({"a": {"b": 1}, "c": [1, 2]},
+                         persist.get((), hard=True))
+        persist = Persist(filename=self.filename)
+        self.assertEqual({"a": {"b": 1}, "c": [1, 2]},
+                         persist.get((), hard=True))
+
+    def test_save_writes_a_file_per_top_level_key(self):
+        self.persist.set("a.b", 1)
+        self.persist.set("c", 2)
+        self.persist.save()
+        self.assertEqual(2, len(self.get_parts()))
+
+    def test_save_only_changed_parts(self):
+        """
+        Only the top-level subtrees which changed since the last save are
+        written again.
+        """
+        self.persist.set("a.b", 1)
+        self.persist.set("c", 2)
+        self.persist.save()
+        parts = self.get_parts()
+
+        self.persist.root_at("a").set("b", 3)
+        self.persist.save()
+        new_parts = self.get_parts()
+        self.assertEqual(2, len(new_parts))
+        self.assertEqual(1, len(set(parts) & set(new_parts)))
+
+        persist = Persist(filename=self.filename)
+        self.assertEqual({"a": {"b": 3}, "c": 2}, persist.get((), hard=True))
+
+    def test_save_without_changes(self):
+        """Nothing is written if nothing changed since the last save."""
+        self.persist.set("a", 1)
+        self.persist.save()
+        mtime = os.path.getmtime(self.filename)
+        os.utime(self.filename, (0, 0))
+        self.persist.save()
+        self.assertEqual(0, os.path.getmtime(self.filename))
+        self.assertNotEqual(0, mtime)
+
+    def test_save_after_load_only_changed_parts(self):
+        """
+        Loading an incremental persist keeps track of its parts, so the
+        following save only writes what changed.
+        """
+        self.persist.set("a", 1)
+        self.persist.set("c", 2)
+        self.persist.save()
+        parts = self.get_parts()
+
+        persist = Persist(filename=self.filename, incremental=True)
+        persist.set("c", 3)
+        persist.save()
+        self.assertEqual(1, len(set(parts) & set(self.get_parts())))
+
+    def test_remove_top_level_key(self):
+        """Removing a top-level subtree removes its file too."""
+        self.persist.set("a", 1)
+        self.persist.set("c", 2)
+        self.persist.save()
+        self.persist.remove("a")
+        self.persist.save()
+        self.assertEqual(1, len(self.get_parts()))
+        persist = Persist(filename=self.filename)
+        self.assertEqual({"c": 2}, persist.get((), hard=True))
+
+    def test_save_removes_stale_parts(self):
+        """
+        Part files left over by a save which didn't complete are removed
+        by the next one.
+        """
+        self.persist.set("a", 1)
+        self.persist.save()
+        self.makeFile("", dirname=self.parts_dir, basename="leftover.2")
+        self.persist.set("a", 2)
+        self.persist.save()
+        self.assertEqual(1, len(self.get_parts()))
+        self.assertNotIn("leftover.2", self.get_parts())
+
+    def test_interrupted_save(self):
+        """
+        The manifest is replaced atomically, so if a save fails before that
+        the previously saved data is still loaded.
+        """
+        self.persist.set("a", 1)
+        self.persist.set("c", 2)
+        self.persist.save()
+
+        self.persist.set("a", 3)
+        self.persist.set("c", 4)
+        original_rename = os.rename
+        self.addCleanup(setattr, os, "rename", original_rename)
+
+        def rename(*args):
+            raise OSError("Crash!")
+
+        os.rename = rename
+        self.assertRaises(OSError, self.persist.save)
+        os.rename = original_rename
+
+        persist = Persist(filename=self.filename)
+        self.assertEqual({"a": 1, "c": 2}, persist.get((), hard=True))
+
+    def test_load_full_save(self):
+        """
+        A persist saved in full can be loaded in incremental mode, and the
+        following save writes all its subtrees.
+        """
+        persist = Persist(filename=self.filename)
+        persist.set("a", 1)
+        persist.set("c", 2)
+        persist.save()
+
+        persist = Persist(filename=self.filename, incremental=True)
+        persist.save()
+        self.assertEqual(2, len(self.get_parts()))
+        persist = Persist(filename=self.filename)
+        self.assertEqual({"a": 1, "c": 2}, persist.get((), hard=True))
+
+    def test_save_removes_old_file(self):
+        """
+        The C{.old} file left by a full save is removed by the first
+        incremental one, since it's older than what the parts hold.
+        """
+        persist = Persist(filename=self.filename)
+        persist.set("a", 1)
+        persist.save()
+        persist.save()
+        self.assertTrue(os.path.exists(self.filename + ".old"))
+
+        persist = Persist(filename=self.filename, incremental=True)
+        persist.set("a", 2)
+        persist.save()
+        self.assertFalse(os.path.exists(self.filename + ".old"))
+
+    def test_load_with_broken_part(self):
+        """
+        A missing or broken part file makes loading fail, rather than
+        loading an old C{.old} file instead.
+        """
+        self.persist.set("a", 1)
+        self.persist.save()
+        old_persist = Persist()
+        old_persist.set("a", 0)
+        old_persist.save(self.filename + ".old")
+        [part] = self.get_parts()
+        with open(os.path.join(self.parts_dir, part), "w") as fd:
+            fd.write("broken")
+        self.assertRaises(PersistError, Persist, filename=self.filename)
+
+        os.unlink(os.path.join(self.parts_dir, part))
+        self.assertRaises(PersistError, Persist, filename=self.filename)
+
+    def test_save_to_other_file(self):
+        """Saving to another file writes all the subtrees there."""
+        self.persist.set("a", 1)
+        self.persist.save()
+        filename = self.filename + "-other"
+        self.persist.save(filename)
+        persist = Persist(filename=filename)
+        self.assertEqual({"a": 1}, persist.get((), hard=True))
@@ -3,7 +3,8 @@ import os
 import unittest
 
 from landscape.lib import testing
-from landscape.lib.process import calculate_pcpu, ProcessInformation
+from landscape.lib.process import (
+    calculate_pcpu, ProcessInformation, ProcessRecord)
 from landscape.lib.fs import create_text_file
 
 
@@ -40,53 +41,88 @@ class ProcessInfoTest(testing.FSTestCase, unittest.TestCase):
         create_text_file(os.path.join(process_dir, "stat"), stat)
 
     @mock.patch("landscape.lib.process.detect_jiffies", return_value=1)
-    @mock.patch("os.listdir")
-    @mock.patch("landscape.lib.sysstats.get_uptime")
-    def test_missing_process_race(self, get_uptime_mock, list_dir_mock,
-                                  jiffies_mock):
+    @mock.patch("landscape.lib.sysstats.get_uptime", return_value=1.0)
+    def test_missing_process_race(self, get_uptime_mock, jiffies_mock):
         """
-        We use os.listdir("/proc") to get the list of active processes, if a
+        We list the /proc directory to get the list of active processes, if a
         process ends before we attempt to read the process' information, then
         this should not trigger an error.
         """
+        process_dir = os.path.join(self.proc_dir, "12345")
+        os.mkdir(process_dir)
+        create_text_file(os.path.join(process_dir, "cmdline"), "test-binary")
+        process_info = ProcessInformation(self.proc_dir)
+        self.assertEqual([], list(process_info.get_all_process_info()))
+
+    def test_get_all_process_info(self):
+        """
+        C{get_all_process_info} returns the information of each process,
+        reading the uptime only once.
+        """
+        self._add_process_info(12)
+        self._add_process_info(13)
+        with mock.patch("landscape.lib.sysstats.get_uptime",
+                        return_value=100.0) as get_uptime_mock:
+            process_info = ProcessInformation(self.proc_dir, jiffies=1,
+                                              boot_time=0)
+            processes = sorted(process_info.get_all_process_info(),
+                               key=lambda info: info["pid"])
+        self.assertEqual(1, get_uptime_mock.call_count)
+        self.assertEqual([12, 13], [info["pid"] for info in processes])
+        self.assertEqual({"pid": 12, "name": "foo", "state": b"R",
+                          "uid": 1000, "gid": 2000, "vm-size": 3000,
+                          "percent-cpu": 34.2, "start-time": 21},
+                         processes[0])
+
+    @mock.patch("landscape.lib.sysstats.get_uptime", return_value=100.0)
+    def test_get_all_process_records(self, get_uptime_mock):
+        """
+        C{get_all_process_records} returns a L{ProcessRecord} for each
+        process, with the start time in jiffies after boot, which
+        C{get_record_info} turns into the process information.
+        """
+        self._add_process_info(12)
+        process_info = ProcessInformation(self.proc_dir, jiffies=1,
+                                          boot_time=0)
+        [record] = process_info.get_all_process_records()
+        self.assertEqual(
+            ProcessRecord(12, "foo", b"R", 1000, 2000, 3000, 34.2, 21),
+            record)
+        self.assertEqual(process_info.get_process_info(12),
+                         process_info.get_record_info(record))
 
-        class FakeFile(object):
-
-            def __init__(self, response=""):
-                self._response = response
-                self.closed = False
-
-            def readline(self):
-                return self._response
-
-            def __iter__(self):
-                if self._response is None:
-                    raise IOError("Fake file error")
-                else:
-                    yield self._response
-
-            def close(self):
-                self.closed = True
-
-        list_dir_mock.return_value = ["12345"]
-        get_uptime_mock.return_value = 1.0
-        fakefile1 = FakeFile("test-binary")
-        fakefile2 = FakeFile(None)
-        with mock.patch(
-                "landscape.lib.process.open", mock.mock_open(), create=True,
-                ) as open_mock:
-            # This means "return fakefile1, then fakefile2"
-            open_mock.side_effect = [fakefile1, fakefile2]
-            process_info = ProcessInformation("/proc")
-            processes = list(process_info.get_all_process_info())
-            calls = [
-                mock.call("/proc/12345/cmdline", "r"),
-                mock.call("/proc/12345/status", "r")]
-            open_mock.assert_has_calls(calls)
-        self.assertEqual(processes, [])
-        list_dir_mock.assert_called_with("/proc")
-        self.assertTrue(fakefile1.closed)
-        self.assertTrue(fakefile2.closed)
+    def test_get_process_info_name_with_spaces(self):
+        """
+        The fields of the stat file are found after the command name, which
+        may contain spaces and parentheses.
+        """
+        self._add_process_info(12)
+        stat = "12 (foo (bar) baz) R " + " ".join(
+            str(index) for index in range(3, 44))
+        create_text_file(os.path.join(self.proc_dir, "12", "stat"), stat)
+        process_info = ProcessInformation(self.proc_dir, jiffies=1,
+                                          boot_time=0, uptime=100)
+        info = process_info.get_process_info(12)
+        self.assertEqual(21, info["start-time"])
+
+    def test_get_process_info_long_status(self):
+        """
+        Files which take more than one read are read completely.
+        """
+        self._add_process_info(12)
+        status = "\n".join([
+            "Name: foo",
+            "State: S (sleeping)",
+            "Uid: 1000",
+            "Gid: 2000",
+            "Groups: %s" % " ".join(str(i) for i in range(5000)),
+            "VmSize: 3000"])
+        create_text_file(os.path.join(self.proc_dir, "12", "status"), status)
+        process_info = ProcessInformation(self.proc_dir, jiffies=1,
+                                          boot_time=0, uptime=100)
+        info = process_info.get_process_info(12)
+        self.assertEqual(3000, info["vm-size"])
+        self.assertEqual(b"S", info["state"])
 
     def test_get_process_info_state(self):
         """
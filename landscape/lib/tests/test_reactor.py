@@ -1,10 +1,17 @@
+import logging
 import time
+import threading
 import types
 import unittest
 
+import mock
+
+from twisted.internet.defer import Deferred
+
 from landscape.lib import testing
 from landscape.lib.compat import thread
-from landscape.lib.reactor import EventHandlingReactor
+from landscape.lib.format import format_object
+from landscape.lib.reactor import EventHandlingReactor, PeriodicCallID
 from landscape.lib.testing import FakeReactor
 
 
@@ -347,6 +354,38 @@ class ReactorTestMixin(object):
         self.assertTrue("ZeroDivisionError" in self.logfile.getvalue(),
                         self.logfile.getvalue())
 
+    def test_call_in_pool(self):
+        """
+        C{call_in_pool} runs a function in a daemon thread of a dedicated
+        pool, and calls back in the main thread with its result.
+        """
+        reactor = self.get_reactor()
+        pool = reactor.create_thread_pool(1, "test-pool")
+        if not isinstance(reactor, FakeReactor):
+            self.addCleanup(pool.stop)
+
+        called = []
+
+        def f(a, b):
+            thread = threading.current_thread()
+            called.append((a, b, thread.name, thread.daemon))
+            return a + b
+
+        def callback(result):
+            called.append(result)
+
+        reactor.call_in_pool(pool, callback, None, f, 1, b=2)
+
+        reactor.call_later(0.7, reactor.stop)
+        reactor.run()
+
+        self.assertEqual(2, len(called))
+        self.assertEqual((1, 2), called[0][:2])
+        self.assertEqual(3, called[1])
+        if not isinstance(reactor, FakeReactor):
+            self.assertIn("test-pool", called[0][2])
+            self.assertTrue(called[0][3])
+
     def test_call_in_main(self):
         reactor = self.get_reactor()
 
@@ -394,6 +433,57 @@ class ReactorTestMixin(object):
         reactor.fire("foobar")
         self.assertEqual([True], calls)
 
+    def test_registering_handlers(self):
+        """
+        If a handler registers another handler in-flight, the new handler is
+        only called the next time the event is fired.
+        """
+        reactor = self.get_reactor()
+        calls = []
+
+        def handler_1():
+            reactor.call_on("foobar", lambda: calls.append(2), priority=1)
+
+        reactor.call_on("foobar", handler_1)
+        reactor.call_on("foobar", lambda: calls.append(3), priority=2)
+
+        reactor.fire("foobar")
+        self.assertEqual([3], calls)
+        calls.pop()
+        reactor.fire("foobar")
+        self.assertEqual([2, 3], calls)
+
+    def test_same_priority_order(self):
+        """
+        Handlers with the same priority are called in the order they were
+        registered, including after other handlers are cancelled.
+        """
+        reactor = self.get_reactor()
+        called = []
+        reactor.call_on("foobar", lambda: called.append(1))
+        event_id = reactor.call_on("foobar", lambda: called.append(2))
+        reactor.call_on("foobar", lambda: called.append(0), priority=-1)
+        reactor.call_on("foobar", lambda: called.append(3))
+        reactor.cancel_call(event_id)
+        reactor.call_on("foobar", lambda: called.append(4))
+        reactor.fire("foobar")
+        self.assertEqual([0, 1, 3, 4], called)
+
+    def test_fire_without_debug_logging(self):
+        """
+        Handlers aren't formatted for the log when debug logging is
+        disabled.
+        """
+        reactor = self.get_reactor()
+        reactor.call_on("foobar", lambda: None)
+        logger = logging.getLogger()
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.setLevel, level)
+        with mock.patch("landscape.lib.reactor.format_object") as format_mock:
+            reactor.fire("foobar")
+        self.assertFalse(format_mock.called)
+
 
 class FakeReactorTest(testing.HelperTestCase, ReactorTestMixin,
                       unittest.TestCase):
@@ -444,3 +534,139 @@ class EventHandlingReactorTest(testing.HelperTestCase, ReactorTestMixin,
     def test_real_time(self):
         reactor = self.get_reactor()
         self.assertTrue(reactor.time() - time.time() < 3)
+
+
+class PeriodicSchedulerTest(testing.HelperTestCase, unittest.TestCase):
+
+    def setUp(self):
+        super(PeriodicSchedulerTest, self).setUp()
+        self.reactor = FakeReactor()
+        self.scheduler = self.reactor.scheduler
+        self.scheduler.enable()
+
+    def test_coalesced_runs(self):
+        """
+        Calls run at the multiples of their periods, so that calls with
+        periods which are multiples of each other run in the same wakeups.
+        """
+        runs = []
+        self.scheduler.call_every(5, lambda: runs.append((5, time())))
+        self.reactor.advance(2)
+        self.scheduler.call_every(10, lambda: runs.append((10, time())))
+        self.reactor.advance(1)
+        self.scheduler.call_every(30, lambda: runs.append((30, time())))
+        time = self.reactor.time
+        self.reactor.advance(57)
+        runs.sort(key=lambda run: (run[1], run[0]))
+        self.assertEqual(
+            [(5, 5), (5, 10), (5, 15), (5, 20), (10, 20), (5, 25), (5, 30),
+             (10, 30), (5, 35), (5, 40), (10, 40), (5, 45), (5, 50),
+             (10, 50), (5, 55), (5, 60), (10, 60), (30, 60)], runs)
+        # There's a single reactor call, for the next wakeup.
+        self.assertEqual(1, len(self.reactor._calls))
+
+    def test_jitter(self):
+        """
+        The wakeups are offset by a random fraction of the jitter.
+        """
+        scheduler = FakeReactor().scheduler
+        with mock.patch("random.random", return_value=0.5):
+            scheduler.enable(jitter=4)
+        runs = []
+        scheduler.call_every(5, lambda: runs.append(scheduler._reactor.time()))
+        scheduler._reactor.advance(20)
+        self.assertEqual([7, 12, 17], runs)
+
+    def test_reactor_call_every(self):
+        """
+        When the scheduler is enabled, the reactor's C{call_every} uses it,
+        and its calls can be cancelled with C{cancel_call}.
+        """
+        runs = []
+        call = self.reactor.call_every(5, runs.append, True)
+        self.assertEqual(PeriodicCallID, type(call))
+        self.reactor.advance(10)
+        self.reactor.cancel_call(call)
+        self.reactor.advance(10)
+        self.assertEqual([True, True], runs)
+
+    def test_cancel_in_same_wakeup(self):
+        """
+        A call cancelled by another call of the same wakeup doesn't run.
+        """
+        runs = []
+        self.scheduler.call_every(
+            5, lambda: self.scheduler.cancel_call(second))
+        second = self.scheduler.call_every(5, runs.append, True)
+        self.reactor.advance(10)
+        self.assertEqual([], runs)
+
+    def test_error(self):
+        """
+        A call raising an error is logged, and still runs again.
+        """
+        self.log_helper.ignore_errors(ZeroDivisionError)
+        runs = []
+
+        def explode():
+            runs.append(True)
+            1 / 0
+
+        call = self.scheduler.call_every(5, explode)
+        self.reactor.advance(10)
+        self.assertEqual([True, True], runs)
+        self.assertIn("Error running %s." % format_object(explode),
+                      self.logfile.getvalue())
+        self.assertEqual(2, self.scheduler.get_stats()[call]["runs"])
+
+    def test_deferred_runs_are_not_overlapped(self):
+        """
+        A call returning a L{Deferred} isn't run again until it fires, and
+        its stats include the time until it does.
+        """
+        deferreds = []
+
+        def run():
+            deferreds.append(Deferred())
+            return deferreds[-1]
+
+        call = self.scheduler.call_every(5, run)
+        self.reactor.advance(10)
+        self.assertEqual(1, len(deferreds))
+        stats = self.scheduler.get_stats()[call]
+        self.assertEqual(0, stats["runs"])
+        self.assertEqual(1, stats["skipped"])
+
+        with mock.patch("time.time", return_value=time.time() + 3):
+            deferreds[0].callback(None)
+        self.reactor.advance(5)
+        self.assertEqual(2, len(deferreds))
+        stats = self.scheduler.get_stats()[call]
+        self.assertEqual(1, stats["runs"])
+        self.assertTrue(3 <= stats["max-time"] < 4)
+        self.assertEqual(stats["max-time"], stats["total-time"])
+
+    def test_stats_per_call(self):
+        """
+        The stats are kept for each call, even when several calls have the
+        same name, and are dropped when a call is cancelled.
+        """
+        class Plugin(object):
+
+            def __init__(self):
+                self.runs = 0
+
+            def run(self):
+                self.runs += 1
+
+        plugin1 = Plugin()
+        plugin2 = Plugin()
+        call1 = self.scheduler.call_every(5, plugin1.run)
+        call2 = self.scheduler.call_every(10, plugin2.run)
+        self.assertEqual(call1.name, call2.name)
+        self.reactor.advance(10)
+        stats = self.scheduler.get_stats()
+        self.assertEqual(2, stats[call1]["runs"])
+        self.assertEqual(1, stats[call2]["runs"])
+        self.scheduler.cancel_call(call1)
+        self.assertEqual([call2], list(self.scheduler.get_stats()))
@@ -2,7 +2,7 @@ import unittest
 
 from landscape.lib.schema import (
     InvalidError, Constant, Bool, Int, Float, Bytes, Unicode, List, KeyDict,
-    Dict, Tuple, Any)
+    Dict, Tuple, Any, compile_schema)
 
 from twisted.python.compat import long
 
@@ -201,3 +201,76 @@ class BasicTypesTest(unittest.TestCase):
 
     def test_dict_wrong_type(self):
         self.assertRaises(InvalidError, Dict(Int(), Int()).coerce, 32)
+
+
+class CompiledSchemaTest(unittest.TestCase):
+
+    def assertSameResult(self, schema, value):
+        """
+        Assert that the compiled C{schema} coerces C{value} like the schema
+        does, or raises the same error.
+        """
+        try:
+            expected = schema.coerce(value)
+        except InvalidError as e:
+            with self.assertRaises(InvalidError) as context:
+                compile_schema(schema)(value)
+            self.assertEqual(str(e), str(context.exception))
+        else:
+            self.assertEqual(expected, compile_schema(schema)(value))
+
+    def test_simple(self):
+        """Schemas without other schemas aren't compiled."""
+        schema = Int()
+        self.assertEqual(schema.coerce, compile_schema(schema))
+        self.assertSameResult(schema, 3)
+        self.assertSameResult(schema, u"3")
+
+    def test_any(self):
+        schema = Any(Tuple(Int(), Int()), Int(), Unicode(), DummySchema())
+        self.assertSameResult(schema, (1, 2))
+        self.assertSameResult(schema, 1)
+        self.assertSameResult(schema, b"foo")
+        self.assertSameResult(schema, object())
+
+    def test_any_bad(self):
+        self.assertSameResult(Any(Constant(None), Unicode()), object())
+
+    def test_list(self):
+        schema = List(Unicode())
+        self.assertSameResult(schema, [u"foo", b"bar"])
+        self.assertSameResult(schema, [u"foo", 1, 2])
+        self.assertSameResult(schema, (u"foo",))
+
+    def test_list_not_a_schema(self):
+        """
+        Lists whose schema isn't a schema can be compiled, but only coerce
+        empty lists.
+        """
+        coerce = compile_schema(List(None))
+        self.assertEqual([], coerce([]))
+        self.assertRaises(AttributeError, coerce, [1])
+
+    def test_tuple(self):
+        schema = Tuple(Int(), Unicode())
+        self.assertSameResult(schema, (1, b"foo"))
+        self.assertSameResult(schema, (1, 2))
+        self.assertSameResult(schema, (1,))
+        self.assertSameResult(schema, [1, b"foo"])
+
+    def test_key_dict(self):
+        schema = KeyDict({"foo": Int(), "bar": List(Int())},
+                         optional=["bar"])
+        self.assertSameResult(schema, {"foo": 1, "bar": [1, 2]})
+        self.assertSameResult(schema, {"foo": 1})
+        self.assertSameResult(schema, {"foo": 1, "bar": [1, u"2"]})
+        self.assertSameResult(schema, {"foo": 1, "baz": 2})
+        self.assertSameResult(schema, {"bar": []})
+        self.assertSameResult(schema, [])
+
+    def test_dict(self):
+        schema = Dict(Unicode(), Int())
+        self.assertSameResult(schema, {b"foo": 1})
+        self.assertSameResult(schema, {1: 1})
+        self.assertSameResult(schema, {u"foo": u"1"})
+        self.assertSameResult(schema, [])
@@ -1,6 +1,33 @@
 from unittest import TestCase
 
-from landscape.lib.versioning import is_version_higher, sort_versions
+from landscape.lib.versioning import (
+    is_version_higher, parse_version, sort_versions)
+
+
+class ParseVersionTest(TestCase):
+
+    def test_parse(self):
+        """
+        The C{parse_version} function parses versions like L{StrictVersion},
+        into tuples.
+        """
+        self.assertEqual(((3, 2, 0), 1), parse_version(b"3.2"))
+        self.assertEqual(((3, 2, 1), 1), parse_version(b"3.2.1"))
+        self.assertEqual(((3, 2, 0), 0, "a", 1), parse_version(b"3.2a1"))
+
+    def test_prerelease(self):
+        """Pre-releases are lower than the release."""
+        self.assertTrue(parse_version(b"3.2a1") < parse_version(b"3.2b1"))
+        self.assertTrue(parse_version(b"3.2b1") < parse_version(b"3.2"))
+        self.assertTrue(parse_version(b"3.1") < parse_version(b"3.2a1"))
+
+    def test_cached(self):
+        """Versions are only parsed once."""
+        self.assertIs(parse_version(b"3.2"), parse_version(b"3.2"))
+
+    def test_invalid(self):
+        """Invalid versions can't be parsed."""
+        self.assertRaises(ValueError, parse_version, b"3.x")
 
 
 class IsVersionHigherTest(TestCase):
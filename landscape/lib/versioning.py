@@ -3,6 +3,32 @@
 from distutils.version import StrictVersion
 
 
+_parsed_versions = {}
+
+
+def parse_version(version):
+    """Parse a software version into a tuple which compares like it.
+
+    Versions are parsed like L{StrictVersion} does, so b"3.2" becomes
+    C{((3, 2, 0), 1)} and pre-releases like b"3.2a1" become
+    C{((3, 2, 0), 0, "a", 1)}, sorting before the release. Only a few
+    distinct versions are ever used, so they're parsed once and cached.
+
+    @param version: The version to parse, as C{bytes}.
+    """
+    try:
+        return _parsed_versions[version]
+    except KeyError:
+        pass
+    strict_version = StrictVersion(version.decode("ascii"))
+    if strict_version.prerelease:
+        parsed = (strict_version.version, 0) + strict_version.prerelease
+    else:
+        parsed = (strict_version.version, 1)
+    _parsed_versions[version] = parsed
+    return parsed
+
+
 def is_version_higher(version1, version2):
     """Check if a version is higher than another.
 
@@ -18,9 +44,7 @@ def is_version_higher(version1, version2):
     @return: C{True} if the first version is greater than or equal to
         the second.
     """
-    version1 = version1.decode("ascii")
-    version2 = version2.decode("ascii")
-    return StrictVersion(version1) >= StrictVersion(version2)
+    return parse_version(version1) >= parse_version(version2)
 
 
 def sort_versions(versions):
@@ -28,8 +52,4 @@ def sort_versions(versions):
 
     @param version: a C{list} of C{bytes} describing a version.
     """
-    strict_versions = sorted(
-        [StrictVersion(version.decode("ascii")) for version in versions],
-        reverse=True)
-    return [str(strict_version).encode("ascii")
-            for strict_version in strict_versions]
+    return sorted(versions, key=parse_version, reverse=True)
@@ -15,6 +15,10 @@ class Message(KeyDict):
     @param optional: An optional list of keys that should be optional.
     @param api: The server API version needed to send this message,
         if C{None} any version is fine.
+
+    Messages are compiled (see L{landscape.lib.schema.compile_schema}) when
+    they're created, so the schema tree isn't walked again for each message
+    being coerced.
     """
     def __init__(self, type, schema, optional=None, api=None):
         self.type = type
@@ -27,13 +31,23 @@ class Message(KeyDict):
         else:
             optional = ["timestamp", "api"]
         super(Message, self).__init__(schema, optional=optional)
+        self._coerce = self.compile()
 
     def coerce(self, value):
-        for k in list(value.keys()):
-            if k not in self.schema:
-                # We don't know about this field, just discard it. This
-                # is useful when a client that introduced some new field
-                # in a message talks to an older server, that don't understand
-                # the new field yet.
-                value.pop(k)
-        return super(Message, self).coerce(value)
+        return self._coerce(value)
+
+    def compile(self):
+        schema = self.schema
+        coerce_dict = super(Message, self).compile()
+
+        def coerce(value):
+            for k in list(value.keys()):
+                if k not in schema:
+                    # We don't know about this field, just discard it. This
+                    # is useful when a client that introduced some new field
+                    # in a message talks to an older server, that don't
+                    # understand the new field yet.
+                    value.pop(k)
+            return coerce_dict(value)
+
+        return coerce
@@ -1,6 +1,6 @@
 import unittest
 
-from landscape.lib.schema import Int
+from landscape.lib.schema import InvalidError, Int, KeyDict, List
 from landscape.message_schemas.message import Message
 
 
@@ -51,3 +51,16 @@ class MessageTest(unittest.TestCase):
         schema = Message("foo", {})
         self.assertEqual({"type": "foo"},
                          schema.coerce({"type": "foo", "crap": 123}))
+
+    def test_invalid(self):
+        """
+        Invalid messages raise the same errors as the uncompiled schema
+        does.
+        """
+        schema = Message("foo", {"data": List(Int())})
+        message = {"type": "foo", "data": [1, u"2"]}
+        with self.assertRaises(InvalidError) as context:
+            schema.coerce(message)
+        with self.assertRaises(InvalidError) as expected:
+            KeyDict.coerce(schema, message)
+        self.assertEqual(str(expected.exception), str(context.exception))